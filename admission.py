@@ -0,0 +1,143 @@
+"""
+Admission control for model-backed requests.
+
+When Gemini slows down, model calls pile up in blocked workers until the
+load balancer gives up on them. AdmissionController tracks three upstream
+pressure signals:
+
+    in flight    model calls waiting for a scheduler slot or running
+    queue wait   recent time calls waited for a slot, as a moving average
+    latency      90th percentile of the time calls completed in the last
+                 LATENCY_WINDOW seconds spent in flight, once at least
+                 LATENCY_MIN_SAMPLES of them have completed
+
+A single long generation therefore cannot trigger shedding on its own.
+The queue wait average decays back to zero and old latency samples age
+out when no calls come in. When any signal passes its threshold,
+main_app sheds low-priority work (CodeGent and bedtime story
+generation). Depending on ADMISSION_SHED_MODE such requests get a fast
+503 with Retry-After, or skip the model and are answered by the local
+fallback responder. Emotional-support turns, crisis messages and
+/api/health are always admitted. Shedding does not make the node report
+itself unready; it is how a busy node keeps serving.
+
+With a model-call semaphore as large as the worker's thread pool, every
+request thread can block inside a slow call while the slot queue stays
+empty, so queue wait alone never fires. The in-flight limit therefore
+defaults to three quarters of whichever runs out first, the worker's
+request threads or its model-call slots, and latency catches the rest.
+
+Environment:
+    ADMISSION_MAX_IN_FLIGHT    in-flight model calls before shedding (default: 3/4 of the smaller of
+                               GUNICORN_THREADS and MODEL_MAX_CONCURRENCY, 0 disables the check)
+    ADMISSION_MAX_QUEUE_WAIT   average slot wait in seconds before shedding (default 2, 0 disables the check)
+    ADMISSION_MAX_LATENCY      90th percentile call time in flight, in seconds, before shedding
+                               (default 15, 0 disables the check)
+    ADMISSION_SHED_MODE        'fallback' (default) to answer locally, or 'reject' for 503 responses
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SHED_MODES = ('fallback', 'reject')
+
+# Completed calls the latency percentile is taken over
+LATENCY_WINDOW = 60.0
+LATENCY_MIN_SAMPLES = 8
+LATENCY_MAX_SAMPLES = 256
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=6, max_queue_wait=2.0, max_latency=15.0, smoothing=0.2, decay_seconds=5.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.max_latency = max_latency
+        self.smoothing = smoothing
+        self.decay_seconds = decay_seconds
+        self.in_flight = 0
+        self._queue_wait = 0.0
+        self._queue_wait_updated = time.monotonic()
+        # (finished at, seconds in flight) of recently completed calls
+        self._latencies = deque(maxlen=LATENCY_MAX_SAMPLES)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_in_flight > 0 or self.max_queue_wait > 0 or self.max_latency > 0
+
+    @contextmanager
+    def tracking(self):
+        """Count a model call as in flight for the duration of the block and record how long it took"""
+        start = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                self.in_flight -= 1
+                self._latencies.append((now, now - start))
+
+    def _decayed(self, value, updated, now):
+        return value * math.exp(-(now - updated) / self.decay_seconds)
+
+    def _smoothed(self, value, updated, now, sample):
+        return self._decayed(value, updated, now) * (1 - self.smoothing) + sample * self.smoothing
+
+    def record_queue_wait(self, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._queue_wait = self._smoothed(self._queue_wait, self._queue_wait_updated, now, seconds)
+            self._queue_wait_updated = now
+
+    def queue_wait(self):
+        with self._lock:
+            return self._decayed(self._queue_wait, self._queue_wait_updated, time.monotonic())
+
+    def latency(self):
+        """90th percentile time in flight of recently completed calls, 0 until there are enough of them"""
+        cutoff = time.monotonic() - LATENCY_WINDOW
+        with self._lock:
+            while self._latencies and self._latencies[0][0] < cutoff:
+                self._latencies.popleft()
+            samples = sorted(seconds for _, seconds in self._latencies)
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return 0.0
+        return samples[min(len(samples) - 1, math.ceil(0.9 * len(samples)) - 1)]
+
+    def overloaded(self):
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            return True
+        if self.max_queue_wait > 0 and self.queue_wait() >= self.max_queue_wait:
+            return True
+        return self.max_latency > 0 and self.latency() >= self.max_latency
+
+    def retry_after(self):
+        """Whole seconds a shed client should wait, from the current queue wait and latency"""
+        return max(1, math.ceil(max(self.queue_wait(), self.latency())))
+
+
+def default_max_in_flight(request_threads, model_slots):
+    """Three quarters of whichever runs out first, request threads or model-call slots (0 when neither is bounded)"""
+    limits = [limit for limit in (request_threads, model_slots) if limit]
+    return max(1, math.ceil(0.75 * min(limits))) if limits else 0
+
+
+def create_controller_from_env(request_threads=None, model_slots=None):
+    """Build the admission controller from the ADMISSION_* environment variables
+
+    request_threads and model_slots size the default in-flight limit for this worker.
+    """
+    default_in_flight = default_max_in_flight(request_threads, model_slots)
+    return AdmissionController(max_in_flight=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', str(default_in_flight))),
+                               max_queue_wait=float(os.environ.get('ADMISSION_MAX_QUEUE_WAIT', '2')),
+                               max_latency=float(os.environ.get('ADMISSION_MAX_LATENCY', '15')))
+
+
+def shed_mode_from_env():
+    mode = os.environ.get('ADMISSION_SHED_MODE', 'fallback')
+    return mode if mode in SHED_MODES else 'fallback'
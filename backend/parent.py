@@ -239,7 +239,7 @@ class ParentAssistant:
                 'task_type': self.detect_task_type(user_message)
             })
             
-            logger.info(f"ParentBot response generated: {ai_message[:100]}...")
+            logger.info("ParentBot response generated: %.100s...", ai_message)
             return ai_message
             
         except Exception as e:
@@ -165,7 +165,7 @@ class VoiceAssistant:
                 'timestamp': datetime.now().isoformat()
             })
             
-            logger.info(f"AI response: {ai_message}")
+            logger.info("AI response: %.100s...", ai_message)
             return ai_message
             
         except Exception as e:
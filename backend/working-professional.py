@@ -196,7 +196,7 @@ class LunaProfessionalAssistant:
                 'timestamp': datetime.now().isoformat()
             })
             
-            logger.info(f"Luna response generated: {ai_message[:100]}...")
+            logger.info("Luna response generated: %.100s...", ai_message)
             return ai_message
             
         except Exception as e:
@@ -0,0 +1,162 @@
+"""
+Representative multi-turn sessions for each persona, shared by the
+benchmark scripts.
+"""
+
+STUDENT_SESSIONS = [
+    [
+        "I'm so stressed about my exams next week",
+        "I feel like I can't focus on anything and my family expects too much",
+        "I've been feeling lonely since my friend moved away",
+        "Maybe I should make a study plan?",
+        "Thanks, that actually helps, I feel a bit better"
+    ],
+    [
+        "Everything feels overwhelming right now",
+        "I have money problems and I'm worried about finding a job after college",
+        "My anxiety gets worse at night",
+        "Okay, I'll try the breathing exercise"
+    ]
+]
+
+PARENT_SESSIONS = [
+    [
+        "What healthy breakfast should I make for my kids?",
+        "Give me a vegetarian dinner recipe with paneer",
+        "Create a todo list for my day tomorrow",
+        "Tell me a bedtime story about a brave little elephant",
+        "How do I save money for my child's education?"
+    ],
+    [
+        "My kid keeps throwing tantrums, how do I handle this behavior?",
+        "Plan my schedule for the weekend with the kids",
+        "Tell me a story about the moon for my 5 year old",
+        "Suggest a quick lunch with chicken"
+    ]
+]
+
+PROFESSIONAL_SESSIONS = [
+    [
+        "I'm completely burned out from the deadlines at work",
+        "My manager keeps adding to my workload and I have too many meetings",
+        "I have a big presentation to the client on Friday and I'm anxious",
+        "I feel a bit more motivated after talking to you"
+    ],
+    [
+        "There are layoff rumours and I'm worried about my performance review",
+        "Remote work makes it hard to switch off in the evening",
+        "My team dynamics are difficult lately",
+        "Thanks, that seems manageable"
+    ]
+]
+
+CODEGENT_SESSIONS = [
+    ('python', [
+        "Write a function to reverse a linked list",
+        "Now add unit tests for it",
+        "How can I make it iterative instead of recursive?"
+    ]),
+    ('java', [
+        "Show me how to use an ArrayList with generics",
+        "Explain exception handling with a custom exception class"
+    ]),
+    ('go', [
+        "Create a simple HTTP server",
+        "Add a JSON endpoint that returns a list of users"
+    ]),
+    ('cpp', [
+        "Implement a binary search on a vector",
+        "Use templates so it works for any comparable type"
+    ])
+]
+
+# Single messages covering every keyword branch of the context updaters and task detection
+MESSAGE_CORPUS = [
+    "hi",
+    "I'm stressed about my exam and my family keeps asking about my job prospects",
+    "I feel lonely and overwhelmed, my relationship ended and my health is bad",
+    "Tell me a bedtime story about a tiger who learns to share",
+    "Create a todo list for tomorrow and schedule time to study algorithms",
+    "What should I cook for dinner tonight, I have paneer and spinach",
+    "My child has discipline problems at school, how should I handle his behavior?",
+    "How do I budget and save money for an investment plan?",
+    "I'm burned out, my manager piles on the workload and the deadline is tomorrow",
+    "Remote work is fine but my commute days and client presentations make me anxious",
+    "I feel better and more motivated after the meeting with my team",
+    ("I have been thinking about everything that happened this semester and honestly I don't know "
+     "where to start because there is so much going on with exams, friends, money and my family ") * 4
+]
+
+_STORY_PARAGRAPH = (
+    "Once upon a time, in a small village near the banks of the Ganga, there lived a little elephant "
+    "named Gajju who was afraid of the dark. Every night, when the stars came out over the mango trees, "
+    "Gajju would curl up next to his mother and ask her why the moon looked so lonely. His mother would "
+    "smile and tell him that the moon was never alone, because every star was a friend keeping it company. "
+)
+
+# A long STORYTELLER MODE answer (~12 KB)
+LONG_BEDTIME_STORY = '\n\n'.join(_STORY_PARAGRAPH for _ in range(30)) + '\n\nThe moral of the story: courage grows when we share our fears.'
+
+_CODE_BLOCK = '''```python
+class LinkedList:
+    """Singly linked list with iterative reversal"""
+
+    def __init__(self):
+        self.head = None
+
+    def push(self, value):
+        self.head = Node(value, self.head)
+
+    def reverse(self):
+        previous, current = None, self.head
+        while current:
+            current.next, previous, current = previous, current, current.next
+        self.head = previous
+```'''
+
+# A large CodeGent answer with prose between several fenced blocks (~20 KB)
+LARGE_CODEGENT_RESPONSE = '\n\n'.join(
+    f"Step {step}: Here is how the reversal works. We walk the list once and flip each pointer.\n\n{_CODE_BLOCK}"
+    for step in range(1, 41)
+)
+
+# A CodeGent answer without fences, exercising the keyword-scan fallback in extract_code_from_response
+UNFENCED_CODEGENT_RESPONSE = (
+    "Sure, here is the program you asked for\n"
+    + '\n'.join(f"def helper_{i}(items):\n    total = 0\n    for item in items:\n        total += item\n    return total\n"
+                for i in range(200))
+    + "\nThis walks the list once. Let me know if you need anything else!"
+)
+
+# Question pairs that should share a semantic cache entry, and pairs that should not.
+# SEMANTIC_CACHE_THRESHOLD defaults to a value between the two score ranges.
+CACHE_PARAPHRASES = [
+    ("healthy breakfast for kids", "what breakfast should I make for my kids"),
+    ("healthy breakfast ideas for my kids", "what is a healthy breakfast for kids"),
+    ("quick vegetarian dinner recipe", "give me a quick vegetarian recipe for dinner"),
+    ("how do I save money for my child's education", "how can I save money for my kid's education"),
+    ("how to handle toddler tantrums", "how do I handle my toddler's tantrums"),
+    ("write a function to reverse a linked list", "function to reverse a linked list"),
+    ("reverse a linked list in python", "how do I reverse a linked list"),
+    ("simple http server", "create a simple HTTP server"),
+    ("explain exception handling with a custom exception class",
+     "how does exception handling work with custom exceptions"),
+    ("binary search on a vector", "implement binary search on a vector"),
+    ("lunch ideas with chicken", "suggest a quick lunch with chicken"),
+    ("tips for picky eaters", "what are some tips for picky eaters"),
+]
+
+CACHE_DISTINCT = [
+    ("healthy breakfast for kids", "healthy dinner for kids"),
+    ("quick vegetarian dinner recipe", "quick chicken dinner recipe"),
+    ("how do I save money for my child's education", "how do I invest money for retirement"),
+    ("how to handle toddler tantrums", "how to handle teenager screen time"),
+    ("write a function to reverse a linked list", "write a function to sort a linked list"),
+    ("reverse a linked list in python", "reverse a string in python"),
+    ("simple http server", "simple tcp client"),
+    ("binary search on a vector", "binary search tree insertion"),
+    ("lunch ideas with chicken", "lunch ideas with paneer"),
+    ("breakfast ideas for kids", "bedtime routine ideas for kids"),
+    ("what breakfast should I make for my kids", "what lunch should I pack for my kids"),
+    ("explain exception handling", "explain garbage collection"),
+]
@@ -0,0 +1,264 @@
+"""
+Load generator for the FreeSpace API.
+
+Replays multi-turn sessions for all four personas (Maya, ParentBot, Luna
+and CodeGent) and reports throughput, p50/p95/p99 latency per route and
+memory per session.
+
+Run against a live server (start it with GEMINI_BACKEND=stub to avoid
+spending Gemini quota):
+
+    GEMINI_BACKEND=stub python main_app.py
+    python benchmarks/load_test.py --base-url http://localhost:5000 --sessions 20 --concurrency 8
+
+or fully in-process through Flask's test client, which also measures the
+retained size of each session's assistant state:
+
+    python benchmarks/load_test.py --in-process --sessions 20 --concurrency 4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import CODEGENT_SESSIONS, PARENT_SESSIONS, PROFESSIONAL_SESSIONS, STUDENT_SESSIONS
+
+PERSONAS = ('student', 'parent', 'professional', 'codegent')
+
+START_ROUTES = {
+    'student': '/api/student/start-conversation',
+    'parent': '/api/parent/start-conversation',
+    'professional': '/api/professional/workplace-support',
+    'codegent': '/api/codegent/start'
+}
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.local = threading.local()
+        self.requests = requests
+
+    def post(self, path, payload, headers=None):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.requests.Session()
+            self.local.session = session
+        response = session.post(self.base_url + path, json=payload, headers=headers, timeout=120)
+        return response.status_code, response.json()
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def post(self, path, payload, headers=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.app.test_client()
+            self.local.client = client
+        response = client.post(path, json=payload, headers=headers)
+        return response.status_code, response.get_json()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.session_sizes = {}
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def record_session_size(self, persona, size):
+        with self.lock:
+            self.session_sizes.setdefault(persona, []).append(size)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate retained size of an object graph in bytes"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    if hasattr(type(obj), '__slots__'):
+        for slot in type(obj).__slots__:
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+def timed_post(client, recorder, route, payload, session_id):
+    start = time.perf_counter()
+    try:
+        # A session ID per simulated user keeps them in separate rate-limit buckets
+        status, body = client.post(route, payload, {'X-Session-Id': session_id})
+        ok = status == 200 and bool(body.get('success'))
+    except Exception:
+        body, ok = {}, False
+    recorder.record(route, time.perf_counter() - start, ok)
+    return body
+
+
+def run_session(client, recorder, persona, index, think_time, app_module):
+    """Replay one scripted multi-turn session"""
+    name = f"bench-{persona}-{index}"
+    if persona == 'codegent':
+        language, messages = CODEGENT_SESSIONS[index % len(CODEGENT_SESSIONS)]
+        timed_post(client, recorder, START_ROUTES[persona], {'language': language, 'name': name}, name)
+        history = []
+        for message in messages:
+            body = timed_post(client, recorder, '/api/codegent/respond', {
+                'message': message,
+                'language': language,
+                'conversation_history': history
+            }, name)
+            history.append({'user': message, 'assistant': body.get('response', '')})
+            time.sleep(think_time)
+    else:
+        scripts = {'student': STUDENT_SESSIONS, 'parent': PARENT_SESSIONS, 'professional': PROFESSIONAL_SESSIONS}
+        messages = scripts[persona][index % len(scripts[persona])]
+        timed_post(client, recorder, START_ROUTES[persona], {'name': name, 'happiness': 40, 'stress_level': 'high'}, name)
+        for message in messages:
+            timed_post(client, recorder, f'/api/{persona}/respond', {'message': message, 'enable_voice': False}, name)
+            time.sleep(think_time)
+
+    if app_module is not None:
+        assistant = app_module.get_service_assistant(persona)
+        if assistant is not None:
+            recorder.record_session_size(persona, deep_sizeof(assistant))
+
+
+def read_rss_kb(pid):
+    """Resident set size of a local process in KiB (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def build_report(recorder, elapsed, total_sessions, rss_before, rss_after):
+    routes = {}
+    total_requests = 0
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        total_requests += len(values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(route, 0),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2)
+        }
+
+    report = {
+        'elapsed_s': round(elapsed, 3),
+        'sessions': total_sessions,
+        'requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 2) if elapsed else 0.0,
+        'sessions_per_s': round(total_sessions / elapsed, 2) if elapsed else 0.0,
+        'routes': routes
+    }
+    if recorder.session_sizes:
+        report['memory_per_session_bytes'] = {
+            persona: int(sum(sizes) / len(sizes)) for persona, sizes in recorder.session_sizes.items()
+        }
+    if rss_before is not None and rss_after is not None:
+        report['server_rss_delta_kb'] = rss_after - rss_before
+        report['server_rss_per_session_kb'] = round((rss_after - rss_before) / max(total_sessions, 1), 2)
+    return report
+
+
+def print_report(report):
+    print(f"\nSessions: {report['sessions']}  Requests: {report['requests']}  Elapsed: {report['elapsed_s']}s")
+    print(f"Throughput: {report['throughput_rps']} req/s, {report['sessions_per_s']} sessions/s\n")
+    print(f"{'route':45} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in report['routes'].items():
+        print(f"{route:45} {stats['requests']:>6} {stats['errors']:>5} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    if 'memory_per_session_bytes' in report:
+        print("\nMemory per session (retained assistant state):")
+        for persona, size in report['memory_per_session_bytes'].items():
+            print(f"  {persona:14} {size / 1024:.1f} KiB")
+    if 'server_rss_per_session_kb' in report:
+        print(f"\nServer RSS growth: {report['server_rss_delta_kb']} KiB "
+              f"({report['server_rss_per_session_kb']} KiB/session)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FreeSpace load generator')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--in-process', action='store_true', help='drive main_app through the Flask test client')
+    parser.add_argument('--sessions', type=int, default=10, help='sessions per persona')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--personas', default=','.join(PERSONAS))
+    parser.add_argument('--think-time', type=float, default=0.0, help='seconds between turns')
+    parser.add_argument('--server-pid', type=int, help='local server PID for RSS measurement')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    app_module = None
+    if args.in_process:
+        os.environ.setdefault('GEMINI_BACKEND', 'stub')
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        import main_app
+        app_module = main_app
+        client = InProcessClient(main_app.app)
+    else:
+        client = HttpClient(args.base_url)
+
+    personas = [persona.strip() for persona in args.personas.split(',') if persona.strip()]
+    jobs = [(persona, index) for index in range(args.sessions) for persona in personas]
+    recorder = Recorder()
+
+    rss_before = read_rss_kb(args.server_pid) if args.server_pid else None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_session, client, recorder, persona, index, args.think_time, app_module)
+                   for persona, index in jobs]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    rss_after = read_rss_kb(args.server_pid) if args.server_pid else None
+
+    report = build_report(recorder, elapsed, len(jobs), rss_before, rss_after)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""
+Microbenchmarks for the CPU-side work done on every turn.
+
+Covers the context updaters, task detection, the four prompt builders,
+CodeGent code extraction, local fallback retrieval and JSON serialization
+of respond payloads over the corpora in benchmarks/corpus.py. Results are written as JSON in a
+pytest-benchmark-like layout so runs can be compared against a baseline:
+
+    python benchmarks/microbench.py --json baseline.json
+    ... make changes ...
+    python benchmarks/microbench.py --json current.json --compare baseline.json
+
+--compare prints the change in median time per benchmark and exits with
+status 1 when any benchmark is slower than --fail-threshold percent.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import main_app
+from benchmarks.corpus import (LARGE_CODEGENT_RESPONSE, LONG_BEDTIME_STORY, MESSAGE_CORPUS,
+                               UNFENCED_CODEGENT_RESPONSE)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark; the decorated function does setup and returns the callable to time"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def long_history(assistant_reply, turns=20):
+    return [main_app.records.Turn(message, assistant_reply) for message in (MESSAGE_CORPUS * turns)[:turns]]
+
+
+@benchmark('student.update_context')
+def bench_student_update_context():
+    assistant = main_app.VoiceAssistant()
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.update_context(message)
+    return run
+
+
+@benchmark('parent.detect_task_type')
+def bench_parent_detect_task_type():
+    assistant = main_app.ParentAssistant()
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.detect_task_type(message)
+    return run
+
+
+@benchmark('professional.update_context')
+def bench_professional_update_context():
+    assistant = main_app.LunaProfessionalAssistant()
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.update_professional_context(message)
+    return run
+
+
+@benchmark('student.build_prompt')
+def bench_student_prompt():
+    assistant = main_app.VoiceAssistant()
+    assistant.conversation_history = long_history("That sounds really hard. " * 20)
+    for message in MESSAGE_CORPUS:
+        assistant.update_context(message)
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.get_motivational_prompt(message, assistant.student_context)
+    return run
+
+
+@benchmark('parent.build_prompt')
+def bench_parent_prompt():
+    assistant = main_app.ParentAssistant()
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.get_specialized_prompt(message, assistant.parent_context)
+    return run
+
+
+@benchmark('professional.build_prompt')
+def bench_professional_prompt():
+    assistant = main_app.LunaProfessionalAssistant()
+    assistant.conversation_history = long_history("Let's break that down together. " * 20)
+    for message in MESSAGE_CORPUS:
+        assistant.update_professional_context(message)
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.get_professional_prompt(message, assistant.professional_context)
+    return run
+
+
+@benchmark('codegent.build_prompt')
+def bench_codegent_prompt():
+    assistant = main_app.CodeGentAssistant()
+    history = long_history(LARGE_CODEGENT_RESPONSE, turns=6)
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            assistant.get_codegent_prompt(message, 'python', history)
+    return run
+
+
+@benchmark('codegent.extract_code.fenced_large')
+def bench_extract_fenced():
+    assistant = main_app.CodeGentAssistant()
+    return lambda: assistant.extract_code_from_response(LARGE_CODEGENT_RESPONSE)
+
+
+@benchmark('codegent.extract_code.unfenced')
+def bench_extract_unfenced():
+    assistant = main_app.CodeGentAssistant()
+    return lambda: assistant.extract_code_from_response(UNFENCED_CODEGENT_RESPONSE)
+
+
+@benchmark('codegent.extract_code.no_code_story')
+def bench_extract_story():
+    assistant = main_app.CodeGentAssistant()
+    return lambda: assistant.extract_code_from_response(LONG_BEDTIME_STORY)
+
+
+@benchmark('fallback.respond')
+def bench_fallback_respond():
+    responder = main_app.fallback_responder.responder
+
+    def run():
+        for message in MESSAGE_CORPUS:
+            responder.respond('parent', message, 'general')
+            responder.respond('student', message)
+    return run
+
+
+@benchmark('jsonify.parent_respond_story')
+def bench_jsonify_parent():
+    assistant = main_app.ParentAssistant()
+    assistant.conversation_history = long_history(LONG_BEDTIME_STORY)
+    payload = {
+        'success': True,
+        'response': LONG_BEDTIME_STORY,
+        'voice_response': 'use_browser_tts',
+        'has_voice': True,
+        'use_browser_tts': True,
+        'task_type': 'bedtime_stories',
+        'conversation_count': len(assistant.conversation_history),
+        'parent_context': assistant.parent_context
+    }
+
+    def run():
+        with main_app.app.app_context():
+            main_app.jsonify(payload).get_data()
+    return run
+
+
+@benchmark('jsonify.history_page')
+def bench_jsonify_history():
+    history = long_history(LARGE_CODEGENT_RESPONSE, turns=50)
+    payload = {'success': True, 'history': history, 'total_messages': len(history)}
+
+    def run():
+        with main_app.app.app_context():
+            main_app.jsonify(payload).get_data()
+    return run
+
+
+def run_benchmark(func, rounds, min_time):
+    """Time func like pytest-benchmark: calibrate iterations per round, then collect per-call stats"""
+    func()
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        duration = time.perf_counter() - start
+        if duration >= min_time or iterations >= 1_000_000:
+            break
+        iterations *= 2 if duration == 0 else max(2, int(min_time / duration) + 1)
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - start) / iterations)
+
+    return {
+        'min': min(samples),
+        'max': max(samples),
+        'mean': statistics.mean(samples),
+        'median': statistics.median(samples),
+        'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'rounds': rounds,
+        'iterations': iterations,
+        'ops': 1.0 / statistics.mean(samples)
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Print median deltas against a baseline file; return True when a regression exceeds the threshold"""
+    with open(baseline_path) as baseline_file:
+        baseline = {entry['name']: entry['stats'] for entry in json.load(baseline_file)['benchmarks']}
+
+    regressed = False
+    print(f"\nComparison against {baseline_path} (median, threshold {threshold}%)")
+    for entry in results['benchmarks']:
+        previous = baseline.get(entry['name'])
+        if previous is None:
+            print(f"  {entry['name']:40} (new)")
+            continue
+        change = (entry['stats']['median'] / previous['median'] - 1.0) * 100
+        marker = ''
+        if change > threshold:
+            marker = '  REGRESSION'
+            regressed = True
+        print(f"  {entry['name']:40} {previous['median'] * 1e6:>10.2f} -> {entry['stats']['median'] * 1e6:>10.2f} us"
+              f"  {change:+7.1f}%{marker}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FreeSpace CPU hot-path microbenchmarks')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per round')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='baseline results file to compare against')
+    parser.add_argument('--fail-threshold', type=float, default=10.0, help='regression threshold in percent')
+    args = parser.parse_args()
+
+    results = {
+        'machine_info': {
+            'python_version': platform.python_version(),
+            'python_implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processor': platform.processor()
+        },
+        'datetime': datetime.now().isoformat(),
+        'benchmarks': []
+    }
+
+    print(f"{'benchmark':40} {'median us':>12} {'mean us':>12} {'stddev us':>12} {'ops/s':>12}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        stats = run_benchmark(setup(), args.rounds, args.min_time)
+        results['benchmarks'].append({'name': name, 'stats': stats})
+        print(f"{name:40} {stats['median'] * 1e6:>12.2f} {stats['mean'] * 1e6:>12.2f} "
+              f"{stats['stddev'] * 1e6:>12.2f} {stats['ops']:>12.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.compare and compare(results, args.compare, args.fail_threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
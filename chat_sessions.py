@@ -0,0 +1,170 @@
+"""
+Server-held model chat sessions for Maya, Luna and CodeGent.
+
+Without chat sessions, every turn rebuilds the recent conversation into
+prose and sends a fresh single-shot prompt. With them, each assistant
+starts a model chat (GenerativeModel.start_chat) whose first message is
+the usual full persona prompt. Follow-up turns send only the user's new
+message, plus a one-line note of the context fields that changed since
+the model last saw them. Prompt assembly then stays constant instead of
+growing with the history window.
+
+A session is only continued while it matches the conversation it was
+built from. If turns were added without it (crisis fast path, cache
+hit) or the last call failed, the next turn starts a new session seeded
+with the full prompt. Chat history is trimmed to the seed exchange plus
+the last max_turns exchanges.
+
+Maya and Luna hold one server-side conversation each, so their assistant
+keeps a single session. CodeGent clients send their own
+conversation_history and many conversations run at once, so CodeGent
+keeps a ChatSessionPool keyed by a fingerprint of the conversation's
+last exchange. normalize_history() first turns both client shapes, the
+web UI's one-entry-per-message {message, sender} items and the API's
+{user, assistant} pairs, into exchanges. Keying on the last exchange
+keeps working while the UI sends only a sliding window of its history.
+A session is taken out of the pool for the turn and put back under the
+fingerprint of the new exchange. Two requests can then never continue
+the same chat, and a client whose last exchange matches no session gets
+a fresh one.
+
+Environment:
+    CHAT_SESSIONS            '0' disables chat sessions (default '1')
+    CHAT_SESSION_MAX_TURNS   exchanges kept in a session besides the seed (default 10)
+    CHAT_SESSION_POOL_SIZE   CodeGent conversations kept with a live session (default 64)
+"""
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Context fields that never need re-sending once the session is seeded
+STATIC_CONTEXT_FIELDS = frozenset(['session_start'])
+
+
+def format_context_value(value):
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value) or 'none'
+    return str(value)
+
+
+class ChatSession:
+    def __init__(self, chat, key, max_turns):
+        self.chat = chat
+        self.key = key
+        self.max_turns = max_turns
+        self.history_length = None
+        self.sent_context = {}
+
+    def in_sync(self, key, history_length):
+        """True when this session was built from exactly this conversation"""
+        return self.key == key and self.history_length == history_length
+
+    def mark_context_sent(self, context):
+        # Deep copy - context lists are updated in place between turns
+        self.sent_context = copy.deepcopy(context or {})
+
+    def follow_up_prompt(self, user_message, context):
+        """Only the new message, prefixed with the context fields that changed since the last turn"""
+        changes = []
+        for field, value in (context or {}).items():
+            if field in STATIC_CONTEXT_FIELDS or self.sent_context.get(field) == value:
+                continue
+            changes.append(f"{field.replace('_', ' ')}: {format_context_value(value)}")
+        self.mark_context_sent(context)
+        if not changes:
+            return user_message
+        return f"(Context update - {'; '.join(changes)})\n\n{user_message}"
+
+    def turn_completed(self, history_length):
+        """Record the conversation length this session now covers and trim old exchanges"""
+        self.history_length = history_length
+        history = self.chat.history
+        # Each exchange is a user and a model entry; keep the seed exchange first
+        if len(history) > 2 * (self.max_turns + 1):
+            self.chat.history = history[:2] + history[-2 * self.max_turns:]
+
+
+def normalize_history(history, pending_message=None):
+    """Client conversation history as [{'user': ..., 'assistant': ...}] exchanges
+
+    Accepts {user, assistant} pairs and the web UI's per-message
+    {message, sender} items. Assistant-only messages (greetings, error
+    notes) are dropped, and so is a trailing pending_message that the UI
+    already added to its history before sending it.
+    """
+    exchanges = []
+    for item in history or ():
+        if not isinstance(item, dict):
+            continue
+        if 'sender' not in item:
+            exchanges.append({'user': str(item.get('user') or ''), 'assistant': str(item.get('assistant') or '')})
+        elif 'user' in str(item['sender']):
+            exchanges.append({'user': str(item.get('message') or ''), 'assistant': ''})
+        elif exchanges and not exchanges[-1]['assistant']:
+            exchanges[-1]['assistant'] = str(item.get('message') or '')
+    if exchanges and pending_message is not None and exchanges[-1] == {'user': pending_message, 'assistant': ''}:
+        exchanges.pop()
+    return [exchange for exchange in exchanges if exchange['user']]
+
+
+def conversation_fingerprint(key, user, assistant):
+    """Digest of a conversation's last exchange under key"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16)
+    for text in (user, assistant):
+        encoded = text.encode('utf-8')
+        digest.update(len(encoded).to_bytes(4, 'little'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class ChatSessionPool:
+    """Least recently used chat sessions for client-held conversations, keyed by conversation_fingerprint"""
+
+    def __init__(self, max_sessions=64):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, fingerprint):
+        """Remove and return the session for this conversation, or None"""
+        with self._lock:
+            return self._sessions.pop(fingerprint, None)
+
+    def put(self, fingerprint, session):
+        with self._lock:
+            self._sessions[fingerprint] = session
+            self._sessions.move_to_end(fingerprint)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class ChatSessionFactory:
+    def __init__(self, enabled=True, max_turns=10, pool_size=64):
+        self.enabled = enabled
+        self.max_turns = max_turns
+        self.pool_size = pool_size
+
+    def supports(self, model):
+        return self.enabled and model is not None and hasattr(model, 'start_chat')
+
+    def start(self, model, key):
+        return ChatSession(model.start_chat(history=[]), key, self.max_turns)
+
+    def new_pool(self):
+        return ChatSessionPool(self.pool_size)
+
+
+def create_factory_from_env():
+    """Build the chat session factory from the CHAT_SESSION* environment variables"""
+    return ChatSessionFactory(enabled=os.environ.get('CHAT_SESSIONS', '1') != '0',
+                              max_turns=int(os.environ.get('CHAT_SESSION_MAX_TURNS', '10')),
+                              pool_size=int(os.environ.get('CHAT_SESSION_POOL_SIZE', '64')))
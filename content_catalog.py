@@ -0,0 +1,270 @@
+"""
+Pregenerated ParentBot content catalog.
+
+Bedtime stories and meal plans are ParentBot's longest generations, and
+requests pile up at dinner and bedtime. An offline batch job pregenerates
+several variants for each slot, stories by age range and theme and meal
+plans by diet and meal. They go into an on-disk catalog:
+
+    catalog/index.json   slot key -> list of [offset, length] into catalog.dat
+    catalog/catalog.dat  UTF-8 texts, concatenated
+
+Only the index is loaded at startup. Texts are read from disk on demand.
+A generic request such as "tell me a bedtime story for my 6 year old" or
+"healthy veg dinner ideas" is served from the catalog instantly. A
+request with anything specific in it, like a character name, an
+ingredient or a place, still goes to Gemini.
+
+Build or refresh the catalog (GEMINI_BACKEND=stub for a dry run):
+
+    python content_catalog.py build --variants 3 --output catalog
+
+Environment:
+    CONTENT_CATALOG_DIR    catalog directory (default 'catalog'; missing disables the catalog)
+    CONTENT_CATALOG_HOURS  IST hours to serve from the catalog, e.g. '18-23' (default: all day)
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+AGE_RANGES = ('2-4', '5-7', '8-10')
+DEFAULT_AGE_RANGE = '5-7'
+
+STORY_THEMES = {
+    'animals': ('animal', 'animals', 'jungle', 'forest'),
+    'space': ('space', 'moon', 'star', 'stars', 'planet', 'planets', 'sky'),
+    'friendship': ('friend', 'friends', 'friendship', 'sharing', 'share'),
+    'courage': ('brave', 'bravery', 'courage', 'fear', 'afraid', 'dark', 'scared'),
+    'kindness': ('kind', 'kindness', 'helping', 'help', 'caring'),
+    'nature': ('nature', 'tree', 'trees', 'river', 'rain', 'garden', 'flowers')
+}
+
+DIETS = {
+    'vegetarian': ('veg', 'vegetarian', 'veggie'),
+    'non-vegetarian': ('non-veg', 'nonveg', 'non-vegetarian')
+}
+
+MEALS = {
+    'breakfast': ('breakfast', 'morning'),
+    'lunch': ('lunch', 'lunchbox', 'tiffin'),
+    'snacks': ('snack', 'snacks', 'evening'),
+    'dinner': ('dinner', 'supper', 'night'),
+    'weekly': ('week', 'weekly')
+}
+
+# Words that do not make a request specific enough to need a fresh generation
+GENERIC_WORDS = frozenset(
+    "a an the i me my we our you your to for of in on at and or is are be can could should would what which how "
+    "do does please some give tell show make with about it this that one new another any good nice short long "
+    "little lovely today tonight tomorrow now want need like bedtime story stories tale tales moral sleep kid "
+    "kids child children son daughter baby toddler family old year years yr yrs aged age meal meals plan "
+    "planner idea ideas suggest suggestions recipe recipes cook cooking food healthy quick easy simple indian "
+    "prepare ready menu dish dishes".split()
+)
+
+_WORD_PATTERN = re.compile(r"[a-z]+(?:-[a-z]+)*")
+_AGE_PATTERN = re.compile(r"\b(\d{1,2})\s*(?:-|to)?\s*(?:year|yr)s?\b")
+
+
+def age_range_for(age):
+    if age <= 4:
+        return '2-4'
+    if age <= 7:
+        return '5-7'
+    return '8-10'
+
+
+def _match_vocabulary(words, vocabulary):
+    """Return (matched key or None, words consumed)"""
+    for key, keywords in vocabulary.items():
+        matched = words.intersection(keywords)
+        if matched:
+            return key, matched
+    return None, set()
+
+
+def classify_request(task_type, message, context=None, now=None):
+    """Return the catalog slot key for a generic story or meal request, or None"""
+    if task_type not in ('bedtime_stories', 'meal_planner'):
+        return None
+    message_lower = message.lower()
+    words = set(_WORD_PATTERN.findall(message_lower))
+
+    if task_type == 'bedtime_stories':
+        age_match = _AGE_PATTERN.search(message_lower)
+        age_range = age_range_for(int(age_match.group(1))) if age_match else DEFAULT_AGE_RANGE
+        theme, consumed = _match_vocabulary(words, STORY_THEMES)
+        key = f"story:{age_range}:{theme or 'any'}"
+    else:
+        diet, diet_words = _match_vocabulary(words, DIETS)
+        if diet is None and context and context.get('meal_preferences'):
+            diet = context['meal_preferences'][-1]
+        meal, meal_words = _match_vocabulary(words, MEALS)
+        if meal is None:
+            hour = (now or datetime.now(IST)).hour
+            meal = 'breakfast' if hour < 11 else 'lunch' if hour < 16 else 'snacks' if hour < 18 else 'dinner'
+        consumed = diet_words | meal_words
+        key = f"meal:{diet or 'vegetarian'}:{meal}"
+
+    # Anything left over (a name, an ingredient, a place) makes the request specific
+    if words - consumed - GENERIC_WORDS:
+        return None
+    return key
+
+
+def parse_hours(spec):
+    """Parse '18-23' or '7-9,18-23' into a set of IST hours; '' means every hour"""
+    if not spec.strip():
+        return None
+    hours = set()
+    for part in spec.split(','):
+        start, _, end = part.strip().partition('-')
+        start = int(start)
+        end = int(end) if end else start
+        hours.update(range(start, end + 1) if start <= end else list(range(start, 24)) + list(range(0, end + 1)))
+    return hours
+
+
+class ContentCatalog:
+    INDEX_FILE = 'index.json'
+    DATA_FILE = 'catalog.dat'
+
+    def __init__(self, directory, hours=None):
+        self.directory = directory
+        self.hours = hours
+        self.index = {}
+        self.created = None
+        self.load()
+
+    @property
+    def enabled(self):
+        return bool(self.index)
+
+    def load(self):
+        index_path = os.path.join(self.directory, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            logger.info("No content catalog at %s - pregenerated stories and meal plans disabled", self.directory)
+            return
+        try:
+            with open(index_path) as index_file:
+                data = json.load(index_file)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load content catalog index: %s", e)
+            return
+        self.index = data.get('entries', {})
+        self.created = data.get('created')
+        logger.info("Loaded content catalog with %d slots from %s", len(self.index), self.directory)
+
+    def in_serving_hours(self, now=None):
+        return self.hours is None or (now or datetime.now(IST)).hour in self.hours
+
+    def read(self, offset, length):
+        with open(os.path.join(self.directory, self.DATA_FILE), 'rb') as data_file:
+            data_file.seek(offset)
+            return data_file.read(length).decode('utf-8')
+
+    def lookup(self, task_type, message, context=None, rotation=0):
+        """Return a pregenerated response for a generic request, or None"""
+        if not self.index or not self.in_serving_hours():
+            return None
+        key = classify_request(task_type, message, context)
+        if key is None:
+            return None
+        variants = self.index.get(key)
+        if not variants and key.endswith(':any'):
+            # No theme asked for - any theme for this age range will do
+            prefix = key[:-3]
+            variants = [variant for slot, entries in self.index.items() if slot.startswith(prefix)
+                        for variant in entries]
+        if not variants:
+            return None
+        offset, length = variants[rotation % len(variants)]
+        try:
+            return self.read(offset, length)
+        except OSError as e:
+            logger.error("Content catalog read error: %s", e)
+            return None
+
+
+def catalog_requests():
+    """Yield (slot key, task type, request message) for every catalog slot"""
+    for age_range in AGE_RANGES:
+        for theme in STORY_THEMES:
+            yield (f"story:{age_range}:{theme}", 'bedtime_stories',
+                   f"Tell a bedtime story about {theme} for a {age_range} year old child")
+    for diet in DIETS:
+        for meal in MEALS:
+            request = (f"Create a {diet} meal plan for the whole week" if meal == 'weekly'
+                       else f"Suggest a healthy {diet} {meal} recipe for the family")
+            yield f"meal:{diet}:{meal}", 'meal_planner', request
+
+
+def build_catalog(generate, directory, variants=3):
+    """Generate every slot with generate(task_type, request) and write the catalog atomically"""
+    os.makedirs(directory, exist_ok=True)
+    data_path = os.path.join(directory, ContentCatalog.DATA_FILE)
+    index_path = os.path.join(directory, ContentCatalog.INDEX_FILE)
+    entries = {}
+    offset = 0
+    with open(data_path + '.tmp', 'wb') as data_file:
+        for key, task_type, request in catalog_requests():
+            for variant in range(variants):
+                try:
+                    text = generate(task_type, request)
+                except Exception as e:
+                    logger.error("Catalog generation failed for %s variant %d: %s", key, variant, e)
+                    continue
+                encoded = text.encode('utf-8')
+                data_file.write(encoded)
+                entries.setdefault(key, []).append([offset, len(encoded)])
+                offset += len(encoded)
+            logger.info("Generated %s (%d variants)", key, len(entries.get(key, [])))
+    with open(index_path + '.tmp', 'w') as index_file:
+        json.dump({'version': 1, 'created': datetime.now(IST).isoformat(), 'entries': entries}, index_file)
+    os.replace(data_path + '.tmp', data_path)
+    os.replace(index_path + '.tmp', index_path)
+    return entries
+
+
+def create_catalog_from_env():
+    """Load the catalog from CONTENT_CATALOG_DIR and CONTENT_CATALOG_HOURS"""
+    return ContentCatalog(os.environ.get('CONTENT_CATALOG_DIR', 'catalog'),
+                          hours=parse_hours(os.environ.get('CONTENT_CATALOG_HOURS', '')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ParentBot content catalog')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='pregenerate stories and meal plans')
+    build.add_argument('--output', default=os.environ.get('CONTENT_CATALOG_DIR', 'catalog'))
+    build.add_argument('--variants', type=int, default=3, help='responses per slot')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main_app
+    if not main_app.model:
+        sys.exit("Gemini is not configured - set GEMINI_API_KEY or GEMINI_BACKEND=stub")
+
+    assistant = main_app.ParentAssistant()
+
+    def generate(task_type, request):
+        prompt = assistant.get_specialized_prompt(request, assistant.parent_context)
+        return main_app.generate_model_content(prompt, 'parent', task_type)
+
+    start = time.perf_counter()
+    entries = build_catalog(generate, args.output, args.variants)
+    print(f"Wrote {sum(len(variants) for variants in entries.values())} responses in {len(entries)} slots "
+          f"to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Crisis-language detection for the emotional-support assistants.
+
+A single precompiled, word-boundary-aware regular expression catches
+self-harm and suicide language in a few microseconds, so these messages
+can be answered immediately with vetted helpline information instead of
+waiting on Gemini. The phrases are deliberately specific ("kill myself",
+not "killing me") to avoid firing on everyday expressions of stress.
+"""
+import re
+
+# Reflexives cover a parent describing their child as well as the user themselves
+_SELF = r"(?:my\s*self|him\s*self|her\s*self|them\s*sel(?:f|ves))"
+_OWNER = r"(?:my|his|her|their)"
+
+CRISIS_PHRASES = [
+    r"kill(?:ing|s)?\s+" + _SELF,
+    r"end(?:ing|s)?\s+(?:it\s+all|" + _OWNER + r"\s+(?:own\s+)?life)",
+    r"take\s+" + _OWNER + r"\s+(?:own\s+)?life",
+    r"suicid(?:e|al)",
+    r"self[\s-]?harm(?:ing)?",
+    r"hurt(?:ing|s)?\s+" + _SELF,
+    r"cut(?:ting|s)?\s+" + _SELF,
+    r"want(?:s|ed)?\s+to\s+die",
+    r"wanna\s+die",
+    r"(?:don'?t|doesn'?t)\s+want\s+to\s+(?:live|be\s+alive|wake\s+up)",
+    r"no\s+reason\s+to\s+live",
+    r"better\s+off\s+dead",
+    r"overdos(?:e|ing)"
+]
+
+CRISIS_PATTERN = re.compile(r"\b(?:" + '|'.join(CRISIS_PHRASES) + r")\b", re.IGNORECASE)
+
+HELPLINES = (
+    "• Tele-MANAS (free, 24x7, many Indian languages): call 14416 or 1-800-891-4416\n"
+    "• AASRA: +91-9820466726\n"
+    "• If you are in immediate danger, call 112 or go to the nearest hospital\n"
+    "• Outside India: findahelpline.com lists free local services"
+)
+
+RESOURCE_RESPONSES = {
+    'student': (
+        "I'm really glad you told me, and I'm taking what you said seriously. You don't have to go through "
+        "this alone - please reach out to someone who can help right now:\n\n" + HELPLINES + "\n\n"
+        "If you can, tell a friend, family member or teacher you trust how you're feeling. I'm still right here "
+        "with you - would you like to keep talking?"
+    ),
+    'parent': (
+        "Thank you for sharing this - it matters, and you don't have to handle it alone. If you or your child "
+        "might be at risk, please contact one of these services right away:\n\n" + HELPLINES + "\n\n"
+        "If a child has talked about hurting themselves, stay with them, keep medicines and sharp objects out of "
+        "reach, and reach out to a doctor or counsellor today. I'm here to keep helping you."
+    ),
+    'professional': (
+        "I'm really sorry you're carrying this, and I'm glad you said it out loud. Your safety matters more than "
+        "any deadline. Please reach out to someone who can support you right now:\n\n" + HELPLINES + "\n\n"
+        "If your workplace has an Employee Assistance Programme, it can also connect you with a counsellor "
+        "confidentially. I'm here with you - would you like to keep talking?"
+    )
+}
+
+_RESOURCE_TEXTS = frozenset(RESOURCE_RESPONSES.values())
+
+
+def detect(message):
+    """Return the matched crisis phrase, or None"""
+    match = CRISIS_PATTERN.search(message)
+    return match.group(0) if match else None
+
+
+def resource_response(persona):
+    return RESOURCE_RESPONSES.get(persona, RESOURCE_RESPONSES['student'])
+
+
+def is_resource_response(text):
+    return text in _RESOURCE_TEXTS
@@ -0,0 +1,295 @@
+"""
+Local retrieval-based fallback responder.
+
+When Gemini is unavailable, failing or slower than the latency budget,
+the assistants answer from a small curated corpus instead of a single
+canned apology. Each persona has its own in-memory BM25 inverted index.
+ParentBot entries are tagged with the task type from detect_task_type,
+and matching entries are preferred. Lookups are pure Python over a few
+dozen short documents and take well under a millisecond.
+"""
+import math
+import re
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+
+STOPWORDS = frozenset(
+    "a an the i im me my we our you your to for of in on at and or is are am be been can could should would "
+    "what which how do does did please some give tell show make with about it its this that so just really "
+    "very have has had not no get got feel feeling".split()
+)
+
+# Each entry: (task_type, retrieval text, response[, code])
+CORPUS = {
+    'student': [
+        ('chat', "exam exams test tests results marks grades fail failing study revision anxiety pressure",
+         "Exams can feel huge, but you don't have to tackle everything at once. Pick just one topic and study it "
+         "for 25 minutes, then take a 5-minute break - small wins build momentum. What subject is worrying you most?"),
+        ('chat', "stress stressed overwhelmed too much work assignments deadlines pressure burnout tired",
+         "That sounds like a lot to carry. Try writing down everything on your mind, then circle just the one thing "
+         "that matters most today - the rest can wait. Which one would you pick?"),
+        ('chat', "lonely alone loneliness nobody friends friend left out isolated miss",
+         "Feeling lonely is really hard, and it doesn't mean something is wrong with you. Sending one small message "
+         "to someone you used to talk to, or joining a club or study group, can be a gentle first step. "
+         "Who's someone you've felt comfortable with before?"),
+        ('chat', "family parents mom dad expectations fight argue home",
+         "Family pressure can feel heavy, especially when you care what they think. It can help to share how you "
+         "feel at a calm moment, using 'I feel...' instead of blaming. What's been happening at home?"),
+        ('chat', "money fees financial broke afford job career future worried placement",
+         "Worrying about money and the future is really common for students. Listing your options - scholarships, "
+         "part-time work, or talking to your college's financial aid office - can make it feel more manageable. "
+         "What feels most urgent right now?"),
+        ('chat', "sleep cant sleep insomnia night awake tired exhausted",
+         "Poor sleep makes everything feel harder. Try putting your phone away 30 minutes before bed and doing a few "
+         "slow breaths - in for 4, hold for 4, out for 6. What usually keeps you up?"),
+        ('chat', "sad depressed down low unhappy crying hopeless anxiety anxious panic",
+         "I'm sorry you're feeling this way - your feelings are valid. Try a small grounding exercise: name 5 things "
+         "you can see, 4 you can touch and 3 you can hear. If these feelings stay for weeks, talking to a counsellor "
+         "can really help. What's been weighing on you?"),
+        ('chat', "better good happy thanks okay fine improving",
+         "I'm really glad to hear that! Notice what helped today so you can come back to it when things get tough. "
+         "What made the biggest difference?")
+    ],
+    'parent': [
+        ('meal_planner', "breakfast healthy kids morning quick",
+         "Quick, healthy Indian breakfasts for kids:\n• Vegetable poha with peanuts (15 min)\n"
+         "• Besan chilla with grated carrot (20 min)\n• Idli with sambar (use ready batter, 20 min)\n"
+         "• Ragi dosa with coconut chutney (20 min)\n• Oats upma with peas (15 min)\n"
+         "Add a fruit or a glass of milk for extra protein and calcium."),
+        ('meal_planner', "lunch tiffin lunchbox school box",
+         "Easy lunchbox ideas:\n• Paneer or aloo paratha rolls with curd dip\n• Lemon rice with roasted peanuts\n"
+         "• Vegetable pulao with raita\n• Mini idlis tossed in podi\n• Rajma or chole with rice in a leak-proof box\n"
+         "Prep chopped vegetables the night before to save morning time."),
+        ('meal_planner', "dinner supper recipe cook cooking healthy vegetarian veg paneer dal family",
+         "A simple family dinner (about 40 minutes):\n• Dal tadka - 1 cup toor dal, tomato, onion, cumin, garlic\n"
+         "• Jeera rice - 1.5 cups basmati, cumin, ghee\n• Paneer bhurji - 200 g paneer, capsicum, onion, tomato\n"
+         "• Cucumber raita on the side\nPressure-cook the dal while the rice soaks to save time."),
+        ('meal_planner', "chicken fish mutton egg non-veg nonveg",
+         "A quick non-veg meal (about 35 minutes):\n• Egg curry or simple chicken curry with onion-tomato masala\n"
+         "• Steamed rice or phulkas\n• Kachumber salad\nMarinate chicken in curd, turmeric and salt for 20 minutes "
+         "to keep it tender for kids."),
+        ('todo_list', "todo list tasks plan day schedule organize checklist tomorrow routine",
+         "☐ Wake up and drink water (Time: 6:00 AM IST)\n☐ Prepare breakfast and lunchboxes (Time: 6:30 AM IST)\n"
+         "☐ School drop-off (Time: 7:30 AM IST)\n☐ Groceries and errands (Time: 10:00 AM IST)\n"
+         "☐ Pay pending bills (Time: 12:00 PM IST)\n☐ Homework help (Time: 4:30 PM IST)\n"
+         "☐ Cook dinner (Time: 7:00 PM IST)\n☐ Bedtime story and lights out (Time: 9:00 PM IST)"),
+        ('todo_list', "weekend saturday sunday kids activities",
+         "☐ Family breakfast together (Time: 8:30 AM IST)\n☐ Park or outdoor play (Time: 10:00 AM IST)\n"
+         "☐ Weekly meal prep (Time: 12:00 PM IST)\n☐ Quiet reading or craft time (Time: 3:00 PM IST)\n"
+         "☐ Plan next week's schedule (Time: 6:00 PM IST)\n☐ Early dinner and movie night (Time: 7:30 PM IST)"),
+        ('todo_list', "study practice learn kids homework exam preparation",
+         "☐ Review today's school notes (Time: 5:00 PM IST)\n☐ 25-minute focused homework block (Time: 5:30 PM IST)\n"
+         "☐ Short break with a snack (Time: 6:00 PM IST)\n☐ Practice one weak topic (Time: 6:15 PM IST)\n"
+         "☐ Pack school bag for tomorrow (Time: 8:00 PM IST)"),
+        ('parenting_tips', "tantrum tantrums behavior behaviour discipline angry anger hitting shouting",
+         "During a tantrum, stay calm and stay close - name the feeling ('You're upset because we have to leave'). "
+         "Hold the limit kindly, and talk about it once they have calmed down. Praise the behaviour you want to see "
+         "more of, and keep routines predictable so there are fewer triggers."),
+        ('parenting_tips', "screen time phone mobile tv games",
+         "Set clear screen-time rules together: fixed times, no screens during meals or an hour before bed, and "
+         "devices charging outside bedrooms. Offer appealing alternatives like outdoor play or board games, and "
+         "model the habits you want to see."),
+        ('parenting_tips', "child kid development confidence shy social friends school",
+         "Build confidence by giving children small responsibilities they can succeed at, praising effort rather "
+         "than results, and giving them chances to make simple choices. Arrange low-pressure playdates to help shy "
+         "children practise social skills."),
+        ('bedtime_stories', "story bedtime tale animal elephant moral sleep night",
+         "Once upon a time, a little elephant named Gajju was afraid of the dark. One night his grandmother took him "
+         "outside and showed him the fireflies glowing in the mango trees. 'The dark is where the little lights "
+         "shine brightest,' she said. From then on, Gajju looked for the fireflies every night and fell asleep "
+         "smiling. The moral: even in the dark, there is always something beautiful to find. Good night!"),
+        ('bedtime_stories', "story moon stars sky space dream",
+         "High above a sleepy village, the Moon noticed a little girl named Meera who couldn't sleep. The Moon sent "
+         "its softest beam through her window and whispered, 'Close your eyes and count the stars with me.' Meera "
+         "counted one, two, three... and by ten she was dreaming of riding a silver cloud. The moral: a calm heart "
+         "brings sweet dreams. Good night!"),
+        ('bedtime_stories', "story friendship sharing kindness tiger rabbit forest",
+         "In a green forest lived a tiger cub named Sheru who never shared his mangoes. One day a storm knocked down "
+         "his tree, and his friend Rabbit shared her carrots with him. Sheru realised how good kindness felt and "
+         "shared his mangoes with everyone the next day. The moral: kindness grows when we share it. Good night!"),
+        ('money_management', "budget monthly expenses household save saving",
+         "Try the 50-30-20 budget: 50% for needs (rent, groceries, school fees), 30% for wants and 20% for savings. "
+         "Track spending for one month to see where money goes, and set up an automatic transfer to savings on "
+         "salary day."),
+        ('money_management', "invest investment education child future sip mutual fund ppf sukanya",
+         "For a child's education, start early and stay consistent: a monthly SIP in diversified equity mutual funds "
+         "for goals over 7 years away, and safer options like PPF or Sukanya Samriddhi Yojana (for daughters) for "
+         "stability. Keep an emergency fund of 6 months' expenses first."),
+        ('money_management', "debt loan emi credit card",
+         "List all debts with their interest rates and pay off the costliest (usually credit cards) first while "
+         "paying minimums on the rest. Avoid new EMIs for wants, and call your bank about restructuring if "
+         "payments feel unmanageable."),
+        ('general', "help hello hi assistance",
+         "I can help with meal planning, todo lists, parenting tips, bedtime stories and money management. "
+         "What would you like to start with?")
+    ],
+    'professional': [
+        ('chat', "burnout burned out exhausted drained tired",
+         "Burnout is a signal, not a failure. This week, protect one non-negotiable recovery block each day - a "
+         "walk, a proper lunch away from your desk, or a hard stop time. If exhaustion persists, consider talking "
+         "to HR or an Employee Assistance Programme about workload."),
+        ('chat', "deadline deadlines workload too much overloaded overtime hours",
+         "When the workload is too heavy, list your tasks and agree on the top three priorities with your manager - "
+         "clarity on what can wait is as valuable as working faster. Block focus time on your calendar for the most "
+         "important one."),
+        ('chat', "manager boss micromanage conflict feedback",
+         "Difficult manager relationships often improve with a short, structured conversation: share what you "
+         "observe, how it affects your work, and one specific request. Keep notes of agreements so expectations stay "
+         "clear."),
+        ('chat', "meeting meetings calendar back to back",
+         "Meeting overload drains focus. Ask for an agenda before accepting, suggest async updates where possible, "
+         "and protect at least one meeting-free block each day for deep work."),
+        ('chat', "presentation client public speaking nervous anxious performance review",
+         "For high-stakes presentations, rehearse the first two minutes until they feel automatic - a strong start "
+         "calms nerves. Prepare answers for three likely questions, and take a slow breath before you begin."),
+        ('chat', "layoff job security worried career promotion growth",
+         "Uncertainty about your job is stressful. Focus on what you can control: document your achievements, "
+         "refresh your CV, and reconnect with your network. That preparation builds confidence whatever happens."),
+        ('chat', "remote work from home balance switch off evening commute",
+         "To separate work and home, create a shutdown ritual: write tomorrow's top three tasks, close your laptop and "
+         "take a short walk. Turn off work notifications outside agreed hours."),
+        ('chat', "team colleague colleagues conflict dynamics",
+         "Team tension often comes from unclear roles or expectations. Suggest a short team check-in to align on "
+         "responsibilities, and address individual issues privately and early."),
+        ('chat', "better relaxed motivated good confident accomplished",
+         "That's great to hear! Take a moment to note what helped - it's useful to come back to on tougher days.")
+    ],
+    'codegent': [
+        ('python', "hello world program print python",
+         "Here's a classic Hello World in Python. Run it with `python hello.py`.",
+         "print('Hello, World!')"),
+        ('java', "hello world program print java",
+         "Here's Hello World in Java. Save it as HelloWorld.java, compile with `javac` and run with `java HelloWorld`.",
+         'public class HelloWorld {\n    public static void main(String[] args) {\n'
+         '        System.out.println("Hello, World!");\n    }\n}'),
+        ('cpp', "hello world program print c++ cpp",
+         "Here's Hello World in C++. Compile with `g++ hello.cpp -o hello`.",
+         '#include <iostream>\n\nint main() {\n    std::cout << "Hello, World!" << std::endl;\n    return 0;\n}'),
+        ('go', "hello world program print go golang",
+         "Here's Hello World in Go. Run it with `go run hello.go`.",
+         'package main\n\nimport "fmt"\n\nfunc main() {\n    fmt.Println("Hello, World!")\n}'),
+        ('python', "list comprehension examples filter map squares",
+         "List comprehensions build lists in one readable expression.",
+         "numbers = range(10)\nsquares = [n * n for n in numbers]\nevens = [n for n in numbers if n % 2 == 0]\n"
+         "pairs = [(x, y) for x in range(3) for y in range(3)]"),
+        ('python', "reverse linked list node",
+         "Reversing a linked list iteratively flips each pointer in a single pass - O(n) time, O(1) space.",
+         "class Node:\n    def __init__(self, value, next=None):\n        self.value = value\n        self.next = next\n\n\n"
+         "def reverse(head):\n    previous = None\n    while head:\n        head.next, previous, head = previous, head, head.next\n"
+         "    return previous"),
+        ('python', "binary search sorted list",
+         "Binary search halves the search range each step - O(log n).",
+         "def binary_search(items, target):\n    low, high = 0, len(items) - 1\n    while low <= high:\n"
+         "        mid = (low + high) // 2\n        if items[mid] == target:\n            return mid\n"
+         "        if items[mid] < target:\n            low = mid + 1\n        else:\n            high = mid - 1\n"
+         "    return -1"),
+        ('go', "http server web endpoint json",
+         "A minimal Go HTTP server with a JSON endpoint using only the standard library.",
+         'package main\n\nimport (\n    "encoding/json"\n    "net/http"\n)\n\nfunc main() {\n'
+         '    http.HandleFunc("/users", func(w http.ResponseWriter, r *http.Request) {\n'
+         '        w.Header().Set("Content-Type", "application/json")\n'
+         '        json.NewEncoder(w).Encode([]string{"alice", "bob"})\n    })\n'
+         '    http.ListenAndServe(":8080", nil)\n}'),
+        ('java', "exception handling try catch custom exception",
+         "Use try/catch for recoverable errors and define custom exceptions for domain-specific failures.",
+         'class InsufficientFundsException extends Exception {\n'
+         '    public InsufficientFundsException(String message) {\n        super(message);\n    }\n}\n\n'
+         'try {\n    account.withdraw(500);\n} catch (InsufficientFundsException e) {\n'
+         '    System.err.println("Error: " + e.getMessage());\n} finally {\n    account.close();\n}')
+    ]
+}
+
+DEFAULT_RESPONSES = {
+    'student': "I'm having trouble thinking right now, but I'm here for you. What's on your mind?",
+    'parent': "I'm having some technical difficulties, but I'm here to help you with meal planning, todo lists, "
+              "parenting tips, bedtime stories or money management. What do you need?",
+    'professional': "I'm experiencing some technical difficulties, but I'm still here to support you. What specific "
+                    "workplace challenge are you facing today?",
+    'codegent': "I'm having trouble connecting to my AI services right now. Try asking about a specific function, "
+                "algorithm or error message and I'll share what I can."
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords, with a light plural/gerund stem"""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith('ing'):
+            token = token[:-3]
+        elif len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = []
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            self.doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self.postings.setdefault(token, []).append((doc_id, tf))
+        total = len(self.doc_lengths)
+        self.avg_length = (sum(self.doc_lengths) / total) if total else 0.0
+        self.idf = {token: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for token, docs in self.postings.items()}
+
+    def search(self, query):
+        """Return {doc_id: score} for documents sharing at least one term with query"""
+        scores = {}
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = self.idf[token]
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+class FallbackResponder:
+    def __init__(self, corpus=CORPUS, defaults=DEFAULT_RESPONSES):
+        self.entries = {}
+        self.indexes = {}
+        self.defaults = defaults
+        for persona, entries in corpus.items():
+            self.entries[persona] = entries
+            self.indexes[persona] = BM25Index([f"{entry[0].replace('_', ' ')} {entry[1]}" for entry in entries])
+
+    def respond(self, persona, message, task_type=None):
+        """Return (response, code) for the best curated match, or the persona default"""
+        index = self.indexes.get(persona)
+        if index is None:
+            return self.defaults.get(persona, DEFAULT_RESPONSES['student']), None
+
+        entries = self.entries[persona]
+        scores = index.search(message)
+        if task_type:
+            # Prefer entries for the detected task type or CodeGent language
+            matching = {doc_id: score for doc_id, score in scores.items() if entries[doc_id][0] == task_type}
+            if matching:
+                scores = matching
+            elif persona == 'codegent':
+                scores = {}
+            elif not scores:
+                scores = {doc_id: 0.0 for doc_id, entry in enumerate(entries) if entry[0] == task_type}
+
+        if not scores:
+            return self.defaults.get(persona), None
+        best = max(scores, key=scores.get)
+        entry = entries[best]
+        return entry[2], entry[3] if len(entry) > 3 else None
+
+
+# Global responder - the corpus is indexed once at import time
+responder = FallbackResponder()
@@ -0,0 +1,117 @@
+"""
+Local stand-in for genai.GenerativeModel used for benchmarking.
+
+Set GEMINI_BACKEND=stub to make main_app.py use StubGenerativeModel instead
+of calling Gemini. The stub produces persona-shaped responses after a
+simulated delay (base latency plus streaming time at a fixed token rate)
+and can inject upstream errors, so the full request path can be load
+tested without spending API quota.
+
+Environment:
+    STUB_LATENCY          base latency distribution in seconds:
+                          'fixed:0.5', 'uniform:0.2,1.0', 'normal:0.6,0.15'
+                          or 'lognormal:-0.5,0.4' (mu, sigma of ln seconds)
+    STUB_TOKENS_PER_SEC   simulated generation speed (default 80, 0 = instant)
+    STUB_RESPONSE_TOKENS  approximate response length in tokens (default 120)
+    STUB_ERROR_RATE       fraction of calls that raise (default 0)
+    STUB_SEED             random seed for reproducible runs
+"""
+import os
+import random
+import time
+
+FILLER_WORDS = (
+    "you are doing better than you think and it is okay to take things one step at a time "
+    "small consistent habits make a big difference so be kind to yourself today"
+).split()
+
+
+class StubUpstreamError(Exception):
+    pass
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubChatSession:
+    """Mimic genai.ChatSession: history holds {'role', 'parts'} entries"""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, **kwargs):
+        # Shape the reply by the seed prompt, as the real model would remember the persona
+        seed = self.history[0]['parts'] if self.history else ''
+        response = self.model.generate_content(seed + '\n' + content if seed else content)
+        self.history.append({'role': 'user', 'parts': content})
+        self.history.append({'role': 'model', 'parts': response.text})
+        return response
+
+
+def parse_latency(spec):
+    """Turn a 'kind:a,b' spec into a sampler that draws seconds from a Random instance"""
+    kind, _, params = (spec or 'fixed:0').partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    if kind == 'fixed':
+        return lambda rng: values[0] if values else 0.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubGenerativeModel:
+    def __init__(self, latency='fixed:0', tokens_per_sec=80.0, response_tokens=120, error_rate=0.0, seed=None):
+        self.model_name = 'gemini-stub'
+        self._sample_latency = parse_latency(latency)
+        self.tokens_per_sec = tokens_per_sec
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+
+    def generate_content(self, prompt, **kwargs):
+        """Mimic GenerativeModel.generate_content with simulated latency and errors"""
+        tokens = max(10, int(self._rng.gauss(self.response_tokens, self.response_tokens * 0.25)))
+        if 'STORYTELLER MODE' in prompt or 'MEAL PLANNING' in prompt:
+            tokens *= 4
+
+        delay = self._sample_latency(self._rng)
+        if self.tokens_per_sec > 0:
+            delay += tokens / self.tokens_per_sec
+        time.sleep(delay)
+
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise StubUpstreamError("Injected upstream error (stub)")
+        return StubResponse(self._build_text(prompt, tokens))
+
+    def start_chat(self, history=None):
+        return StubChatSession(self, history)
+
+    def _build_text(self, prompt, tokens):
+        filler = ' '.join(self._rng.choice(FILLER_WORDS) for _ in range(tokens))
+        if 'You are CodeGent' in prompt:
+            return (f"Here is a solution with an explanation.\n\n```python\ndef solve(items):\n"
+                    f"    # Process each item\n    return [item * 2 for item in items]\n```\n\n{filler}")
+        if 'TODO LIST EXPERT MODE' in prompt:
+            hours = ['7:00 AM', '8:30 AM', '11:00 AM', '1:30 PM', '4:00 PM', '7:30 PM']
+            return '\n'.join(f"☐ {' '.join(filler.split()[i * 4:i * 4 + 4]).capitalize()} (Time: {hour} IST)"
+                             for i, hour in enumerate(hours))
+        return filler.capitalize() + '.'
+
+
+def create_stub_model_from_env():
+    """Build a stub model from the STUB_* environment variables"""
+    seed = os.environ.get('STUB_SEED')
+    return StubGenerativeModel(
+        latency=os.environ.get('STUB_LATENCY', 'lognormal:-0.7,0.4'),
+        tokens_per_sec=float(os.environ.get('STUB_TOKENS_PER_SEC', '80')),
+        response_tokens=int(os.environ.get('STUB_RESPONSE_TOKENS', '120')),
+        error_rate=float(os.environ.get('STUB_ERROR_RATE', '0')),
+        seed=int(seed) if seed is not None else None
+    )
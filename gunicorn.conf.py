@@ -0,0 +1,74 @@
+"""
+Production launcher settings - picked up automatically by
+
+    gunicorn main_app:app
+
+The app is preloaded in the master so prompt templates, keyword tables, the
+crisis matcher and the fallback BM25 index are built once. They are then
+shared copy-on-write with every worker. gc.freeze() moves those objects
+out of the collector's reach, so later collections in a worker do not
+write to (and un-share) their pages.
+
+Environment:
+    PORT                      listen port (default 5000)
+    WEB_CONCURRENCY           worker processes (default: CPU count, at most 4)
+    GUNICORN_WORKER_CLASS     'gthread' (default, threaded) or 'gevent' (async, needs gevent installed)
+    GUNICORN_THREADS          threads per gthread worker (default 8)
+    GUNICORN_MAX_REQUESTS     requests before a worker is replaced (default 2000, 0 disables)
+    GUNICORN_TIMEOUT          seconds a silent worker may hang before it is killed (default 120)
+
+Worker memory limits are read by memory_watchdog (WORKER_MEMORY_*).
+"""
+import gc
+import os
+import signal
+
+import memory_watchdog
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(os.cpu_count() or 1, 4)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# gevent has to patch the standard library before the app is imported, so it loads the app per worker
+preload_app = worker_class != 'gevent'
+
+# Jitter spreads the replacements out so workers do not all restart at the same moment
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+# Gemini calls can take tens of seconds; graceful shutdown lets them finish and flush snapshots
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# Heartbeat files on tmpfs so a slow container disk cannot make workers look hung
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = None
+errorlog = '-'
+
+
+def when_ready(server):
+    """Runs in the master after the preload, right before the first fork"""
+    gc.collect()
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Start this worker's upstream probe and memory watchdog once the app is loaded"""
+    import main_app
+
+    if main_app.upstream_prober is not None:
+        main_app.upstream_prober.ensure_started()
+
+    def recycle():
+        # The same graceful exit as max_requests: finish in-flight requests, run atexit hooks
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    watchdog = memory_watchdog.create_watchdog_from_env(evict=main_app.evict_cold_sessions, recycle=recycle,
+                                                        workers=workers)
+    if watchdog is not None:
+        watchdog.start()
+        worker.log.info("Memory watchdog for worker %s: soft %.0f MB, hard %.0f MB", worker.pid,
+                        watchdog.soft_limit / 2 ** 20, watchdog.hard_limit / 2 ** 20)
@@ -0,0 +1,173 @@
+"""
+Non-blocking logging pipeline for the FreeSpace platform.
+
+Request threads only push LogRecords onto an in-memory queue; a single
+QueueListener thread formats them as JSON (or plain text) and writes them
+to stderr. %-arguments and tracebacks are rendered on the request thread,
+so a log line shows values as they were at the call even if request state
+changes afterwards; JSON encoding and I/O are left to the listener.
+Records from high-volume loggers can be sampled, and if the queue ever
+fills up records are dropped instead of blocking the request.
+
+Environment:
+    LOG_LEVEL         root level (default INFO)
+    LOG_FORMAT        'json' (default) or 'text'
+    LOG_SAMPLE_RATES  per-logger sampling for records below WARNING,
+                      e.g. 'main_app.responses=0.1,werkzeug=0.5'
+    LOG_QUEUE_SIZE    max queued records before dropping (default 10000)
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed via extra={...}
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records from configured loggers"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return rate >= 1 or random.random() < rate
+            name = name.rpartition('.')[0]
+        return True
+
+
+class ContextFilter(logging.Filter):
+    """Attach request-scoped fields (e.g. trace_id) while still on the request thread"""
+
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def filter(self, record):
+        try:
+            for key, value in self.provider().items():
+                setattr(record, key, value)
+        except Exception:
+            pass
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped_records = 0
+
+    def prepare(self, record):
+        # Render args now - they are often request-state dicts and lists that may change before the listener runs
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+
+def parse_sample_rates(value):
+    """Parse 'logger=rate,logger=rate' into a dict"""
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.strip().partition('=')
+        if name and rate:
+            try:
+                rates[name] = float(rate)
+            except ValueError:
+                pass
+    return rates
+
+
+_listener = None
+
+
+def setup_logging(context_provider=None):
+    """Route all logging through a queue drained by a background listener thread"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    log_format = os.environ.get('LOG_FORMAT', 'json')
+    log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if log_format == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))))
+    if context_provider is not None:
+        queue_handler.addFilter(ContextFilter(context_provider))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    # Workers forked from a preloading server do not inherit the listener thread
+    os.register_at_fork(after_in_child=_restart_listener)
+    return _listener
+
+
+def _restart_listener():
+    """Give a forked child a fresh queue and listener thread; the parent's may have held the queue lock"""
+    log_queue = queue.Queue(maxsize=_listener.queue.maxsize)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = log_queue
+    _listener.queue = log_queue
+    _listener._thread = None
+    _listener.start()
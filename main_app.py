@@ -1,24 +1,64 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, send_from_directory, g, has_request_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import google.generativeai as genai
 # REMOVE THESE TWO LINES:
 # import speech_recognition as sr
 # import pyttsx3
+import atexit
 import threading
 import json
 import tempfile
 import wave
 import base64
+import contextvars
+import copy
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import gc
+import hmac
+import pickle
+import signal
+import sys
+import zlib
 from datetime import datetime, timedelta
 import logging
-import traceback
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import admission
+import chat_sessions
+import content_catalog
+import crisis
+import fallback_responder
+import logging_config
+import metrics
+import persistence
+import profiler
+import rate_limit
+import records
+import semantic_cache
+import session_cache
+import session_router
+import snapshots
+import serialization
+import todos
+import tracing
+import upstream_probe
+
+def log_context():
+    """Request-scoped fields attached to every log record"""
+    if has_request_context() and 'trace_id' in g:
+        return {'trace_id': g.trace_id}
+    return {}
+
+# Configure logging - records are queued and written by a background listener
+logging_config.setup_logging(context_provider=log_context)
 logger = logging.getLogger(__name__)
+# High-volume AI response logs; sample them with LOG_SAMPLE_RATES=main_app.responses=0.1
+response_logger = logger.getChild('responses')
 
 app = Flask(__name__, static_folder='.', template_folder='.')
+app.json = serialization.FastJSONProvider(app)
 CORS(app, origins=["*"])
 
 # Load environment variables
@@ -42,7 +82,8 @@ for env_path in env_locations:
 if not env_loaded:
     logger.warning("No .env file found, using system environment variables")
 
-# Configure Gemini AI
+# Configure Gemini AI (GEMINI_BACKEND=stub swaps in a local stub model for benchmarking)
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'gemini')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
     logger.error("GEMINI_API_KEY not found in environment variables")
@@ -50,7 +91,11 @@ if not GEMINI_API_KEY:
     GEMINI_API_KEY = "dummy_key_for_testing"
 
 try:
-    if GEMINI_API_KEY != "dummy_key_for_testing":
+    if GEMINI_BACKEND == 'stub':
+        import gemini_stub
+        model = gemini_stub.create_stub_model_from_env()
+        logger.warning("Using local Gemini stub model - responses are synthetic")
+    elif GEMINI_API_KEY != "dummy_key_for_testing":
         genai.configure(api_key=GEMINI_API_KEY)
         model = genai.GenerativeModel('gemini-2.0-flash')
         logger.info("Gemini AI configured successfully for all services")
@@ -61,6 +106,285 @@ except Exception as e:
     logger.error(f"Failed to configure Gemini AI: {e}")
     model = None
 
+# Request tracing (TRACE_SAMPLE_RATE=0 disables span recording)
+tracer = tracing.create_tracer_from_env()
+
+# Token for admin-only endpoints; they are disabled when it is not set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Seconds to wait for Gemini before answering from the local fallback corpus (0 waits indefinitely)
+MODEL_LATENCY_BUDGET = float(os.getenv('MODEL_LATENCY_BUDGET', '0'))
+model_executor = ThreadPoolExecutor(max_workers=int(os.getenv('MODEL_WORKERS', '16')),
+                                    thread_name_prefix='model-call') if MODEL_LATENCY_BUDGET > 0 else None
+
+class ModelDeadlineExceeded(Exception):
+    """Raised when Gemini does not answer within MODEL_LATENCY_BUDGET"""
+
+def call_model(prompt, chat=None):
+    """Run model.generate_content, or send to a chat session, giving up after MODEL_LATENCY_BUDGET seconds"""
+    send = chat.send_message if chat is not None else model.generate_content
+    if model_executor is None:
+        return send(prompt).text
+    future = model_executor.submit(send, prompt)
+    try:
+        return future.result(timeout=MODEL_LATENCY_BUDGET).text
+    except FutureTimeoutError:
+        # The upstream call keeps running in its worker; its late result is discarded
+        raise ModelDeadlineExceeded(f"no model response within {MODEL_LATENCY_BUDGET}s")
+
+# Fair-share scheduling of outbound model calls across personas (MODEL_MAX_CONCURRENCY=0 disables)
+model_scheduler = rate_limit.create_scheduler_from_env()
+
+# Upstream pressure signals for shedding low-priority requests (see ADMISSION CONTROL)
+# Sized for this worker: GUNICORN_THREADS is what gunicorn.conf.py gives each gthread worker
+admission_controller = admission.create_controller_from_env(
+    request_threads=int(os.getenv('GUNICORN_THREADS', '8')),
+    model_slots=model_scheduler.max_concurrent if model_scheduler is not None else None)
+ADMISSION_SHED_MODE = admission.shed_mode_from_env()
+
+# Shed decision for work running off the request thread (batch tasks), where g is not available
+shedding_model_calls = contextvars.ContextVar('shedding_model_calls', default=False)
+
+class ModelCallShed(Exception):
+    """Raised instead of calling Gemini for a request shed under load"""
+
+def model_calls_shed():
+    """True when the current request, or the batch task running for it, was shed"""
+    if has_request_context():
+        return bool(g.get('shed_model_calls'))
+    return shedding_model_calls.get()
+
+def call_model_fairly(prompt, persona, chat=None):
+    """Wait for a model-call slot in persona's queue, then call the model"""
+    with admission_controller.tracking():
+        if model_scheduler is None:
+            return call_model(prompt, chat)
+        queued_at = time.perf_counter()
+        with model_scheduler.slot(persona):
+            queue_seconds = time.perf_counter() - queued_at
+            metrics.registry.observe('freespace_model_queue_seconds', queue_seconds, persona=persona)
+            admission_controller.record_queue_wait(queue_seconds)
+            return call_model(prompt, chat)
+
+def generate_model_content(prompt, persona, task_type='general', chat=None):
+    """Call Gemini and record upstream latency and payload sizes"""
+    if model_calls_shed():
+        raise ModelCallShed("model call skipped while shedding load")
+    metrics.registry.observe('freespace_prompt_chars', len(prompt), persona=persona, task_type=task_type)
+    start = time.perf_counter()
+    try:
+        with tracer.span('model.generate_content', persona=persona, task_type=task_type, prompt_chars=len(prompt)):
+            text = call_model_fairly(prompt, persona, chat).strip()
+    except ModelDeadlineExceeded:
+        metrics.registry.observe('freespace_model_request_duration_seconds', time.perf_counter() - start,
+                                 persona=persona, task_type=task_type)
+        metrics.registry.inc('freespace_model_requests_total', persona=persona, task_type=task_type, outcome='timeout')
+        raise
+    except Exception:
+        metrics.registry.observe('freespace_model_request_duration_seconds', time.perf_counter() - start,
+                                 persona=persona, task_type=task_type)
+        metrics.registry.inc('freespace_model_requests_total', persona=persona, task_type=task_type, outcome='error')
+        raise
+
+    metrics.registry.observe('freespace_model_request_duration_seconds', time.perf_counter() - start,
+                             persona=persona, task_type=task_type)
+    metrics.registry.inc('freespace_model_requests_total', persona=persona, task_type=task_type, outcome='success')
+    metrics.registry.observe('freespace_response_chars', len(text), persona=persona, task_type=task_type)
+    return text
+
+# Server-held model chats so follow-up turns send only the new message (CHAT_SESSIONS=0 disables)
+chat_session_factory = chat_sessions.create_factory_from_env()
+
+def run_chat_turn(session, persona, key, user_message, context, build_full_prompt):
+    """Send one turn on session, or on a new session seeded with the full prompt when session is None
+
+    Returns (text, session used).
+    """
+    if session is not None:
+        prompt = session.follow_up_prompt(user_message, context)
+    else:
+        session = chat_session_factory.start(model, key)
+        session.mark_context_sent(context)
+        prompt = build_full_prompt()
+    return generate_model_content(prompt, persona, key, chat=session.chat), session
+
+def generate_chat_content(assistant, persona, key, user_message, context, history_length, build_full_prompt):
+    """Continue the assistant's model chat, or start a new one seeded with the full persona prompt"""
+    if not chat_session_factory.supports(model):
+        return generate_model_content(build_full_prompt(), persona, key)
+    
+    session = assistant.chat_session
+    if session is not None and not session.in_sync(key, history_length):
+        session = None
+    try:
+        text, session = run_chat_turn(session, persona, key, user_message, context, build_full_prompt)
+    except Exception:
+        assistant.chat_session = None
+        raise
+    session.turn_completed(history_length + 1)
+    assistant.chat_session = session
+    return text
+
+def generate_pooled_chat_content(pool, persona, key, user_message, history, build_full_prompt):
+    """Like generate_chat_content for a client-held history - the session is looked up by its last exchange
+
+    history is normalized (chat_sessions.normalize_history).
+    """
+    if not chat_session_factory.supports(model):
+        return generate_model_content(build_full_prompt(), persona, key)
+    
+    # Taken out of the pool, so a concurrent request with the same history starts its own session
+    last = history[-1] if history else None
+    session = pool.take(chat_sessions.conversation_fingerprint(key, last['user'], last['assistant'])) if last else None
+    text, session = run_chat_turn(session, persona, key, user_message, None, build_full_prompt)
+    session.turn_completed(len(history) + 1)
+    pool.put(chat_sessions.conversation_fingerprint(key, user_message, text), session)
+    return text
+
+# Turns older than this many are zlib-compressed in memory; prompts only read the most recent few
+HISTORY_HOT_TURNS = int(os.getenv('HISTORY_HOT_TURNS', '4'))
+
+def new_history():
+    return records.TurnHistory(hot_turns=HISTORY_HOT_TURNS)
+
+# Semantic cache for paraphrased questions (SEMANTIC_CACHE_PERSONAS picks who uses it)
+response_cache = semantic_cache.create_cache_from_env()
+
+# ParentBot task types with factual answers; stories, todo lists and general chat are personal or meant to vary
+CACHEABLE_PARENT_TASKS = frozenset(['meal_planner', 'parenting_tips', 'money_management'])
+
+def parent_cache_scope(context):
+    """The parent context fields a cached answer has to match - diet and children's ages"""
+    preferences = ','.join(sorted(context.get('meal_preferences', [])))
+    ages = ','.join(str(age) for age in sorted(context.get('kids_ages', [])))
+    return f"{preferences}|{ages}"
+
+def lookup_cached_response(persona, task_type, message, scope=''):
+    """Return a cached answer to a similar earlier message, recording hit/miss metrics"""
+    if not response_cache.is_enabled_for(persona):
+        return None
+    with tracer.span('cache.lookup', persona=persona, task_type=task_type):
+        cached, similarity = response_cache.lookup(persona, task_type, message, scope)
+    metrics.registry.inc('freespace_cache_requests_total', persona=persona, result='hit' if cached else 'miss')
+    return cached
+
+# Pregenerated bedtime stories and meal plans for generic ParentBot requests
+parent_catalog = content_catalog.create_catalog_from_env()
+
+def lookup_catalog_response(assistant, task_type, message):
+    """Return a pregenerated story or meal plan for a generic request, recording hit/miss metrics"""
+    if not parent_catalog.enabled or task_type not in ('bedtime_stories', 'meal_planner'):
+        return None
+    with tracer.span('catalog.lookup', task_type=task_type):
+        response = parent_catalog.lookup(task_type, message, assistant.parent_context,
+                                         rotation=len(assistant.conversation_history))
+    metrics.registry.inc('freespace_catalog_requests_total', task_type=task_type, result='hit' if response else 'miss')
+    return response
+
+def record_persist_batch(batch, seconds, ok):
+    metrics.registry.observe('freespace_persist_flush_seconds', seconds)
+    metrics.registry.inc('freespace_persist_records_total', len(batch), result='written' if ok else 'failed')
+
+# Write-behind persistence of turns and context updates (unset PERSIST_STORE disables)
+persist_queue = persistence.create_queue_from_env(on_batch=record_persist_batch)
+
+def persist_record(kind, persona, data, created=None):
+    if persist_queue is not None and not persist_queue.put(kind, persona, data, created):
+        metrics.registry.inc('freespace_persist_records_total', result='dropped')
+
+def record_turn(assistant, persona, turn, persist=True):
+    """Append a turn to the conversation and queue it for the write-behind store
+
+    Takes the session lock: request threads and background crisis follow-ups
+    append to the same history that the memory watchdog trims, and
+    TurnHistory.append compresses the turn at a position that must not shift
+    underneath it.
+    """
+    with assistant.session_lock:
+        assistant.conversation_history.append(turn)
+    if persist and persist_queue is not None:
+        persist_record('turn', persona, turn.to_dict(), turn.created)
+
+def context_delta(assistant, persona, context, full=False):
+    """serialization.context_delta that also queues changed fields for the write-behind store"""
+    previous_version = assistant.context_version
+    version, changes, removed = serialization.context_delta(assistant, context, full=full)
+    if persist_queue is not None and version != previous_version:
+        changed, removed_fields = context.changes_since(previous_version) if full else (changes, removed)
+        # Copy only the changed fields - the writer encodes them later, while live lists keep changing in place
+        data = copy.deepcopy(changed)
+        data['context_version'] = version
+        if removed_fields:
+            data['removed'] = removed_fields
+        persist_record('context', persona, data)
+    return version, changes, removed
+
+# Background model follow-ups for messages answered by the crisis fast path
+crisis_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='crisis-follow-up')
+
+def handle_crisis_message(assistant, persona, user_message, build_prompt):
+    """Answer crisis language immediately with vetted resources, before any model call
+    
+    Runs ahead of the model availability check so it works even when Gemini is down.
+    The usual model reply is generated in the background and attached to the
+    crisis turn as its follow_up. The prompt for it is built before the turn is
+    recorded, so the crisis message is not in its history block as well.
+    """
+    start = time.perf_counter()
+    matched = crisis.detect(user_message)
+    metrics.registry.observe('freespace_crisis_check_seconds', time.perf_counter() - start)
+    if matched is None:
+        return None
+    
+    metrics.registry.inc('freespace_crisis_responses_total', persona=persona)
+    logger.warning("Crisis language detected for %s, serving resource response", persona)
+    reply = crisis.resource_response(persona)
+    turn = records.Turn(user_message, reply, crisis_support=True)
+    if not model:
+        record_turn(assistant, persona, turn)
+        return reply
+    prompt = build_prompt()
+    # Persisted once the follow-up is attached, so the store gets the turn in one record
+    record_turn(assistant, persona, turn, persist=False)
+    crisis_executor.submit(generate_crisis_follow_up, assistant, persona, turn, prompt)
+    return reply
+
+def generate_crisis_follow_up(assistant, persona, turn, prompt):
+    """Generate the model's personal follow-up to a crisis resource response and attach it to the crisis turn"""
+    try:
+        follow_up = generate_model_content(prompt, persona, 'crisis_follow_up')
+    except Exception as e:
+        logger.error("Crisis follow-up generation error: %s", e)
+        follow_up = None
+    if follow_up:
+        with assistant.session_lock:
+            # The history may have been replaced by a newer copy from another worker since; find the turn there
+            history = assistant.conversation_history
+            current = next((candidate for candidate in reversed(history)
+                            if candidate.created == turn.created and candidate.crisis_support), None)
+            if current is not None:
+                current.follow_up = follow_up
+                history.touch()
+        turn.follow_up = follow_up
+    persist_record('turn', persona, turn.to_dict(), turn.created)
+    if follow_up:
+        publish_session(persona)
+
+def record_fallback(persona, reason):
+    """Count a local fallback response served instead of a model answer"""
+    metrics.registry.inc('freespace_fallback_responses_total', persona=persona, reason=reason)
+
+def fallback_reason(error):
+    if isinstance(error, ModelCallShed):
+        return 'load_shed'
+    return 'deadline_exceeded' if isinstance(error, ModelDeadlineExceeded) else 'model_error'
+
+def local_fallback(persona, user_message, reason, task_type=None):
+    """Answer from the local retrieval corpus instead of Gemini; returns (response, code)"""
+    record_fallback(persona, reason)
+    with tracer.span('fallback.retrieve', persona=persona, reason=reason):
+        return fallback_responder.responder.respond(persona, user_message, task_type)
+
 # Initialize speech services with fallback for cloud deployment
 recognizer = None
 microphone = None
@@ -119,15 +443,38 @@ except Exception as e:
 # STUDENT ASSISTANT (MAYA) CLASS
 # =================================================================================
 
+STUDENT_PROBLEM_KEYWORDS = {
+    'stress': 'academic stress',
+    'exam': 'exam anxiety',
+    'lonely': 'loneliness',
+    'friend': 'friendship issues',
+    'family': 'family problems',
+    'money': 'financial concerns',
+    'job': 'career worries',
+    'relationship': 'relationship issues',
+    'health': 'health concerns',
+    'anxiety': 'anxiety',
+    'depression': 'depression',
+    'overwhelmed': 'feeling overwhelmed'
+}
+
+class StudentContext(records.ContextRecord):
+    __slots__ = ('mood', 'problems', 'session_start', 'happiness_score', 'student_name')
+    LABEL_FIELDS = {'problems': records.LabelEnum(STUDENT_PROBLEM_KEYWORDS.values())}
+    TIMESTAMP_FIELDS = frozenset(['session_start'])
+
 class VoiceAssistant:
+    # Attributes published to the shared session cache
+    SHARED_STATE = ('conversation_history', 'student_context', 'context_version')
+
     def __init__(self):
-        self.conversation_history = []
-        self.student_context = {
-            'mood': 'sad',
-            'problems': [],
-            'session_start': datetime.now().isoformat()
-        }
+        self.conversation_history = new_history()
+        self.session_lock = threading.RLock()
+        self.student_context = StudentContext(mood='sad', problems=[], session_start=time.time())
+        self.context_version = 0
+        self.chat_session = None
         
+    @tracer.traced('student.build_prompt')
     def get_motivational_prompt(self, user_message, context):
         """Generate a context-aware prompt for Maya"""
         base_prompt = f"""
@@ -169,6 +516,8 @@ class VoiceAssistant:
         summary = ""
         for msg in recent_messages:
             summary += f"Student: {msg.get('user', '')}\nMaya: {msg.get('assistant', '')}\n"
+            if msg.get('follow_up'):
+                summary += f"Maya: {msg['follow_up']}\n"
         return summary
     
     def process_voice_input(self):
@@ -186,7 +535,7 @@ class VoiceAssistant:
                 audio = recognizer.listen(source, timeout=10, phrase_time_limit=10)
             
             text = recognizer.recognize_google(audio)
-            logger.info(f"Student said: {text}")
+            logger.info("Student said: %s", text)
             
             return text
             
@@ -195,55 +544,42 @@ class VoiceAssistant:
         except sr.UnknownValueError:
             return "I couldn't understand what you said. Could you please repeat that?"
         except sr.RequestError as e:
-            logger.error(f"Speech recognition error: {e}")
+            logger.error("Speech recognition error: %s", e)
             return "I'm having trouble with my hearing right now. Could you type your message instead?"
     
     def generate_ai_response(self, user_message):
         """Generate AI response using Gemini"""
+        crisis_reply = handle_crisis_message(
+            self, 'student', user_message, lambda: self.get_motivational_prompt(user_message, self.student_context))
+        if crisis_reply:
+            return crisis_reply
+        
         if not model:
-            return "I'm having trouble thinking right now, but I'm here for you. What's on your mind?"
+            return local_fallback('student', user_message, 'model_unavailable')[0]
         
         try:
             self.update_context(user_message)
-            prompt = self.get_motivational_prompt(user_message, self.student_context)
-            response = model.generate_content(prompt)
-            ai_message = response.text.strip()
+            ai_message = generate_chat_content(
+                self, 'student', 'chat', user_message, self.student_context, len(self.conversation_history),
+                lambda: self.get_motivational_prompt(user_message, self.student_context))
             
-            self.conversation_history.append({
-                'user': user_message,
-                'assistant': ai_message,
-                'timestamp': datetime.now().isoformat()
-            })
+            record_turn(self, 'student', records.Turn(user_message, ai_message))
             
-            logger.info(f"Maya response: {ai_message[:100]}...")
+            response_logger.info("Maya response: %.100s...", ai_message)
             return ai_message
             
         except Exception as e:
-            logger.error(f"AI generation error: {e}")
-            return "I'm having trouble thinking right now. But I'm here for you. Could you tell me more about what's bothering you?"
+            logger.error("AI generation error: %s", e)
+            return local_fallback('student', user_message, fallback_reason(e))[0]
     
+    @tracer.traced('student.update_context')
     def update_context(self, user_message):
         """Update student context based on their message"""
         message_lower = user_message.lower()
         
-        problem_keywords = {
-            'stress': 'academic stress',
-            'exam': 'exam anxiety', 
-            'lonely': 'loneliness',
-            'friend': 'friendship issues',
-            'family': 'family problems',
-            'money': 'financial concerns',
-            'job': 'career worries',
-            'relationship': 'relationship issues',
-            'health': 'health concerns',
-            'anxiety': 'anxiety',
-            'depression': 'depression',
-            'overwhelmed': 'feeling overwhelmed'
-        }
-        
-        for keyword, problem in problem_keywords.items():
-            if keyword in message_lower and problem not in self.student_context['problems']:
-                self.student_context['problems'].append(problem)
+        for keyword, problem in STUDENT_PROBLEM_KEYWORDS.items():
+            if keyword in message_lower:
+                self.student_context.add_label('problems', problem)
         
         positive_words = ['better', 'good', 'happy', 'okay', 'fine', 'thanks']
         if any(word in message_lower for word in positive_words):
@@ -253,16 +589,24 @@ class VoiceAssistant:
 # PARENT ASSISTANT (PARENTBOT) CLASS  
 # =================================================================================
 
+class ParentContext(records.ContextRecord):
+    __slots__ = ('current_task', 'todo_list', 'meal_preferences', 'kids_ages', 'session_start', 'parent_name')
+    LABEL_FIELDS = {'meal_preferences': records.LabelEnum(['vegetarian', 'non-vegetarian'])}
+    TIMESTAMP_FIELDS = frozenset(['session_start'])
+
 class ParentAssistant:
+    SHARED_STATE = ('conversation_history', 'parent_context', 'next_todo_id', 'context_version')
+
     def __init__(self):
-        self.conversation_history = []
-        self.parent_context = {
-            'current_task': None,
-            'todo_list': [],
-            'meal_preferences': [],
-            'kids_ages': [],
-            'session_start': datetime.now().isoformat()
-        }
+        self.conversation_history = new_history()
+        self.session_lock = threading.RLock()
+        self.parent_context = ParentContext(
+            current_task=None,
+            todo_list=[],
+            meal_preferences=[],
+            kids_ages=[],
+            session_start=time.time()
+        )
         self.task_categories = {
             'meal_planner': 'meal planning and cooking assistance',
             'todo_list': 'personalized todo list creation',
@@ -270,7 +614,27 @@ class ParentAssistant:
             'bedtime_stories': 'creative bedtime stories for kids',
             'money_management': 'financial planning and money psychology'
         }
+        self.next_todo_id = 1
+        self.context_version = 0
+    
+    def new_todo_item(self, text, time=None, done=False):
+        item = {'id': self.next_todo_id, 'text': text, 'time': time, 'done': done}
+        self.next_todo_id += 1
+        return item
+    
+    def find_todo_item(self, item_id):
+        for item in self.parent_context['todo_list']:
+            if item['id'] == item_id:
+                return item
+        return None
+    
+    def store_todo_list(self, ai_message):
+        """Replace the session todo list with the checklist parsed from a todo response"""
+        items = todos.parse_todo_list(ai_message)
+        if items:
+            self.parent_context['todo_list'] = [self.new_todo_item(text, time, done) for text, time, done in items]
     
+    @tracer.traced('parent.build_prompt')
     def get_specialized_prompt(self, user_message, context):
         """Generate specialized prompts based on task type"""
         task_type = self.detect_task_type(user_message)
@@ -382,6 +746,7 @@ class ParentAssistant:
             Provide helpful parenting assistance:
             """
     
+    @tracer.traced('parent.detect_task_type')
     def detect_task_type(self, message):
         """Detect what type of assistance the parent needs"""
         message_lower = message.lower()
@@ -404,29 +769,40 @@ class ParentAssistant:
     
     def generate_ai_response(self, user_message):
         """Generate AI response using Gemini"""
+        crisis_reply = handle_crisis_message(
+            self, 'parent', user_message, lambda: self.get_specialized_prompt(user_message, self.parent_context))
+        if crisis_reply:
+            return crisis_reply
+        
         if not model:
-            return "I'm having some technical difficulties, but I'm here to help you with parenting tasks. What do you need assistance with?"
+            return local_fallback('parent', user_message, 'model_unavailable', self.detect_task_type(user_message))[0]
         
         try:
             self.update_context(user_message)
-            prompt = self.get_specialized_prompt(user_message, self.parent_context)
-            response = model.generate_content(prompt)
-            ai_message = response.text.strip()
+            task_type = self.parent_context['current_task']
+            cacheable = task_type in CACHEABLE_PARENT_TASKS
+            cache_scope = parent_cache_scope(self.parent_context)
+            ai_message = lookup_catalog_response(self, task_type, user_message)
+            if ai_message is None and cacheable:
+                ai_message = lookup_cached_response('parent', task_type, user_message, cache_scope)
+            if ai_message is None:
+                prompt = self.get_specialized_prompt(user_message, self.parent_context)
+                ai_message = generate_model_content(prompt, 'parent', task_type)
+                if cacheable:
+                    response_cache.store('parent', task_type, user_message, ai_message, cache_scope)
             
-            self.conversation_history.append({
-                'user': user_message,
-                'assistant': ai_message,
-                'timestamp': datetime.now().isoformat(),
-                'task_type': self.detect_task_type(user_message)
-            })
+            record_turn(self, 'parent', records.Turn(user_message, ai_message, task_type=task_type))
+            if task_type == 'todo_list':
+                self.store_todo_list(ai_message)
             
-            logger.info(f"ParentBot response generated: {ai_message[:100]}...")
+            response_logger.info("ParentBot response generated: %.100s...", ai_message)
             return ai_message
             
         except Exception as e:
-            logger.error(f"AI generation error: {e}")
-            return "I'm having trouble processing that right now. Could you please try asking again? I'm here to help with meal planning, todo lists, parenting tips, bedtime stories, or money management."
+            logger.error("AI generation error: %s", e)
+            return local_fallback('parent', user_message, fallback_reason(e), self.parent_context['current_task'])[0]
     
+    @tracer.traced('parent.update_context')
     def update_context(self, user_message):
         """Update parent context based on their message"""
         task_type = self.detect_task_type(user_message)
@@ -434,30 +810,60 @@ class ParentAssistant:
         
         if task_type == 'meal_planner':
             if any(word in user_message.lower() for word in ['veg', 'vegetarian']):
-                if 'vegetarian' not in self.parent_context['meal_preferences']:
-                    self.parent_context['meal_preferences'].append('vegetarian')
+                self.parent_context.add_label('meal_preferences', 'vegetarian')
             elif any(word in user_message.lower() for word in ['non-veg', 'chicken', 'mutton', 'fish']):
-                if 'non-vegetarian' not in self.parent_context['meal_preferences']:
-                    self.parent_context['meal_preferences'].append('non-vegetarian')
+                self.parent_context.add_label('meal_preferences', 'non-vegetarian')
 
 # =================================================================================
 # WORKING PROFESSIONAL ASSISTANT (LUNA) CLASS
 # =================================================================================
 
+PROFESSIONAL_PROBLEM_KEYWORDS = {
+    'deadline': 'tight deadlines',
+    'overtime': 'excessive work hours',
+    'workload': 'heavy workload',
+    'boss': 'management issues',
+    'manager': 'management issues',
+    'meeting': 'meeting overload',
+    'burnout': 'burnout symptoms',
+    'promotion': 'career advancement pressure',
+    'colleague': 'workplace relationships',
+    'team': 'team dynamics',
+    'project': 'project pressure',
+    'performance': 'performance anxiety',
+    'layoff': 'job security concerns',
+    'remote': 'remote work challenges',
+    'commute': 'work-life balance issues',
+    'client': 'client relationship stress',
+    'presentation': 'presentation anxiety'
+}
+
+class ProfessionalContext(records.ContextRecord):
+    __slots__ = ('mood', 'work_problems', 'stress_level', 'work_environment', 'role_level', 'session_start',
+                 'professional_name')
+    LABEL_FIELDS = {'work_problems': records.LabelEnum(PROFESSIONAL_PROBLEM_KEYWORDS.values())}
+    TIMESTAMP_FIELDS = frozenset(['session_start'])
+
 class LunaProfessionalAssistant:
+    SHARED_STATE = ('conversation_history', 'professional_context', 'context_version')
+
     def __init__(self):
-        self.conversation_history = []
-        self.professional_context = {
-            'mood': 'stressed',
-            'work_problems': [],
-            'stress_level': 'high',
-            'work_environment': 'office',
-            'role_level': 'mid_level',
-            'session_start': datetime.now().isoformat(),
-            'professional_name': 'Professional'
-        }
+        self.conversation_history = new_history()
+        self.session_lock = threading.RLock()
+        self.professional_context = ProfessionalContext(
+            mood='stressed',
+            work_problems=[],
+            stress_level='high',
+            work_environment='office',
+            role_level='mid_level',
+            session_start=time.time(),
+            professional_name='Professional'
+        )
         self.is_listening = False
+        self.context_version = 0
+        self.chat_session = None
         
+    @tracer.traced('professional.build_prompt')
     def get_professional_prompt(self, user_message, context):
         """Generate a context-aware prompt for Luna"""
         base_prompt = f"""
@@ -501,6 +907,8 @@ class LunaProfessionalAssistant:
         summary = ""
         for msg in recent_messages:
             summary += f"Professional: {msg.get('user', '')}\nLuna: {msg.get('assistant', '')}\n"
+            if msg.get('follow_up'):
+                summary += f"Luna: {msg['follow_up']}\n"
         return summary
     
     def process_voice_input(self):
@@ -521,7 +929,7 @@ class LunaProfessionalAssistant:
             
             logger.info("Processing speech...")
             text = recognizer.recognize_google(audio)
-            logger.info(f"Professional said: {text}")
+            logger.info("Professional said: %s", text)
             
             self.is_listening = False
             return text
@@ -536,38 +944,40 @@ class LunaProfessionalAssistant:
             return "I couldn't quite catch that. Could you please speak a bit clearer?"
         except sr.RequestError as e:
             self.is_listening = False
-            logger.error(f"Speech recognition service error: {e}")
+            logger.error("Speech recognition service error: %s", e)
             return "I'm having trouble with speech recognition. Please try again."
         except Exception as e:
             self.is_listening = False
-            logger.error(f"Unexpected voice input error: {e}")
+            logger.error("Unexpected voice input error: %s", e)
             return "There was an unexpected issue with voice input. Please try again."
     
     def generate_ai_response(self, user_message):
         """Generate AI response using Gemini with better error handling"""
+        crisis_reply = handle_crisis_message(
+            self, 'professional', user_message,
+            lambda: self.get_professional_prompt(user_message, self.professional_context))
+        if crisis_reply:
+            return crisis_reply
+        
         if not model:
-            return "I'm experiencing some technical difficulties with my AI processing, but I'm still here to support you. What specific workplace challenge are you facing today?"
+            return local_fallback('professional', user_message, 'model_unavailable')[0]
         
         try:
             self.update_professional_context(user_message)
-            prompt = self.get_professional_prompt(user_message, self.professional_context)
+            ai_message = generate_chat_content(
+                self, 'professional', 'chat', user_message, self.professional_context, len(self.conversation_history),
+                lambda: self.get_professional_prompt(user_message, self.professional_context))
             
-            response = model.generate_content(prompt)
-            ai_message = response.text.strip()
-            
-            self.conversation_history.append({
-                'user': user_message,
-                'assistant': ai_message,
-                'timestamp': datetime.now().isoformat()
-            })
+            record_turn(self, 'professional', records.Turn(user_message, ai_message))
             
-            logger.info(f"Luna response generated: {ai_message[:100]}...")
+            response_logger.info("Luna response generated: %.100s...", ai_message)
             return ai_message
             
         except Exception as e:
-            logger.error(f"AI generation error: {e}")
-            return f"I'm having some technical difficulties, but I want you to know I'm here to support your professional wellness journey. Could you tell me more about what's challenging you at work today?"
+            logger.error("AI generation error: %s", e)
+            return local_fallback('professional', user_message, fallback_reason(e))[0]
     
+    @tracer.traced('professional.update_context')
     def update_professional_context(self, user_message):
         """Update professional context based on message analysis"""
         message_lower = user_message.lower()
@@ -583,29 +993,9 @@ class LunaProfessionalAssistant:
         elif any(indicator in message_lower for indicator in low_stress_indicators):
             self.professional_context['stress_level'] = 'moderate'
         
-        problem_keywords = {
-            'deadline': 'tight deadlines',
-            'overtime': 'excessive work hours', 
-            'workload': 'heavy workload',
-            'boss': 'management issues',
-            'manager': 'management issues',
-            'meeting': 'meeting overload',
-            'burnout': 'burnout symptoms',
-            'promotion': 'career advancement pressure',
-            'colleague': 'workplace relationships',
-            'team': 'team dynamics',
-            'project': 'project pressure',
-            'performance': 'performance anxiety',
-            'layoff': 'job security concerns',
-            'remote': 'remote work challenges',
-            'commute': 'work-life balance issues',
-            'client': 'client relationship stress',
-            'presentation': 'presentation anxiety'
-        }
-        
-        for keyword, problem in problem_keywords.items():
-            if keyword in message_lower and problem not in self.professional_context['work_problems']:
-                self.professional_context['work_problems'].append(problem)
+        for keyword, problem in PROFESSIONAL_PROBLEM_KEYWORDS.items():
+            if keyword in message_lower:
+                self.professional_context.add_label('work_problems', problem)
         
         positive_words = ['better', 'improved', 'relaxed', 'confident', 'motivated', 'accomplished']
         negative_words = ['frustrated', 'angry', 'sad', 'worried', 'anxious', 'depressed']
@@ -620,8 +1010,11 @@ class LunaProfessionalAssistant:
 # =================================================================================
 
 class CodeGentAssistant:
+    SHARED_STATE = ('conversation_history',)
+
     def __init__(self):
-        self.conversation_history = []
+        self.conversation_history = new_history()
+        self.session_lock = threading.RLock()
         self.supported_languages = {
             'python': {
                 'name': 'Python',
@@ -664,7 +1057,10 @@ class CodeGentAssistant:
                 ]
             }
         }
+        # One model chat per client conversation, keyed by its history (chat_sessions.ChatSessionPool)
+        self.chat_sessions = chat_session_factory.new_pool()
         
+    @tracer.traced('codegent.build_prompt')
     def get_codegent_prompt(self, user_message, language, conversation_history):
         """Generate a specialized prompt for CodeGent"""
         
@@ -720,6 +1116,7 @@ class CodeGentAssistant:
         """
         return base_prompt
     
+    @tracer.traced('codegent.extract_code')
     def extract_code_from_response(self, response_text):
         """Extract code blocks from the AI response"""
         import re
@@ -763,30 +1160,33 @@ class CodeGentAssistant:
     
     def generate_code_response(self, user_message, language, conversation_history):
         """Generate CodeGent response using Gemini"""
+        conversation_history = chat_sessions.normalize_history(conversation_history, user_message)
         if not model:
+            fallback_text, fallback_code = local_fallback('codegent', user_message, 'model_unavailable', language)
             return {
-                'response': "I'm having trouble connecting to my AI services right now. Here's a basic template for your request. Please check your internet connection and try again.",
-                'code': f"# {language.upper()} code template\n# Your code here...\nprint('Hello, CodeGent!')",
+                'response': fallback_text,
+                'code': fallback_code,
                 'language': language,
-                'has_code': True
+                'has_code': fallback_code is not None
             }
         
         try:
-            prompt = self.get_codegent_prompt(user_message, language, conversation_history)
-            response = model.generate_content(prompt)
-            ai_message = response.text.strip()
+            # Only first questions are cacheable - follow-ups depend on the conversation so far
+            cacheable = not conversation_history
+            ai_message = lookup_cached_response('codegent', language, user_message) if cacheable else None
+            if ai_message is None:
+                ai_message = generate_pooled_chat_content(
+                    self.chat_sessions, 'codegent', language, user_message, conversation_history,
+                    lambda: self.get_codegent_prompt(user_message, language, conversation_history))
+                if cacheable:
+                    response_cache.store('codegent', language, user_message, ai_message)
             
             # Extract code from response
             extracted_code = self.extract_code_from_response(ai_message)
             
             # Store conversation
-            self.conversation_history.append({
-                'user': user_message,
-                'assistant': ai_message,
-                'language': language,
-                'timestamp': datetime.now().isoformat(),
-                'has_code': extracted_code is not None
-            })
+            record_turn(self, 'codegent',
+                        records.Turn(user_message, ai_message, language=language, has_code=extracted_code is not None))
             
             return {
                 'response': ai_message,
@@ -796,14 +1196,14 @@ class CodeGentAssistant:
             }
             
         except Exception as e:
-            logger.error(f"CodeGent AI generation error: {e}")
-            fallback_response = f"I'm having trouble processing that request right now. However, I can help you with {language.upper()} programming! Try asking me about:\n\n- Writing specific functions or classes\n- Debugging code errors\n- Algorithm implementations\n- Best practices\n- Code optimization\n\nWhat specific {language.upper()} programming challenge can I help you with?"
+            logger.error("CodeGent AI generation error: %s", e)
+            fallback_text, fallback_code = local_fallback('codegent', user_message, fallback_reason(e), language)
             
             return {
-                'response': fallback_response,
-                'code': None,
+                'response': fallback_text,
+                'code': fallback_code,
                 'language': language,
-                'has_code': False
+                'has_code': fallback_code is not None
             }
 
 # Global assistant instances
@@ -886,6 +1286,13 @@ def serve_static(filename):
 # STUDENT API ROUTES
 # =================================================================================
 
+def wants_full_context(data, assistant):
+    """Send the whole context when asked or when the client's copy is out of date"""
+    if data.get('full_context'):
+        return True
+    client_version = data.get('context_version')
+    return client_version is not None and client_version != assistant.context_version
+
 @app.route('/api/student/start-conversation', methods=['POST'])
 def start_student_conversation():
     """Initialize student conversation"""
@@ -920,10 +1327,9 @@ def start_student_conversation():
         """
         
         try:
-            response = model.generate_content(welcome_prompt)
-            welcome_message = response.text.strip()
+            welcome_message = generate_model_content(welcome_prompt, 'student', 'welcome')
         except Exception as e:
-            logger.error(f"Welcome message generation error: {e}")
+            logger.error("Welcome message generation error: %s", e)
     
     return jsonify({
         'success': True,
@@ -945,7 +1351,7 @@ def listen_to_student():
         })
         
     except Exception as e:
-        logger.error(f"Voice input error: {e}")
+        logger.error("Voice input error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to capture voice input',
@@ -967,23 +1373,30 @@ def respond_to_student():
                 'error': 'No message provided'
             })
         
+        full_context = wants_full_context(data, voice_assistant)
         ai_response = voice_assistant.generate_ai_response(user_message)
+        context_version, context_changes, context_removed = context_delta(
+            voice_assistant, 'student', voice_assistant.student_context, full=full_context)
         
         # For cloud deployment, always use browser TTS
         voice_response = "use_browser_tts" if enable_voice else None
         
-        return jsonify({
-            'success': True,
-            'response': ai_response,
-            'voice_response': voice_response,
-            'has_voice': voice_response is not None,
-            'use_browser_tts': True,  # Always use browser TTS in cloud
-            'conversation_count': len(voice_assistant.conversation_history),
-            'student_context': voice_assistant.student_context
-        })
+        with tracer.span('serialize'):
+            return jsonify({
+                'success': True,
+                'response': ai_response,
+                'voice_response': voice_response,
+                'has_voice': voice_response is not None,
+                'use_browser_tts': True,  # Always use browser TTS in cloud
+                'crisis_support': crisis.is_resource_response(ai_response),
+                'conversation_count': len(voice_assistant.conversation_history),
+                'student_context': context_changes,
+                'context_version': context_version,
+                'context_removed': context_removed
+            })
         
     except Exception as e:
-        logger.error(f"Response generation error: {e}")
+        logger.error("Response generation error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to generate response',
@@ -1009,7 +1422,7 @@ def speak_text_student():
                 engine.say(text)
                 engine.runAndWait()
             except Exception as e:
-                logger.error(f"TTS error: {e}")
+                logger.error("TTS error: %s", e)
         
         thread = threading.Thread(target=speak_async)
         thread.daemon = True
@@ -1021,7 +1434,7 @@ def speak_text_student():
         })
         
     except Exception as e:
-        logger.error(f"TTS error: {e}")
+        logger.error("TTS error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to speak text'
@@ -1061,10 +1474,9 @@ def start_parent_conversation():
         """
         
         try:
-            response = model.generate_content(welcome_prompt)
-            welcome_message = response.text.strip()
+            welcome_message = generate_model_content(welcome_prompt, 'parent', 'welcome')
         except Exception as e:
-            logger.error(f"Welcome message error: {e}")
+            logger.error("Welcome message error: %s", e)
     
     return jsonify({
         'success': True,
@@ -1084,7 +1496,7 @@ def listen_to_parent():
         })
         
     except Exception as e:
-        logger.error(f"Parent voice input error: {e}")
+        logger.error("Parent voice input error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to capture voice input',
@@ -1106,30 +1518,116 @@ def respond_to_parent():
                 'error': 'No message provided'
             })
         
+        full_context = wants_full_context(data, parent_assistant)
         ai_response = parent_assistant.generate_ai_response(user_message)
+        context_version, context_changes, context_removed = context_delta(
+            parent_assistant, 'parent', parent_assistant.parent_context, full=full_context)
         
         # For cloud deployment, always use browser TTS
         voice_response = "use_browser_tts" if enable_voice else None
+        task_type = parent_assistant.detect_task_type(user_message)
         
-        return jsonify({
-            'success': True,
-            'response': ai_response,
-            'voice_response': voice_response,
-            'has_voice': voice_response is not None,
-            'use_browser_tts': True,  # Always use browser TTS in cloud
-            'task_type': parent_assistant.detect_task_type(user_message),
-            'conversation_count': len(parent_assistant.conversation_history),
-            'parent_context': parent_assistant.parent_context
-        })
+        with tracer.span('serialize'):
+            return jsonify({
+                'success': True,
+                'response': ai_response,
+                'voice_response': voice_response,
+                'has_voice': voice_response is not None,
+                'use_browser_tts': True,  # Always use browser TTS in cloud
+                'task_type': task_type,
+                'crisis_support': crisis.is_resource_response(ai_response),
+                'conversation_count': len(parent_assistant.conversation_history),
+                'parent_context': context_changes,
+                'context_version': context_version,
+                'context_removed': context_removed
+            })
         
     except Exception as e:
-        logger.error(f"Parent response generation error: {e}")
+        logger.error("Parent response generation error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to generate response',
             'response': "I'm here to help you with parenting tasks!"
         })
 
+def todo_list_response(status=200):
+    """Return the parent todo list along with the usual context delta fields"""
+    context_version, context_changes, context_removed = context_delta(
+        parent_assistant, 'parent', parent_assistant.parent_context)
+    return jsonify({
+        'success': True,
+        'todo_list': parent_assistant.parent_context['todo_list'],
+        'parent_context': context_changes,
+        'context_version': context_version,
+        'context_removed': context_removed
+    }), status
+
+@app.route('/api/parent/todos', methods=['GET'])
+def get_parent_todos():
+    """Get the structured todo list for the parent session"""
+    return todo_list_response()
+
+@app.route('/api/parent/todos', methods=['POST'])
+def add_parent_todo():
+    """Add a task to the parent todo list"""
+    data = request.get_json(silent=True) or {}
+    text = str(data.get('text', '')).strip()
+    if not text:
+        return jsonify({'success': False, 'error': 'Task text is required'}), 400
+    time_value = None
+    if data.get('time'):
+        time_value = todos.normalize_time(str(data['time']))
+        if time_value is None:
+            return jsonify({'success': False, 'error': 'time must look like 7:30 AM'}), 400
+    parent_assistant.parent_context['todo_list'].append(
+        parent_assistant.new_todo_item(text, time_value, bool(data.get('done', False))))
+    parent_assistant.parent_context.touch('todo_list')
+    return todo_list_response(201)
+
+@app.route('/api/parent/todos/<int:item_id>', methods=['PATCH'])
+def update_parent_todo(item_id):
+    """Check off, rename or reschedule a task"""
+    item = parent_assistant.find_todo_item(item_id)
+    if item is None:
+        return jsonify({'success': False, 'error': 'Task not found'}), 404
+    data = request.get_json(silent=True) or {}
+    if 'text' in data:
+        text = str(data['text']).strip()
+        if not text:
+            return jsonify({'success': False, 'error': 'Task text cannot be empty'}), 400
+        item['text'] = text
+    if 'time' in data:
+        time_value = todos.normalize_time(str(data['time'])) if data['time'] else None
+        if data['time'] and time_value is None:
+            return jsonify({'success': False, 'error': 'time must look like 7:30 AM'}), 400
+        item['time'] = time_value
+    if 'done' in data:
+        item['done'] = bool(data['done'])
+    parent_assistant.parent_context.touch('todo_list')
+    return todo_list_response()
+
+@app.route('/api/parent/todos/<int:item_id>', methods=['DELETE'])
+def delete_parent_todo(item_id):
+    """Remove a task from the todo list"""
+    item = parent_assistant.find_todo_item(item_id)
+    if item is None:
+        return jsonify({'success': False, 'error': 'Task not found'}), 404
+    parent_assistant.parent_context['todo_list'].remove(item)
+    parent_assistant.parent_context.touch('todo_list')
+    return todo_list_response()
+
+@app.route('/api/parent/todos/order', methods=['PUT'])
+def reorder_parent_todos():
+    """Reorder the todo list; body is {"order": [item ids]} covering every task"""
+    data = request.get_json(silent=True) or {}
+    order = data.get('order')
+    items = {item['id']: item for item in parent_assistant.parent_context['todo_list']}
+    if (not isinstance(order, list) or not all(isinstance(item_id, int) for item_id in order)
+            or sorted(order) != sorted(items)):
+        return jsonify({'success': False, 'error': 'order must list every task id exactly once'}), 400
+    parent_assistant.parent_context['todo_list'] = [items[item_id] for item_id in order]
+    return todo_list_response()
+
 @app.route('/api/professional/workplace-support', methods=['POST'])
 def start_workplace_session():
     """Initialize a new professional wellness session with Luna"""
@@ -1166,10 +1664,9 @@ def start_workplace_session():
         """
         
         try:
-            response = model.generate_content(welcome_prompt)
-            welcome_message = response.text.strip()
+            welcome_message = generate_model_content(welcome_prompt, 'professional', 'welcome')
         except Exception as e:
-            logger.error(f"Welcome message generation error: {e}")
+            logger.error("Welcome message generation error: %s", e)
     
     return jsonify({
         'success': True,
@@ -1190,7 +1687,7 @@ def listen_to_professional():
         })
         
     except Exception as e:
-        logger.error(f"Professional voice input error: {e}")
+        logger.error("Professional voice input error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to capture voice input',
@@ -1212,24 +1709,31 @@ def respond_to_professional():
                 'error': 'No message provided'
             })
         
+        full_context = wants_full_context(data, luna_assistant)
         ai_response = luna_assistant.generate_ai_response(user_message)
+        context_version, context_changes, context_removed = context_delta(
+            luna_assistant, 'professional', luna_assistant.professional_context, full=full_context)
         
         # For cloud deployment, always use browser TTS
         voice_response = "use_browser_tts" if enable_voice else None
         
-        return jsonify({
-            'success': True,
-            'response': ai_response,
-            'voice_response': voice_response,
-            'has_voice': voice_response is not None,
-            'use_browser_tts': True,  # Always use browser TTS in cloud
-            'conversation_count': len(luna_assistant.conversation_history),
-            'professional_context': luna_assistant.professional_context,
-            'timestamp': datetime.now().isoformat()
-        })
+        with tracer.span('serialize'):
+            return jsonify({
+                'success': True,
+                'response': ai_response,
+                'voice_response': voice_response,
+                'has_voice': voice_response is not None,
+                'use_browser_tts': True,  # Always use browser TTS in cloud
+                'crisis_support': crisis.is_resource_response(ai_response),
+                'conversation_count': len(luna_assistant.conversation_history),
+                'professional_context': context_changes,
+                'context_version': context_version,
+                'context_removed': context_removed,
+                'timestamp': datetime.now().isoformat()
+            })
         
     except Exception as e:
-        logger.error(f"Response generation error: {e}")
+        logger.error("Response generation error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to generate response',
@@ -1262,7 +1766,7 @@ def start_codegent():
         })
         
     except Exception as e:
-        logger.error(f"CodeGent start error: {e}")
+        logger.error("CodeGent start error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to start CodeGent session'
@@ -1302,18 +1806,18 @@ def codegent_respond():
             conversation_history
         )
         
-        return jsonify({
-            'success': True,
-            'response': result['response'],
-            'code': result['code'],
-            'language': result['language'],
-            'has_code': result['has_code'],
-            'conversation_count': len(codegent_assistant.conversation_history)
-        })
+        with tracer.span('serialize'):
+            return jsonify({
+                'success': True,
+                'response': result['response'],
+                'code': result['code'],
+                'language': result['language'],
+                'has_code': result['has_code'],
+                'conversation_count': len(codegent_assistant.conversation_history)
+            })
         
     except Exception as e:
-        logger.error(f"CodeGent response error: {e}")
-        logger.error(traceback.format_exc())
+        logger.error("CodeGent response error: %s", e, exc_info=True)
         return jsonify({
             'success': False,
             'error': 'Failed to generate response',
@@ -1341,7 +1845,7 @@ def get_code_examples(language):
         })
         
     except Exception as e:
-        logger.error(f"Examples error: {e}")
+        logger.error("Examples error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to get examples'
@@ -1365,7 +1869,7 @@ def get_supported_languages():
         })
         
     except Exception as e:
-        logger.error(f"Languages error: {e}")
+        logger.error("Languages error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to get supported languages'
@@ -1376,7 +1880,8 @@ def clear_codegent_history():
     """Clear CodeGent conversation history"""
     try:
         global codegent_assistant
-        codegent_assistant.conversation_history = []
+        codegent_assistant.conversation_history = new_history()
+        codegent_assistant.chat_sessions.clear()
         
         return jsonify({
             'success': True,
@@ -1384,12 +1889,141 @@ def clear_codegent_history():
         })
         
     except Exception as e:
-        logger.error(f"Clear history error: {e}")
+        logger.error("Clear history error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to clear history'
         })
 
+# =================================================================================
+# BATCH API ROUTES
+# =================================================================================
+
+# Shared pool for independent CodeGent batch items; its size caps concurrent model calls
+BATCH_MAX_MESSAGES = int(os.getenv('BATCH_MAX_MESSAGES', '20'))
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_CONCURRENCY', '4')),
+                                    thread_name_prefix='batch-respond')
+
+CHAT_BATCH_SERVICES = ('student', 'parent', 'professional')
+
+def batch_item_error(item, language=None):
+    """Why a batch item cannot be answered, or None; language is only checked for CodeGent items"""
+    message = item.get('message')
+    if message is not None and not isinstance(message, str):
+        return 'message must be a string'
+    if not message or not message.strip():
+        return 'No message provided'
+    if language is None:
+        return None
+    if not isinstance(language, str):
+        return 'language must be a string'
+    if language not in codegent_assistant.supported_languages:
+        return f'Unsupported language: {language}'
+    history = item.get('conversation_history')
+    if history is not None and not isinstance(history, list):
+        return 'conversation_history must be a list'
+    return None
+
+def run_codegent_chain(chain, default_language, shed=False):
+    """Answer a chain of CodeGent requests in order, feeding each answer into the next request's history
+
+    Runs on batch_executor in a copied context; shed carries the request's load-shedding decision.
+    """
+    shedding_model_calls.set(shed)
+    results = []
+    history = None
+    for item in chain:
+        language = item.get('language') or default_language
+        error = batch_item_error(item, language)
+        if error:
+            results.append({'success': False, 'error': error})
+            history = None
+            continue
+        message = item['message'].strip()
+        if history is None or not item.get('follows_previous'):
+            history = list(item.get('conversation_history') or [])
+        result = codegent_assistant.generate_code_response(message, language, history)
+        results.append({'success': True, **result})
+        history = history + [{'user': message, 'assistant': result['response']}]
+    return results
+
+def codegent_batch(data, items):
+    """Run independent CodeGent requests concurrently and follows_previous chains in order"""
+    chains = []
+    for item in items:
+        if item.get('follows_previous') and chains:
+            chains[-1].append(item)
+        else:
+            chains.append([item])
+    
+    default_language = data.get('language', '')
+    # Each task gets its own context copy so spans attach to this request's trace
+    shed = model_calls_shed()
+    futures = [batch_executor.submit(contextvars.copy_context().run, run_codegent_chain, chain, default_language, shed)
+               for chain in chains]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return {'conversation_count': len(codegent_assistant.conversation_history), 'results': results}
+
+def chat_batch(service, data, items):
+    """Answer turns of one conversation in order - each turn depends on the context left by the last"""
+    assistant = get_service_assistant(service)
+    full_context = wants_full_context(data, assistant)
+    results = []
+    for item in items:
+        error = batch_item_error(item)
+        if error:
+            results.append({'success': False, 'error': error})
+            continue
+        message = item['message'].strip()
+        ai_response = assistant.generate_ai_response(message)
+        result = {'success': True, 'response': ai_response, 'crisis_support': crisis.is_resource_response(ai_response)}
+        if service == 'parent':
+            result['task_type'] = assistant.detect_task_type(message)
+        results.append(result)
+    
+    context_attr = HISTORY_CONTEXT_ATTRS[service]
+    context_version, context_changes, context_removed = context_delta(
+        assistant, service, getattr(assistant, context_attr), full=full_context)
+    return {
+        'conversation_count': len(assistant.conversation_history),
+        context_attr: context_changes,
+        'context_version': context_version,
+        'context_removed': context_removed,
+        'results': results
+    }
+
+@app.route('/api/<service>/respond-batch', methods=['POST'])
+def respond_batch(service):
+    """Answer several queued messages in one round trip
+    
+    Body: {"messages": ["...", {"message": "..."}]}. CodeGent items may also carry
+    language, conversation_history and follows_previous.
+    """
+    if service not in CHAT_BATCH_SERVICES and service != 'codegent':
+        return jsonify({'success': False, 'error': f'Unknown service: {service}'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    messages = data.get('messages')
+    if not isinstance(messages, list) or not messages:
+        return jsonify({'success': False, 'error': 'messages must be a non-empty list'}), 400
+    if len(messages) > BATCH_MAX_MESSAGES:
+        return jsonify({'success': False, 'error': f'At most {BATCH_MAX_MESSAGES} messages per batch'}), 400
+    items = [item if isinstance(item, dict) else {'message': item} for item in messages]
+    
+    try:
+        if service == 'codegent':
+            payload = codegent_batch(data, items)
+        else:
+            payload = chat_batch(service, data, items)
+    except Exception as e:
+        logger.error("Batch response error for %s: %s", service, e, exc_info=True)
+        return jsonify({'success': False, 'error': 'Failed to generate responses'})
+    
+    with tracer.span('serialize'):
+        return jsonify({'success': True, **payload})
+
 # =================================================================================
 # ZEN MODE API ROUTES
 # =================================================================================
@@ -1411,7 +2045,7 @@ def start_zen_session():
         })
         
     except Exception as e:
-        logger.error(f"Zen session error: {e}")
+        logger.error("Zen session error: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to start zen session'
@@ -1421,6 +2055,45 @@ def start_zen_session():
 # HEALTH CHECK AND UTILITY ROUTES
 # =================================================================================
 
+def probe_gemini():
+    """Smallest useful Gemini call - proves the key, network path and model are working"""
+    response = model.generate_content(upstream_probe.PROBE_PROMPT, generation_config={'max_output_tokens': 8})
+    return response.text.strip()
+
+def record_probe(result, seconds):
+    metrics.registry.observe('freespace_upstream_probe_seconds', seconds)
+    metrics.registry.inc('freespace_upstream_probes_total', outcome='success' if result['reachable'] else 'error')
+
+# Background Gemini probe behind /api/test-gemini and readiness (UPSTREAM_PROBE_INTERVAL=0 disables)
+# Started per worker by the launcher or __main__, so a preloading master does not probe too
+upstream_prober = upstream_probe.create_prober_from_env(probe_gemini, on_result=record_probe) if model else None
+
+def readiness_problems():
+    """Reasons this node should not get new traffic right now; empty when ready"""
+    problems = []
+    if model is None:
+        problems.append('ai_model_unavailable')
+    elif upstream_prober is not None and upstream_prober.enabled:
+        upstream_prober.ensure_started()
+        if not upstream_prober.ready():
+            problems.append('upstream_unavailable')
+    # Shedding is deliberately not a problem: pulling a shedding node out of rotation only moves its load
+    return problems
+
+def upstream_status():
+    """The last probe result, or None when probing is disabled"""
+    if upstream_prober is None or not upstream_prober.enabled:
+        return None
+    upstream_prober.ensure_started()
+    result = upstream_prober.result
+    return {
+        'reachable': result['reachable'],
+        'latency_ms': result['latency_ms'],
+        'checked_at': datetime.fromtimestamp(result['checked_at']).isoformat() if result['checked_at'] else None,
+        'consecutive_failures': result['consecutive_failures'],
+        'error': result['error']
+    }
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -1428,8 +2101,11 @@ def health_check():
         'success': True,
         'service': 'FreeSpace Unified AI Mental Wellness Platform',
         'status': 'healthy',
+        'ready': not readiness_problems(),
         'components': {
             'ai_model': model is not None,
+            'upstream': upstream_status(),
+            'load_shedding': admission_controller.enabled and admission_controller.overloaded(),
             'speech_recognition': recognizer is not None,
             'text_to_speech': tts_engine is not None
         },
@@ -1437,41 +2113,142 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness - the process is up and serving requests, whatever the upstream state"""
+    return jsonify({
+        'success': True,
+        'status': 'alive'
+    })
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness - 503 while Gemini is down or browning out"""
+    problems = readiness_problems()
+    if problems:
+        return jsonify({
+            'success': False,
+            'status': 'not_ready',
+            'reasons': problems
+        }), 503
+    return jsonify({
+        'success': True,
+        'status': 'ready'
+    })
+
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+
+HISTORY_CONTEXT_ATTRS = {
+    'student': 'student_context',
+    'parent': 'parent_context',
+    'professional': 'professional_context',
+    'codegent': None
+}
+
+def get_service_assistant(service):
+    """Return the live assistant instance for a service name"""
+    return {
+        'student': voice_assistant,
+        'parent': parent_assistant,
+        'professional': luna_assistant,
+        'codegent': codegent_assistant
+    }.get(service)
+
+def history_etag(service, assistant, limit, before, after):
+    """Cheap weak validator for one page of a history resource
+
+    Changes whenever a turn is added or changed or the context changes, and differs between pages.
+    """
+    context_attr = HISTORY_CONTEXT_ATTRS[service]
+    context = getattr(assistant, context_attr) if context_attr else None
+    session_start = context['session_start'] if context is not None else ''
+    version = context.version if context is not None else 0
+    history = assistant.conversation_history
+    return (f"{service}-{session_start}-{id(history)}-{history.base}-{history.revision}-{version}"
+            f"-{limit}-{before}-{after}")
+
+def parse_turn_id(value):
+    """Parse an optional before/after cursor; turn IDs are never negative"""
+    if value is None or value == '':
+        return None
+    turn_id = int(value)
+    if turn_id < 0:
+        raise ValueError(value)
+    return turn_id
+
 @app.route('/api/conversation-history/<service>', methods=['GET'])
 def get_conversation_history(service):
-    """Get current conversation history for a specific service"""
-    if service == 'student':
-        return jsonify({
-            'success': True,
-            'history': voice_assistant.conversation_history,
-            'context': voice_assistant.student_context,
-            'total_messages': len(voice_assistant.conversation_history)
-        })
-    elif service == 'parent':
-        return jsonify({
-            'success': True,
-            'history': parent_assistant.conversation_history,
-            'context': parent_assistant.parent_context,
-            'total_messages': len(parent_assistant.conversation_history)
-        })
-    elif service == 'professional':
+    """Get a page of conversation history for a specific service
+    
+    Query parameters:
+    - limit: page size (default 50, max 200)
+    - before: only turns with turn_id < before (newest page first when omitted)
+    - after: only turns with turn_id > after
+    - count_only: return just the total number of turns
+    """
+    assistant = get_service_assistant(service)
+    if assistant is None:
         return jsonify({
-            'success': True,
-            'history': luna_assistant.conversation_history,
-            'context': luna_assistant.professional_context,
-            'total_messages': len(luna_assistant.conversation_history)
+            'success': False,
+            'error': 'Invalid service specified'
         })
-    elif service == 'codegent':
+    
+    history = assistant.conversation_history
+    total = history.base + len(history)
+    
+    if request.args.get('count_only') in ('1', 'true'):
         return jsonify({
             'success': True,
-            'history': codegent_assistant.conversation_history,
-            'total_messages': len(codegent_assistant.conversation_history)
+            'total_messages': total
         })
-    else:
+    
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_DEFAULT_LIMIT)), 1), HISTORY_MAX_LIMIT)
+        before = parse_turn_id(request.args.get('before'))
+        after = parse_turn_id(request.args.get('after'))
+    except ValueError:
         return jsonify({
             'success': False,
-            'error': 'Invalid service specified'
-        })
+            'error': 'limit must be an integer, before and after non-negative integers'
+        }), 400
+    
+    etag = history_etag(service, assistant, limit, before, after)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    # Turn IDs are base + position; turns below base were trimmed under memory pressure
+    with assistant.session_lock:
+        base = history.base
+        total = base + len(history)
+        if after is not None:
+            start = max(after + 1, base)
+            end = min(start + limit, total if before is None else min(before, total))
+        else:
+            end = total if before is None else min(before, total)
+            start = max(end - limit, base)
+        page = [dict(history[turn_id - base].to_dict(), turn_id=turn_id) for turn_id in range(start, max(start, end))]
+    
+    payload = {
+        'success': True,
+        'history': page,
+        'total_messages': total,
+        'has_more_before': start > base,
+        'has_more_after': end < total,
+        'before_cursor': start if start > base else None,
+        'after_cursor': end - 1 if end < total else None
+    }
+    context_attr = HISTORY_CONTEXT_ATTRS[service]
+    if context_attr:
+        payload['context'] = getattr(assistant, context_attr)
+        payload['context_version'] = assistant.context_version
+    
+    response = jsonify(payload)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/test-gemini', methods=['GET'])
 def test_gemini_api():
@@ -1483,30 +2260,727 @@ def test_gemini_api():
             'api_key_present': bool(GEMINI_API_KEY and GEMINI_API_KEY != "dummy_key_for_testing")
         })
     
-    try:
-        # Simple test prompt
-        test_prompt = "Say 'Hello, FreeSpace API is working!' in a friendly way."
-        response = model.generate_content(test_prompt)
-        
+    # Served from the background probe - polling this endpoint never calls Gemini
+    status = upstream_status()
+    if status is None:
         return jsonify({
-            'success': True,
-            'message': 'Gemini API is working correctly',
-            'test_response': response.text.strip(),
-            'api_key_status': 'valid'
+            'success': False,
+            'status': 'disabled',
+            'error': 'Gemini probing is disabled (UPSTREAM_PROBE_INTERVAL=0)',
+            'api_key_present': bool(GEMINI_API_KEY and GEMINI_API_KEY != "dummy_key_for_testing")
         })
-        
-    except Exception as e:
+    if status['reachable'] is None:
         return jsonify({
             'success': False,
-            'error': f'Gemini API error: {str(e)}',
+            'status': 'pending',
+            'error': 'Gemini probe has not completed yet',
             'api_key_present': bool(GEMINI_API_KEY and GEMINI_API_KEY != "dummy_key_for_testing")
         })
+    
+    if not status['reachable']:
+        return jsonify({
+            'success': False,
+            'error': f"Gemini API error: {status['error']}",
+            'api_key_present': bool(GEMINI_API_KEY and GEMINI_API_KEY != "dummy_key_for_testing"),
+            'upstream': status
+        })
+    
+    return jsonify({
+        'success': True,
+        'message': 'Gemini API is working correctly',
+        'test_response': upstream_prober.result['sample'],
+        'api_key_status': 'valid',
+        'upstream': status
+    })
+
+# =================================================================================
+# METRICS AND TRACING
+# =================================================================================
+
+PERSONA_ROUTE_PREFIXES = {
+    'student': 'student',
+    'parent': 'parent',
+    'professional': 'professional',
+    'codegent': 'codegent',
+    'zenmode': 'zenmode'
+}
+
+def persona_for_path(path):
+    """Map an /api/<persona>/... path to its persona label"""
+    parts = path.split('/', 3)
+    if len(parts) > 2 and parts[1] == 'api':
+        return PERSONA_ROUTE_PREFIXES.get(parts[2], 'none')
+    return 'none'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.trace_id = tracing.trace_id_from_headers(request.headers) or tracing.new_trace_id()
+    g.trace_span = tracer.start_trace(f"{request.method} {request.path}", trace_id=g.trace_id,
+                                      attributes={'http.method': request.method, 'http.path': request.path})
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {
+            'route': route,
+            'persona': persona_for_path(request.path),
+            'status': str(response.status_code)
+        }
+        metrics.registry.observe('freespace_http_request_duration_seconds', time.perf_counter() - start, **labels)
+        metrics.registry.inc('freespace_http_requests_total', **labels)
+
+    trace_id = g.get('trace_id')
+    if trace_id:
+        response.headers[tracing.TRACE_HEADER] = trace_id
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.set_attribute('http.status_code', response.status_code)
+        tracer.end_trace(span)
+    return response
+
+@app.teardown_request
+def end_unfinished_trace(error):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.status = 'error'
+        tracer.end_trace(span)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Expose counters and histograms in Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+# =================================================================================
+# CLUSTER ROUTING
+# =================================================================================
+
+# Consistent-hash affinity of persona state to one node (unset CLUSTER_NODES for a single node)
+cluster_router = session_router.create_router_from_env()
+
+def session_service():
+    """Service whose assistant state the current request reads or writes, or None"""
+    service = (request.view_args or {}).get('service') or persona_for_path(request.path)
+    return service if service in HISTORY_CONTEXT_ATTRS else None
+
+def request_target():
+    """Path and query string as forwarded and signed between cluster nodes"""
+    return request.full_path if request.query_string else request.path
+
+def from_cluster_node():
+    """True when another cluster node forwarded and signed the current request"""
+    if cluster_router is None:
+        return False
+    if 'cluster_request' not in g:
+        g.cluster_request = cluster_router.is_cluster_request(request.method, request_target(), request.headers,
+                                                              request.get_data())
+    return g.cluster_request
+
+def client_address():
+    """Remote address of the client, looking through a forwarding cluster node"""
+    if from_cluster_node():
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        return forwarded.rsplit(',', 1)[-1].strip() or request.remote_addr
+    return request.remote_addr
+
+@app.before_request
+def route_to_session_owner():
+    """Proxy requests for a persona owned by another node; serve locally if the owner is unreachable"""
+    if cluster_router is None or from_cluster_node():
+        return None
+    service = session_service()
+    if service is None or cluster_router.is_local(service):
+        return None
+    owner = cluster_router.owner(service)
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    headers = [(name, value) for name, value in request.headers.items() if name.lower() != 'x-forwarded-for']
+    headers.append(('X-Forwarded-For', f"{forwarded_for}, {request.remote_addr}" if forwarded_for
+                    else request.remote_addr or ''))
+    try:
+        status, response_headers, body = cluster_router.forward(owner, request.method, request_target(), headers,
+                                                                request.get_data())
+    except session_router.ForwardError as e:
+        metrics.registry.inc('freespace_cluster_forwards_total', persona=service, result='error')
+        logger.error("Session owner unreachable, serving %s locally: %s", service, e)
+        return None
+    metrics.registry.inc('freespace_cluster_forwards_total', persona=service, result='ok')
+    g.forwarded_to = owner
+    # This node adds its own CORS headers on the way out
+    response_headers = [(name, value) for name, value in response_headers
+                        if not name.lower().startswith('access-control-')]
+    return Response(body, status=status, headers=response_headers)
+
+# =================================================================================
+# RATE LIMITING
+# =================================================================================
+
+# Reverse proxies in front of the app; ProxyFix takes the client IP from their X-Forwarded-For entries
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+# Per-client token buckets for routes that call the model (off unless RATE_LIMIT_PER_SECOND is set)
+rate_limiter = rate_limit.create_limiter_from_env()
+
+RATE_LIMITED_ENDPOINTS = frozenset([
+    'start_student_conversation', 'respond_to_student',
+    'start_parent_conversation', 'respond_to_parent',
+    'start_workplace_session', 'respond_to_professional',
+    'codegent_respond', 'respond_batch'
+])
+
+def rate_limit_key():
+    """Identify the client by IP address - never by a header the client could change on every request"""
+    return client_address() or 'unknown'
+
+@app.before_request
+def enforce_rate_limit():
+    if not rate_limiter.enabled or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+    cost = 1
+    if request.endpoint == 'respond_batch':
+        messages = (request.get_json(silent=True) or {}).get('messages')
+        cost = max(1, len(messages)) if isinstance(messages, list) else 1
+    allowed, retry_after = rate_limiter.acquire(rate_limit_key(), cost)
+    if allowed:
+        return None
+    metrics.registry.inc('freespace_rate_limited_total', persona=persona_for_path(request.path))
+    response = jsonify({
+        'success': False,
+        'error': 'Too many requests - please slow down',
+        'retry_after': retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+# =================================================================================
+# ADMISSION CONTROL
+# =================================================================================
+
+# Only these can be shed; student and professional turns always reach the model
+SHEDDABLE_ENDPOINTS = frozenset(['codegent_respond', 'respond_to_parent', 'respond_batch'])
+LOW_PRIORITY_PARENT_TASKS = frozenset(['bedtime_stories'])
+
+def is_low_priority_request():
+    """True for CodeGent and story requests without crisis language"""
+    if request.endpoint not in SHEDDABLE_ENDPOINTS:
+        return False
+    service = persona_for_path(request.path)
+    if service not in ('codegent', 'parent'):
+        return False
+    data = request.get_json(silent=True) or {}
+    if request.endpoint == 'respond_batch':
+        messages = data.get('messages')
+        if not isinstance(messages, list) or not messages:
+            return False
+        texts = [item.get('message', '') if isinstance(item, dict) else item for item in messages]
+    else:
+        texts = [data.get('message', '')]
+    texts = [text if isinstance(text, str) else '' for text in texts]
+    if any(crisis.detect(text) for text in texts):
+        return False
+    if service == 'codegent':
+        return True
+    return all(parent_assistant.detect_task_type(text) in LOW_PRIORITY_PARENT_TASKS for text in texts)
+
+@app.before_request
+def shed_low_priority_load():
+    """While Gemini is backed up, answer low-priority requests locally or turn them away with 503"""
+    if not admission_controller.enabled or not admission_controller.overloaded() or not is_low_priority_request():
+        return None
+    metrics.registry.inc('freespace_load_shed_total', persona=persona_for_path(request.path), mode=ADMISSION_SHED_MODE)
+    if ADMISSION_SHED_MODE == 'fallback':
+        g.shed_model_calls = True
+        return None
+    retry_after = admission_controller.retry_after()
+    response = jsonify({
+        'success': False,
+        'error': 'Service is busy - please try again shortly',
+        'retry_after': retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+# =================================================================================
+# SESSION SNAPSHOTS
+# =================================================================================
+
+# Live sessions are saved here at shutdown and restored lazily after the next boot (unset disables)
+SESSION_SNAPSHOT_PATH = os.getenv('SESSION_SNAPSHOT_PATH', '')
+session_snapshot = snapshots.open_snapshot(SESSION_SNAPSHOT_PATH)
+# Personas this process changed since boot - only those replace what other workers saved
+changed_services = set()
+
+def session_state(assistant):
+    return {attr: getattr(assistant, attr) for attr in assistant.SHARED_STATE}
+
+def restore_session_state(assistant, state):
+    for attr, value in state.items():
+        setattr(assistant, attr, value)
+
+@app.before_request
+def restore_session_snapshot():
+    """Restore a persona from the boot snapshot the first time a request needs it"""
+    service = session_service() if session_snapshot is not None else None
+    if service is None or service not in session_snapshot:
+        return None
+    try:
+        state = session_snapshot.take(service)
+    except (pickle.UnpicklingError, zlib.error, EOFError, AttributeError) as e:
+        logger.error("Failed to restore %s from session snapshot: %s", service, e)
+        return None
+    if state is None:
+        return None
+    if shared_session_cache is not None and shared_session_cache.version(service) is not None:
+        # Another worker restored it first or the session has moved on since
+        return None
+    restore_session_state(get_service_assistant(service), state)
+    publish_session(service)
+    logger.info("Restored %s session with %d turns from snapshot", service, len(state['conversation_history']))
+    return None
+
+@app.after_request
+def note_session_change(response):
+    service = session_service() if request.method != 'GET' else None
+    if service is not None:
+        changed_services.add(service)
+    return response
+
+def state_last_activity(state):
+    """Time of the newest turn, or of the session start for a session restarted since"""
+    history = state['conversation_history']
+    times = [history[-1].created] if history else [0.0]
+    for value in state.values():
+        if isinstance(value, records.ContextRecord) and 'session_start' in value:
+            times.append(value.session_start)
+    return max(times)
+
+def merged_session_states(saved):
+    """Sessions to save: this process's changes merged over what saved (the current snapshot) holds"""
+    states = {}
+    for service in HISTORY_CONTEXT_ATTRS:
+        if cluster_router is not None and not cluster_router.is_local(service):
+            continue
+        cached = shared_session_cache.get(service) if shared_session_cache is not None else None
+        previous = saved.take(service) if saved is not None else None
+        if cached is not None:
+            states[service] = cached[1]
+        elif service in changed_services:
+            # Without a shared cache every worker has its own copy; keep the one used most recently
+            state = session_state(get_service_assistant(service))
+            if previous is not None and state_last_activity(previous) > state_last_activity(state):
+                state = previous
+            states[service] = state
+        elif previous is not None:
+            # Not touched here - keep what another worker or the previous run saved
+            states[service] = previous
+    return states
+
+def save_session_snapshot():
+    """Merge the personas this node owns into SESSION_SNAPSHOT_PATH; runs at interpreter exit in every worker"""
+    if not changed_services and shared_session_cache is None:
+        # Nothing happened in this process (e.g. a pre-fork master) - keep the existing snapshot
+        return
+    start = time.perf_counter()
+    try:
+        with snapshots.snapshot_lock(SESSION_SNAPSHOT_PATH):
+            # Re-read under the lock - workers that exited earlier may have replaced the boot snapshot
+            saved = snapshots.open_snapshot(SESSION_SNAPSHOT_PATH)
+            try:
+                states = merged_session_states(saved)
+            finally:
+                if saved is not None:
+                    saved.close()
+            if not states:
+                return
+            size = snapshots.write_snapshot(SESSION_SNAPSHOT_PATH, states)
+    except (OSError, pickle.PicklingError, pickle.UnpicklingError, zlib.error, EOFError, AttributeError) as e:
+        logger.error("Failed to write session snapshot: %s", e)
+        return
+    logger.info("Saved %d sessions (%d bytes) to %s in %.3fs", len(states), size, SESSION_SNAPSHOT_PATH,
+                time.perf_counter() - start)
+
+if SESSION_SNAPSHOT_PATH:
+    atexit.register(save_session_snapshot)
+
+# =================================================================================
+# SHARED SESSION CACHE
+# =================================================================================
+
+# Keeps assistant state consistent across gunicorn workers on one host (unset SESSION_CACHE_PATH disables)
+shared_session_cache = session_cache.create_cache_from_env()
+
+# Conflicting writes from other workers to retry through before giving up on a publish
+SHARED_SESSION_ATTEMPTS = 5
+
+def mark_shared_sync(assistant, version, history, context):
+    """Remember the shared version the local state is based on, to tell local changes apart later"""
+    assistant.shared_version = version
+    assistant.shared_sync = (history, history.base + len(history), context,
+                             context.version if context is not None else 0)
+
+def merge_local_changes(assistant, service, state):
+    """Apply this worker's unpublished turns and context changes on top of a newer shared state"""
+    synced_history, synced_turns, synced_context, synced_context_version = assistant.shared_sync
+    local = assistant.conversation_history
+    merged = state['conversation_history']
+    start = max(synced_turns - local.base, 0)
+    # Crisis follow-ups are attached in place to turns both copies already have
+    follow_ups = {turn.created: turn.follow_up for turn in local[max(start - HISTORY_HOT_TURNS, 0):start]
+                  if turn.follow_up}
+    if follow_ups:
+        for turn in merged:
+            if turn.created in follow_ups and not turn.follow_up:
+                turn.follow_up = follow_ups[turn.created]
+                merged.touch()
+    for turn in local[start:]:
+        merged.append(turn)
+    context_attr = HISTORY_CONTEXT_ATTRS[service]
+    if context_attr:
+        local_context = getattr(assistant, context_attr)
+        if local_context is synced_context:
+            changed, removed = local_context.changes_since(synced_context_version)
+            target = state[context_attr]
+            target.update(changed)
+            for field in removed:
+                if field in target:
+                    del target[field]
+        else:
+            state[context_attr] = local_context
+    for attr in assistant.SHARED_STATE:
+        if attr not in ('context_version', context_attr) and isinstance(state[attr], int):
+            state[attr] = max(state[attr], getattr(assistant, attr))
+
+def adopt_shared_state(assistant, service, version, state):
+    """Take a newer shared state, keeping what this worker changed since its last sync"""
+    if getattr(assistant, 'shared_version', None) is not None:
+        if assistant.conversation_history is not assistant.shared_sync[0]:
+            # The history was replaced here (cleared or handed off); the next publish overwrites the shared copy
+            assistant.shared_version = version
+            return
+        history = state['conversation_history']
+        context_attr = HISTORY_CONTEXT_ATTRS[service]
+        context = state[context_attr] if context_attr else None
+        base = (history, history.base + len(history), context, context.version if context is not None else 0)
+        merge_local_changes(assistant, service, state)
+        assistant.shared_version, assistant.shared_sync = version, base
+        restore_session_state(assistant, state)
+        return
+    restore_session_state(assistant, state)
+    context_attr = HISTORY_CONTEXT_ATTRS[service]
+    mark_shared_sync(assistant, version, assistant.conversation_history,
+                     getattr(assistant, context_attr) if context_attr else None)
+
+def sync_shared_session(service, publish):
+    """Load state other workers published and, with publish, store ours with a compare-and-swap
+
+    Holding the session lock covers this worker's threads; the version check
+    covers other workers. A publish that finds the slot moved merges the
+    newer state in and tries again.
+    """
+    assistant = get_service_assistant(service)
+    context_attr = HISTORY_CONTEXT_ATTRS[service]
+    with assistant.session_lock:
+        for _ in range(SHARED_SESSION_ATTEMPTS):
+            cached = shared_session_cache.get(service, getattr(assistant, 'shared_version', None))
+            version = cached[0] if cached is not None else 0
+            if cached is not None and cached[1] is not None:
+                adopt_shared_state(assistant, service, version, cached[1])
+            if not publish:
+                return
+            published = shared_session_cache.put(service, session_state(assistant), expected_version=version)
+            if published is not None:
+                mark_shared_sync(assistant, published, assistant.conversation_history,
+                                 getattr(assistant, context_attr) if context_attr else None)
+                return
+    logger.error("Gave up publishing %s session state after %d conflicting writes", service,
+                 SHARED_SESSION_ATTEMPTS)
+
+def publish_session(service):
+    """Store a service's assistant state in the shared cache for the other workers"""
+    if shared_session_cache is None:
+        return
+    try:
+        sync_shared_session(service, publish=True)
+    except (OSError, ValueError, pickle.PicklingError, pickle.UnpicklingError) as e:
+        logger.error("Failed to publish %s session state: %s", service, e)
+
+@app.before_request
+def load_shared_session():
+    """Pick up state another worker published since this worker last saw it"""
+    service = session_service() if shared_session_cache is not None else None
+    if service is None:
+        return None
+    try:
+        sync_shared_session(service, publish=False)
+    except (OSError, ValueError, pickle.UnpicklingError) as e:
+        logger.error("Failed to load %s session state: %s", service, e)
+    return None
+
+@app.after_request
+def store_shared_session(response):
+    if shared_session_cache is not None and request.method != 'GET' and not g.get('forwarded_to'):
+        service = session_service()
+        if service is not None:
+            publish_session(service)
+    return response
+
+# =================================================================================
+# MEMORY PRESSURE
+# =================================================================================
+
+def last_activity(assistant):
+    history = assistant.conversation_history
+    return history[-1].created if history else 0.0
+
+def evict_cold_sessions(still_over_limit):
+    """Trim the least recently used personas to their prompt window until memory is back under the limit
+
+    Called by the worker memory watchdog. Prompts only read the newest
+    HISTORY_HOT_TURNS turns, so replies are unaffected; older turns leave
+    the history API (they remain in the write-behind store when
+    PERSIST_STORE is set). The kept turns keep their turn IDs.
+    """
+    evicted = 0
+    for service in sorted(HISTORY_CONTEXT_ATTRS, key=lambda name: last_activity(get_service_assistant(name))):
+        if not still_over_limit():
+            break
+        assistant = get_service_assistant(service)
+        history = assistant.conversation_history
+        pool = getattr(assistant, 'chat_sessions', None)
+        if (len(history) <= HISTORY_HOT_TURNS and getattr(assistant, 'chat_session', None) is None
+                and not pool):
+            continue
+        with assistant.session_lock:
+            dropped = history.trim(HISTORY_HOT_TURNS)
+            if hasattr(assistant, 'chat_session'):
+                assistant.chat_session = None
+            if pool:
+                pool.clear()
+        gc.collect()
+        evicted += 1
+        metrics.registry.inc('freespace_session_evictions_total', persona=service)
+        logger.info("Evicted %d cold %s turns under memory pressure", dropped, service)
+    return evicted
+
+# =================================================================================
+# ADMIN ROUTES
+# =================================================================================
+
+def is_admin_request():
+    """Check the X-Admin-Token header against ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/api/admin/profile', methods=['POST'])
+def profile_worker():
+    """Sample this worker for N seconds and return a flamegraph-compatible collapsed-stack file"""
+    if not is_admin_request():
+        return jsonify({
+            'success': False,
+            'error': 'Admin token required'
+        }), 403
+    
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'seconds must be a number'
+        }), 400
+    
+    try:
+        collapsed = profiler.profiler.profile(seconds)
+    except profiler.ProfilerBusyError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+    
+    logger.info("Profiled worker %s for %ss", os.getpid(), seconds)
+    return Response(collapsed, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{os.getpid()}-{int(time.time())}.collapsed'
+    })
+
+def handoff_state(assistant):
+    """Assistant state as plain JSON data for handing a persona to another node"""
+    state = {}
+    with assistant.session_lock:
+        for attr in assistant.SHARED_STATE:
+            value = getattr(assistant, attr)
+            if attr == 'conversation_history':
+                state['turn_id_base'] = value.base
+                value = [turn.to_dict() for turn in value]
+            elif isinstance(value, records.ContextRecord):
+                value = value.to_dict()
+            state[attr] = value
+    return state
+
+def restore_handoff_state(assistant, state):
+    """Rebuild assistant state from handoff_state() data; raises KeyError, TypeError or ValueError when malformed"""
+    history = new_history()
+    history.base = int(state.get('turn_id_base', 0))
+    for item in state['conversation_history']:
+        history.append(records.Turn.from_dict(item))
+    restored = {'conversation_history': history}
+    for attr in assistant.SHARED_STATE:
+        if attr == 'conversation_history' or attr == 'context_version':
+            continue
+        current = getattr(assistant, attr)
+        if isinstance(current, records.ContextRecord):
+            restored[attr] = type(current)(**state[attr])
+        elif isinstance(current, int):
+            restored[attr] = int(state[attr])
+        else:
+            raise TypeError(f"Cannot restore {attr} from a handoff")
+    # Version 0 makes the next response carry the whole context, whatever version the client last saw
+    restored['context_version'] = 0
+    with assistant.session_lock:
+        restore_session_state(assistant, restored)
+        if getattr(assistant, 'chat_session', None) is not None:
+            assistant.chat_session = None
+
+def apply_cluster_nodes(nodes):
+    """Switch to a new node list and hand every persona this node no longer owns to its new owner
+
+    Returns ({service: owner} handed off, {service: owner} that failed).
+    """
+    handed_off = {}
+    failed = {}
+    moved = cluster_router.set_nodes(nodes, HISTORY_CONTEXT_ATTRS)
+    for service, owner in moved.items():
+        payload = serialization.dumps_bytes(handoff_state(get_service_assistant(service)))
+        try:
+            status, _, _ = cluster_router.forward(owner, 'PUT', f'/api/cluster/sessions/{service}',
+                                                  [('Content-Type', 'application/json')], payload)
+        except session_router.ForwardError as e:
+            status = str(e)
+        if status == 200:
+            handed_off[service] = owner
+        else:
+            failed[service] = owner
+            logger.error("Handing %s off to %s failed: %s", service, owner, status)
+    logger.info("Cluster nodes now %s", ', '.join(nodes))
+    return handed_off, failed
+
+def cluster_nodes_from_request():
+    return session_router.parse_nodes(','.join((request.get_json(silent=True) or {}).get('nodes') or []))
+
+@app.route('/api/admin/cluster', methods=['GET', 'PUT'])
+def cluster_membership():
+    """Show or replace the node ring on every node; personas are handed to their new owners"""
+    if not is_admin_request():
+        return jsonify({
+            'success': False,
+            'error': 'Admin token required'
+        }), 403
+    if cluster_router is None:
+        return jsonify({
+            'success': False,
+            'error': 'Cluster routing is not configured'
+        }), 409
+    
+    handed_off = {}
+    failed = {}
+    peers = {}
+    if request.method == 'PUT':
+        nodes = cluster_nodes_from_request()
+        if cluster_router.self_node not in nodes:
+            return jsonify({
+                'success': False,
+                'error': f'nodes must include this node ({cluster_router.self_node})'
+            }), 400
+        previous_nodes = cluster_router.ring.nodes
+        handed_off, failed = apply_cluster_nodes(nodes)
+        # Old nodes hand off what they lose, new nodes learn the ring; nodes leaving are told too
+        body = serialization.dumps_bytes({'nodes': nodes})
+        for node in dict.fromkeys(previous_nodes + tuple(nodes)):
+            if node == cluster_router.self_node:
+                continue
+            try:
+                status, _, response_body = cluster_router.forward(
+                    node, 'PUT', '/api/cluster/membership', [('Content-Type', 'application/json')], body)
+                result = json.loads(response_body or b'{}')
+            except (session_router.ForwardError, ValueError) as e:
+                status, result = str(e), {}
+            peers[node] = 'ok' if status == 200 and result.get('success') else 'failed'
+            handed_off.update(result.get('handed_off') or {})
+            failed.update(result.get('failed') or {})
+            if peers[node] != 'ok':
+                logger.error("Updating cluster membership on %s failed: %s", node, status)
+    
+    return jsonify({
+        'success': not failed and all(result == 'ok' for result in peers.values()),
+        'self': cluster_router.self_node,
+        'nodes': list(cluster_router.ring.nodes),
+        'owners': {service: cluster_router.owner(service) for service in HISTORY_CONTEXT_ATTRS},
+        'handed_off': handed_off,
+        'failed': failed,
+        'peers': peers
+    })
+
+@app.route('/api/cluster/membership', methods=['PUT'])
+def receive_cluster_membership():
+    """Apply a node list passed on by the node that received PUT /api/admin/cluster"""
+    if not from_cluster_node():
+        return jsonify({
+            'success': False,
+            'error': 'Cluster signature required'
+        }), 403
+    nodes = cluster_nodes_from_request()
+    if not nodes:
+        return jsonify({
+            'success': False,
+            'error': 'nodes must not be empty'
+        }), 400
+    handed_off, failed = apply_cluster_nodes(nodes)
+    return jsonify({
+        'success': not failed,
+        'handed_off': handed_off,
+        'failed': failed
+    })
+
+@app.route('/api/cluster/sessions/<service>', methods=['PUT'])
+def receive_session_handoff(service):
+    """Take over a persona's assistant state from the node that owned it"""
+    if not from_cluster_node():
+        return jsonify({
+            'success': False,
+            'error': 'Cluster signature required'
+        }), 403
+    assistant = get_service_assistant(service)
+    if assistant is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown service'
+        }), 404
+    try:
+        restore_handoff_state(assistant, json.loads(request.get_data()))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        logger.error("Invalid %s session handoff: %s", service, e)
+        return jsonify({
+            'success': False,
+            'error': 'Invalid session state'
+        }), 400
+    logger.info("Took over %s session from %s", service, request.headers.get(session_router.FORWARDED_BY_HEADER))
+    return jsonify({
+        'success': True,
+        'service': service,
+        'turns': len(assistant.conversation_history)
+    })
 
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,traceparent,X-Trace-Id,X-Admin-Token,X-Session-Id')
+    response.headers.add('Access-Control-Expose-Headers', 'X-Trace-Id,ETag,Retry-After')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,PATCH,POST,DELETE,OPTIONS')
     return response
 
 # Run the app
@@ -1539,4 +3013,9 @@ if __name__ == '__main__':
     logger.info("🧘 Zen Mode available")
     logger.info(f"🌐 Server running on port {port}")
     
+    if upstream_prober is not None:
+        upstream_prober.ensure_started()
+    
+    # Exit normally on SIGTERM so the session snapshot and write-behind queue are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=debug_mode, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Per-worker memory watchdog.
+
+Every worker keeps assistant state and model client buffers in memory,
+and a worker that grows past the container's memory limit is OOM-killed
+mid-request, losing every in-flight conversation turn. MemoryWatchdog
+checks the worker's memory every `interval` seconds:
+
+    soft limit   call evict() so the app can drop cold session data
+    hard limit   call recycle(), which asks the server to replace this
+                 worker gracefully (in-flight requests finish, atexit
+                 hooks flush snapshots and the write-behind queue)
+
+Memory is measured as PSS (proportional set size). Pages a worker still
+shares copy-on-write with the preloaded master count only partly, so the
+workers' figures add up to what the container is actually charged. RSS
+is the fallback where smaps_rollup is not available.
+
+Environment:
+    WORKER_MEMORY_LIMIT_MB   hard limit per worker (default: 90% of the cgroup limit split across workers,
+                             0 disables the watchdog)
+    WORKER_MEMORY_SOFT_RATIO fraction of the hard limit where eviction starts (default 0.8)
+    WORKER_MEMORY_CHECK_SECONDS  seconds between checks (default 10)
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CGROUP_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+
+def current_memory():
+    """This process's PSS in bytes, falling back to RSS"""
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            for line in rollup:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def container_memory_limit():
+    """The cgroup memory limit in bytes, or None when unlimited or unknown"""
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as limit_file:
+                value = limit_file.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge number close to the max page-aligned int64
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+        return None
+    return None
+
+
+class MemoryWatchdog:
+    def __init__(self, hard_limit, soft_limit, evict=None, recycle=None, interval=10.0):
+        self.hard_limit = hard_limit
+        self.soft_limit = soft_limit
+        self.evict = evict
+        self.recycle = recycle
+        self.interval = interval
+        self._recycling = False
+
+    def over_soft_limit(self):
+        usage = current_memory()
+        return usage is not None and usage >= self.soft_limit
+
+    def check(self):
+        usage = current_memory()
+        if usage is None or self._recycling:
+            return
+        if usage >= self.hard_limit:
+            logger.warning("Worker %s at %.0f MB is over its %.0f MB limit, recycling it", os.getpid(),
+                           usage / 2 ** 20, self.hard_limit / 2 ** 20)
+            self._recycling = True
+            if self.recycle is not None:
+                self.recycle()
+        elif usage >= self.soft_limit and self.evict is not None:
+            logger.info("Worker %s at %.0f MB is over its %.0f MB soft limit, evicting cold sessions", os.getpid(),
+                        usage / 2 ** 20, self.soft_limit / 2 ** 20)
+            self.evict(self.over_soft_limit)
+
+    def _run(self):
+        while not self._recycling:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Memory watchdog check failed: %s", e)
+
+    def start(self):
+        threading.Thread(target=self._run, name='memory-watchdog', daemon=True).start()
+        return self
+
+
+def create_watchdog_from_env(evict=None, recycle=None, workers=1):
+    """Build the watchdog from WORKER_MEMORY_* or the cgroup limit, or None when there is no limit to keep under"""
+    limit_mb = os.environ.get('WORKER_MEMORY_LIMIT_MB')
+    if limit_mb is not None:
+        hard_limit = int(float(limit_mb) * 2 ** 20)
+    else:
+        container_limit = container_memory_limit()
+        hard_limit = int(container_limit * 0.9 / max(workers, 1)) if container_limit else 0
+    if hard_limit <= 0:
+        return None
+    soft_limit = int(hard_limit * float(os.environ.get('WORKER_MEMORY_SOFT_RATIO', '0.8')))
+    return MemoryWatchdog(hard_limit, soft_limit, evict=evict, recycle=recycle,
+                          interval=float(os.environ.get('WORKER_MEMORY_CHECK_SECONDS', '10')))
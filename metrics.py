@@ -0,0 +1,204 @@
+"""
+Lightweight in-process metrics for the FreeSpace platform.
+
+Counters and histograms are recorded into per-thread shards so request
+threads never contend on a lock when updating them. The shards are only
+merged when /metrics is scraped, where they are rendered in the Prometheus
+text exposition format. When a thread (or greenlet) finishes, its shard is
+folded into a shared total and dropped, so a server that starts a thread
+per request does not accumulate shards.
+"""
+import bisect
+import threading
+import weakref
+
+# Latency buckets in seconds - covers fast local work up to slow Gemini calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Size buckets in characters - prompts and responses range from a greeting to a long story
+SIZE_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+# Microsecond-scale buckets for in-process checks such as crisis detection
+MICRO_BUCKETS = (1e-06, 5e-06, 1e-05, 2.5e-05, 5e-05, 0.0001, 0.00025, 0.001)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _ShardHolder:
+    """Lives in the thread-local storage; it is released when its thread ends"""
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+def _merge_into(merged, shard):
+    """Add every series in shard to merged"""
+    for key, value in list(shard.items()):
+        if isinstance(value, list):
+            current = merged.get(key)
+            if current is None:
+                merged[key] = [list(value[0]), value[1], value[2]]
+            else:
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+                current[2] += value[2]
+        else:
+            merged[key] = merged.get(key, 0) + value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._definitions = {}
+        self._local = threading.local()
+        self._shards = {}
+        # Totals of shards whose threads have finished
+        self._retired = {}
+        self._shards_lock = threading.RLock()
+
+    def counter(self, name, description):
+        """Register a counter metric"""
+        self._definitions[name] = ('counter', description, None)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        """Register a histogram metric with the given upper bounds"""
+        self._definitions[name] = ('histogram', description, tuple(buckets))
+
+    def _shard(self):
+        """Return the calling thread's private shard, creating it on first use"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            shard = {}
+            holder = _ShardHolder(shard)
+            # Only taken once per thread, never on the hot path
+            with self._shards_lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(holder, self._retire, shard)
+            self._local.holder = holder
+        return holder.shard
+
+    def _retire(self, shard):
+        """Fold a finished thread's shard into the retired totals and stop tracking it"""
+        with self._shards_lock:
+            if self._shards.pop(id(shard), None) is not None:
+                _merge_into(self._retired, shard)
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        shard = self._shard()
+        key = (name, tuple(labels.items()))
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a single observation into a histogram"""
+        buckets = self._definitions[name][2]
+        shard = self._shard()
+        key = (name, tuple(labels.items()))
+        series = shard.get(key)
+        if series is None:
+            # [per-bucket counts (last one is +Inf), sum, count]
+            series = [[0] * (len(buckets) + 1), 0.0, 0]
+            shard[key] = series
+        series[0][bisect.bisect_left(buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        """Merge all thread shards into a single snapshot"""
+        merged = {}
+        with self._shards_lock:
+            shards = list(self._shards.values())
+            _merge_into(merged, self._retired)
+
+        for shard in shards:
+            _merge_into(merged, shard)
+        return merged
+
+    def render(self):
+        """Render every registered metric in Prometheus text exposition format"""
+        merged = self.collect()
+        by_name = {}
+        for (name, labels), value in merged.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (metric_type, description, buckets) in self._definitions.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name.get(name, [])):
+                if metric_type == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    """Format label pairs as {key="value",...}"""
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    """Format a sample value without a trailing .0 for whole numbers"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Global registry shared by the whole application
+registry = MetricsRegistry()
+
+registry.histogram('freespace_http_request_duration_seconds',
+                   'HTTP request latency by route, persona and status')
+registry.counter('freespace_http_requests_total',
+                 'HTTP requests handled by route, persona and status')
+registry.histogram('freespace_model_request_duration_seconds',
+                   'Upstream Gemini generate_content latency by persona and task type')
+registry.counter('freespace_model_requests_total',
+                 'Upstream Gemini calls by persona, task type and outcome')
+registry.histogram('freespace_prompt_chars',
+                   'Length of prompts sent upstream in characters by persona and task type', SIZE_BUCKETS)
+registry.histogram('freespace_response_chars',
+                   'Length of model responses in characters by persona and task type', SIZE_BUCKETS)
+registry.counter('freespace_fallback_responses_total',
+                 'Local fallback responses served by persona and reason')
+registry.counter('freespace_cache_requests_total',
+                 'Response cache lookups by persona and result (hit/miss)')
+registry.histogram('freespace_model_queue_seconds',
+                   'Time model calls waited for a fair-share scheduler slot by persona', LATENCY_BUCKETS)
+registry.counter('freespace_rate_limited_total',
+                 'Requests rejected by the per-client rate limiter by persona')
+registry.counter('freespace_cluster_forwards_total',
+                 'Requests proxied to the owner node by persona and result (ok/error)')
+registry.counter('freespace_persist_records_total',
+                 'Turns and context updates from the write-behind queue by result (written/failed/dropped)')
+registry.histogram('freespace_persist_flush_seconds',
+                   'Time to write one write-behind batch transaction', LATENCY_BUCKETS)
+registry.counter('freespace_load_shed_total',
+                 'Low-priority requests shed under upstream load by persona and mode (fallback/reject)')
+registry.histogram('freespace_upstream_probe_seconds',
+                   'Latency of background Gemini reachability probes', LATENCY_BUCKETS)
+registry.counter('freespace_upstream_probes_total',
+                 'Background Gemini reachability probes by outcome (success/error)')
+registry.counter('freespace_session_evictions_total',
+                 'Personas trimmed to their prompt window by the worker memory watchdog')
+registry.counter('freespace_catalog_requests_total',
+                 'Pregenerated catalog lookups by task type and result (hit/miss)')
+registry.histogram('freespace_crisis_check_seconds',
+                   'Time spent scanning a message for crisis language', MICRO_BUCKETS)
+registry.counter('freespace_crisis_responses_total',
+                 'Messages answered by the crisis fast path by persona')
@@ -0,0 +1,205 @@
+"""
+Write-behind persistence of conversation turns and context updates.
+
+Writing every turn synchronously inside generate_ai_response would put
+disk latency on the user's critical path. Request threads only put
+records on a bounded in-memory queue. A background thread writes them to
+the store in batched transactions, flushing every flush_interval seconds
+or after max_batch records, whichever comes first.
+
+When the store falls behind and the queue is full, producers wait up to
+block_timeout for space. That is the backpressure. If the queue is still
+full after the wait, the record is dropped and counted. A slow disk then
+costs a request at most block_timeout instead of a stall. The writer
+thread starts on first use in each process, so a queue created in a
+pre-forking master still works in its workers. close() runs at
+interpreter exit, or from the server's shutdown hook, and writes
+everything still queued.
+
+Records are (kind, persona, created, data) with kind 'turn' or 'context'.
+Data is a dict that is JSON-encoded on the writer thread.
+
+Environment:
+    PERSIST_STORE           'sqlite:/path/to/freespace.db' (unset disables persistence)
+    PERSIST_BATCH_SIZE      records per transaction (default 256)
+    PERSIST_FLUSH_MS        max milliseconds a record waits before its batch is written (default 50)
+    PERSIST_QUEUE_SIZE      queued records before producers are throttled (default 10000)
+    PERSIST_BLOCK_MS        how long a producer waits for queue space before dropping (default 5)
+"""
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import serialization
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class SQLiteTurnStore:
+    """Turns and context updates in a SQLite file, written one batch per transaction"""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._connect().close()
+        self._connection = None
+
+    def _connect(self):
+        """Connection for this process - one opened before a fork must not be used by the child"""
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS turns "
+                               "(id INTEGER PRIMARY KEY, persona TEXT, created REAL, data TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS context_updates "
+                               "(id INTEGER PRIMARY KEY, persona TEXT, created REAL, data TEXT)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def write(self, records):
+        rows = {'turn': [], 'context': []}
+        for kind, persona, created, data in records:
+            rows[kind].append((persona, created, serialization.dumps_bytes(data).decode('utf-8')))
+        connection = self._connect()
+        connection.execute("BEGIN")
+        try:
+            if rows['turn']:
+                connection.executemany("INSERT INTO turns (persona, created, data) VALUES (?, ?, ?)", rows['turn'])
+            if rows['context']:
+                connection.executemany("INSERT INTO context_updates (persona, created, data) VALUES (?, ?, ?)",
+                                       rows['context'])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+
+class WriteBehindQueue:
+    def __init__(self, store, max_batch=256, flush_interval=0.05, max_pending=10000, block_timeout=0.005,
+                 on_batch=None):
+        self.store = store
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.on_batch = on_batch
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_writer(self):
+        """Start the writer thread in this process; a pre-fork master's thread does not survive into workers"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_pending)
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def put(self, kind, persona, data, created=None):
+        """Queue a record for the writer; return False when it had to be dropped"""
+        if self._closed:
+            return False
+        self._ensure_writer()
+        try:
+            self._queue.put((kind, persona, time.time() if created is None else created, data),
+                            timeout=self.block_timeout)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        """Block for one record, then gather more until the batch is full or the flush interval passes"""
+        record = self._queue.get()
+        if record is _STOP:
+            return [], True
+        batch = [record]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                record = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._write(batch)
+        self.store.close()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            self.store.write(batch)
+            ok = True
+        except (sqlite3.Error, OSError, ValueError, TypeError) as e:
+            ok = False
+            logger.error("Write-behind batch of %d records failed: %s", len(batch), e)
+        if self.on_batch is not None:
+            self.on_batch(batch, time.perf_counter() - start, ok)
+
+    def close(self, timeout=10):
+        """Write everything still queued, then stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._pid != os.getpid():
+            return
+        # Blocking put - the writer keeps draining, so space frees up
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("Write-behind queue did not drain within %ss, %d records lost", timeout, self.pending())
+        elif self.dropped:
+            logger.warning("Write-behind queue dropped %d records under backpressure", self.dropped)
+
+
+def create_queue_from_env(on_batch=None):
+    """Build the write-behind queue from PERSIST_STORE and PERSIST_*, or None when persistence is off"""
+    store_spec = os.environ.get('PERSIST_STORE', '')
+    if not store_spec:
+        return None
+    if not store_spec.startswith('sqlite:'):
+        logger.error("Unsupported PERSIST_STORE %s - persistence disabled", store_spec)
+        return None
+    try:
+        store = SQLiteTurnStore(store_spec[len('sqlite:'):])
+    except sqlite3.Error as e:
+        logger.error("Failed to open persistence store %s, persistence disabled: %s", store_spec, e)
+        return None
+    return WriteBehindQueue(store,
+                            max_batch=int(os.environ.get('PERSIST_BATCH_SIZE', '256')),
+                            flush_interval=int(os.environ.get('PERSIST_FLUSH_MS', '50')) / 1000,
+                            max_pending=int(os.environ.get('PERSIST_QUEUE_SIZE', '10000')),
+                            block_timeout=int(os.environ.get('PERSIST_BLOCK_MS', '5')) / 1000,
+                            on_batch=on_batch)
@@ -0,0 +1,77 @@
+"""
+On-demand sampling profiler for live workers.
+
+While a profile is running, a background thread snapshots the stacks of
+every other thread with sys._current_frames() at a fixed interval and
+counts identical stacks. The result is emitted in the collapsed-stack
+format understood by flamegraph.pl and speedscope. Nothing is installed
+or running when no profile is in progress, so there is no overhead when
+profiling is off.
+"""
+import os
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005
+MAX_DURATION = 60
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def profile(self, seconds):
+        """Sample all threads for the given number of seconds and return collapsed stacks"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running on this worker")
+        try:
+            seconds = max(0.1, min(float(seconds), MAX_DURATION))
+            counts = {}
+            stop = threading.Event()
+            excluded = {threading.get_ident()}
+
+            sampler = threading.Thread(target=self._sample_loop, args=(counts, stop, excluded),
+                                       name='sampling-profiler', daemon=True)
+            sampler.start()
+            stop.wait(seconds)
+            stop.set()
+            sampler.join()
+            return render_collapsed(counts)
+        finally:
+            self._lock.release()
+
+    def _sample_loop(self, counts, stop, excluded):
+        excluded.add(threading.get_ident())
+        label_cache = {}
+        while not stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in excluded:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = label_cache.get(code)
+                    if label is None:
+                        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                        label_cache[code] = label
+                    stack.append(label)
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(self.interval)
+
+
+def render_collapsed(counts):
+    """Render stack counts as 'frame;frame;frame count' lines, hottest first"""
+    lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+    return '\n'.join(lines) + '\n'
+
+
+# Global profiler for this worker
+profiler = SamplingProfiler()
@@ -0,0 +1,211 @@
+"""
+Per-client rate limiting and fair scheduling of Gemini calls.
+
+TokenBucketLimiter gives every client a bucket that refills at `rate`
+tokens per second up to `burst`. The app keys buckets on the client's IP
+address, which is only the real client's behind a proxy when
+TRUSTED_PROXY_HOPS is set, so limiting is off by default.
+Each model-backed request costs one token, or one per message for batch
+requests. Buckets live in a MemoryBucketStore for a single process, or in
+a SQLiteBucketStore file when all gunicorn workers on a host should share
+limits. A rejected request gets the seconds until enough tokens return,
+which the app sends as Retry-After.
+
+FairScheduler caps concurrent outbound model calls. When all slots are in
+use, waiting calls are queued per persona and served by start-time fair
+queuing with per-persona weights. A burst of long CodeGent generations
+cannot then starve short Maya or Luna turns.
+
+Environment:
+    RATE_LIMIT_PER_SECOND     token refill rate per client (default 0, which disables limiting)
+    RATE_LIMIT_BURST          bucket size (default 30)
+    RATE_LIMIT_STORE          'memory' (default) or 'sqlite:/path/to/buckets.db'
+    MODEL_MAX_CONCURRENCY     concurrent model calls per worker (default 8, 0 disables scheduling)
+    MODEL_SCHEDULER_WEIGHTS   persona=weight list (default 'student=4,professional=4,parent=2,codegent=1')
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = 'student=4,professional=4,parent=2,codegent=1'
+
+
+class MemoryBucketStore:
+    """Buckets for a single process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def update(self, key, func):
+        """Atomically replace the (tokens, updated) state for key with func(state) and return the result"""
+        with self._lock:
+            state, result = func(self._buckets.get(key))
+            self._buckets[key] = state
+            return result
+
+    def prune(self, older_than):
+        with self._lock:
+            self._buckets = {key: state for key, state in self._buckets.items() if state[1] >= older_than}
+
+
+class SQLiteBucketStore:
+    """Buckets shared by every worker process on the host through a SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def update(self, key, func):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            state, result = func(row)
+            connection.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                               (key, state[0], state[1]))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+    def prune(self, older_than):
+        self._connect().execute("DELETE FROM buckets WHERE updated < ?", (older_than,))
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate, burst, store=None):
+        self.rate = rate
+        self.burst = burst
+        self.store = store or MemoryBucketStore()
+        self._next_prune = time.time() + 60
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, key, cost=1):
+        """Take cost tokens from key's bucket; return (allowed, retry_after_seconds)"""
+        now = time.time()
+        cost = min(cost, self.burst)
+
+        def take(state):
+            tokens, updated = state if state else (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                return (tokens - cost, now), (True, 0)
+            return (tokens, now), (False, math.ceil((cost - tokens) / self.rate))
+
+        result = self.store.update(key, take)
+        if now >= self._next_prune:
+            # Idle buckets have refilled completely, so dropping them changes nothing
+            self._next_prune = now + 60
+            self.store.prune(now - self.burst / self.rate)
+        return result
+
+
+class FairScheduler:
+    def __init__(self, max_concurrent, weights=None):
+        self.max_concurrent = max_concurrent
+        self.weights = weights or {}
+        self._available = max_concurrent
+        self._queues = {}
+        self._finish_tags = {}
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+    def _charge(self, flow):
+        """Advance flow's virtual finish tag by one call divided by its weight"""
+        start = max(self._finish_tags.get(flow, 0.0), self._virtual_time)
+        self._virtual_time = start
+        self._finish_tags[flow] = start + 1.0 / self.weights.get(flow, 1.0)
+
+    @contextmanager
+    def slot(self, flow):
+        """Hold one model-call slot, waiting in flow's queue when all slots are busy"""
+        waiter = None
+        with self._lock:
+            if self._available > 0 and not self._queues:
+                self._available -= 1
+                self._charge(flow)
+            else:
+                waiter = threading.Event()
+                self._queues.setdefault(flow, deque()).append(waiter)
+        if waiter is not None:
+            # The releasing call hands its slot straight to us
+            waiter.wait()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            if not self._queues:
+                self._available += 1
+                return
+            flow = min(self._queues, key=lambda name: max(self._finish_tags.get(name, 0.0), self._virtual_time))
+            queue = self._queues[flow]
+            waiter = queue.popleft()
+            if not queue:
+                del self._queues[flow]
+            self._charge(flow)
+        waiter.set()
+
+    def queued(self):
+        with self._lock:
+            return {flow: len(queue) for flow, queue in self._queues.items()}
+
+
+def parse_weights(value):
+    """Parse 'persona=weight,persona=weight' into a dict of positive floats"""
+    weights = {}
+    for item in (value or '').split(','):
+        name, _, weight = item.strip().partition('=')
+        if name and weight:
+            try:
+                if float(weight) > 0:
+                    weights[name] = float(weight)
+            except ValueError:
+                pass
+    return weights
+
+
+def create_limiter_from_env():
+    """Build the per-client limiter from the RATE_LIMIT_* environment variables"""
+    store_spec = os.environ.get('RATE_LIMIT_STORE', 'memory')
+    store = None
+    if store_spec.startswith('sqlite:'):
+        try:
+            store = SQLiteBucketStore(store_spec[len('sqlite:'):])
+        except sqlite3.Error as e:
+            logger.error("Failed to open rate limit store %s, using per-process buckets: %s", store_spec, e)
+    return TokenBucketLimiter(rate=float(os.environ.get('RATE_LIMIT_PER_SECOND', '0')),
+                              burst=float(os.environ.get('RATE_LIMIT_BURST', '30')),
+                              store=store)
+
+
+def create_scheduler_from_env():
+    """Build the model-call scheduler, or None when MODEL_MAX_CONCURRENCY is 0"""
+    max_concurrent = int(os.environ.get('MODEL_MAX_CONCURRENCY', '8'))
+    if max_concurrent <= 0:
+        return None
+    return FairScheduler(max_concurrent, parse_weights(os.environ.get('MODEL_SCHEDULER_WEIGHTS', DEFAULT_WEIGHTS)))
@@ -0,0 +1,373 @@
+"""
+Compact per-session records.
+
+Every live session keeps its conversation turns and a persona context in
+memory, so their layout decides memory use with many sessions.
+
+Turn            slotted turn record with a float timestamp. Reads like the
+                old turn dict ('user', 'assistant', 'timestamp', ...) and
+                serializes to exactly the same JSON.
+TurnHistory     list of turns that zlib-compresses turns older than the
+                prompt window, which cuts resident memory for long sessions
+                full of stories, meal plans and code answers. Trimming
+                old turns moves a base offset, so turn IDs (base + index)
+                stay stable.
+ContextRecord   base for fixed-field persona contexts. It behaves like the
+                old context dict (get, items, update, [] access) but stores
+                one slot per field. Label fields, such as detected
+                problems, are packed into a single int from an interned
+                vocabulary, which gives O(1) membership tests.
+                Timestamp fields are stored as floats and read back as
+                ISO strings. Every change bumps a version and stamps the
+                field with it, so changes_since() reports what changed or
+                was removed without copying or diffing the values.
+"""
+import math
+import sys
+import time
+import zlib
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime
+from functools import lru_cache
+
+
+class _Unset:
+    """Marker for context fields that were never set; survives copy and pickle as the same object"""
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_UNSET'
+
+    def __repr__(self):
+        return '<unset>'
+
+
+_UNSET = _Unset()
+
+# Turns with less text than this are not worth compressing
+COMPRESS_MIN_CHARS = 512
+
+
+@lru_cache(maxsize=4096)
+def _second_prefix(second):
+    return datetime.fromtimestamp(second).isoformat()
+
+
+def format_timestamp(created):
+    """Same string as datetime.fromtimestamp(created).isoformat(), reusing the formatted second"""
+    # Split the same way datetime.fromtimestamp does, so rounding matches exactly
+    frac, second = math.modf(created)
+    micro = round(frac * 1e6)
+    if micro >= 1_000_000:
+        second, micro = second + 1, micro - 1_000_000
+    elif micro < 0:
+        second, micro = second - 1, micro + 1_000_000
+    prefix = _second_prefix(int(second))
+    return f"{prefix}.{micro:06d}" if micro else prefix
+
+
+@lru_cache(maxsize=32)
+def _unpack_texts(packed):
+    """(user, assistant) from a Turn's compressed blob; bytes cache their hash, so lookups are cheap"""
+    raw = zlib.decompress(packed)
+    split = 4 + int.from_bytes(raw[:4], 'little')
+    return raw[4:split].decode('utf-8'), raw[split:].decode('utf-8')
+
+
+class LabelEnum:
+    """Interned label vocabulary for packing label lists into one int
+
+    The low 32 bits are a membership bitmask. The bits above hold the
+    labels' 5-bit codes in insertion order, so decoding gives back the
+    labels in the order they were added.
+    """
+    CODE_BITS = 5
+    ORDER_SHIFT = 32
+
+    def __init__(self, labels):
+        self.labels = (None,) + tuple(dict.fromkeys(sys.intern(label) for label in labels))
+        if len(self.labels) > 2 ** self.CODE_BITS:
+            raise ValueError(f"At most {2 ** self.CODE_BITS - 1} labels per vocabulary")
+        self.codes = {label: code for code, label in enumerate(self.labels) if code}
+
+    def contains(self, packed, label):
+        code = self.codes.get(label)
+        return code is not None and bool(packed >> code & 1)
+
+    def add(self, packed, label):
+        """Return packed with label appended (unchanged when already present)"""
+        code = self.codes.get(label)
+        if code is None:
+            raise ValueError(f"Unknown label: {label!r}")
+        if packed >> code & 1:
+            return packed
+        order = (packed >> self.ORDER_SHIFT) << self.CODE_BITS | code
+        return order << self.ORDER_SHIFT | (packed & 0xFFFFFFFF) | 1 << code
+
+    def encode(self, labels):
+        packed = 0
+        for label in labels:
+            packed = self.add(packed, label)
+        return packed
+
+    def decode(self, packed):
+        labels = []
+        order = packed >> self.ORDER_SHIFT
+        code_mask = (1 << self.CODE_BITS) - 1
+        while order:
+            labels.append(self.labels[order & code_mask])
+            order >>= self.CODE_BITS
+        labels.reverse()
+        return labels
+
+
+class ContextRecord(MutableMapping):
+    """Dict-like persona context with a fixed set of fields
+
+    Subclasses list their fields, in serialization order, as __slots__.
+    Fields that were never set are missing, just like absent dict keys.
+    Values mutated in place, such as a list appended to, must be marked
+    with touch() to show up in changes_since().
+    """
+    __slots__ = ('_version', '_changed')
+    LABEL_FIELDS = {}
+    TIMESTAMP_FIELDS = frozenset()
+
+    def __init__(self, **values):
+        self._version = 0
+        self._changed = {}
+        for field in self.__slots__:
+            setattr(self, field, _UNSET)
+        self.update(values)
+
+    def __getitem__(self, field):
+        raw = getattr(self, field, _UNSET) if field in self.__slots__ else _UNSET
+        if raw is _UNSET:
+            raise KeyError(field)
+        labels = self.LABEL_FIELDS.get(field)
+        if labels is not None:
+            return labels.decode(raw)
+        if field in self.TIMESTAMP_FIELDS:
+            return format_timestamp(raw)
+        return raw
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} has no field {field!r}")
+        labels = self.LABEL_FIELDS.get(field)
+        if labels is not None:
+            value = labels.encode(value)
+        elif field in self.TIMESTAMP_FIELDS and isinstance(value, str):
+            value = datetime.fromisoformat(value).timestamp()
+        previous = getattr(self, field)
+        setattr(self, field, value)
+        if previous != value:
+            self._mark(field)
+
+    def __delitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        setattr(self, field, _UNSET)
+        self._mark(field)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and getattr(self, field) is not _UNSET
+
+    def __iter__(self):
+        return (field for field in self.__slots__ if getattr(self, field) is not _UNSET)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def has_label(self, field, label):
+        raw = getattr(self, field)
+        return raw is not _UNSET and self.LABEL_FIELDS[field].contains(raw, label)
+
+    def add_label(self, field, label):
+        raw = getattr(self, field)
+        packed = self.LABEL_FIELDS[field].add(0 if raw is _UNSET else raw, label)
+        if packed != raw:
+            setattr(self, field, packed)
+            self._mark(field)
+
+    def _mark(self, field):
+        self._version += 1
+        self._changed[field] = self._version
+
+    @property
+    def version(self):
+        """Number of changes made to the record so far"""
+        return self._version
+
+    def touch(self, field):
+        """Mark field as changed after its value was mutated in place"""
+        if field not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} has no field {field!r}")
+        self._mark(field)
+
+    def changes_since(self, version):
+        """Return ({field: value} set since version, [fields removed since version])"""
+        changed, removed = {}, []
+        for field in self.__slots__:
+            if self._changed.get(field, 0) > version:
+                if field in self:
+                    changed[field] = self[field]
+                else:
+                    removed.append(field)
+        return changed, removed
+
+    def to_dict(self):
+        return {field: self[field] for field in self}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Turn(Mapping):
+    """One conversation exchange, readable as the original turn dict
+
+    compress() packs the user and assistant texts into one zlib blob once
+    the turn is out of the prompt window. They are unpacked again only
+    when read, through a small cache so reading both texts, or dict(turn),
+    decompresses once. A crisis turn gets the model's background follow-up
+    reply in follow_up.
+    """
+    __slots__ = ('_user', '_assistant', '_packed', 'created', 'language', 'task_type', 'has_code', 'crisis_support',
+                 'follow_up')
+    # Optional keys around 'timestamp', in the order the turn dicts used to be built
+    LEADING_OPTIONAL = ('language',)
+    TRAILING_OPTIONAL = ('task_type', 'has_code', 'crisis_support', 'follow_up')
+    KEYS = frozenset(('user', 'assistant') + LEADING_OPTIONAL + TRAILING_OPTIONAL)
+
+    def __init__(self, user, assistant, created=None, language=None, task_type=None, has_code=None,
+                 crisis_support=None, follow_up=None):
+        self._user = user
+        self._assistant = assistant
+        self._packed = None
+        self.created = time.time() if created is None else created
+        self.language = language
+        self.task_type = task_type
+        self.has_code = has_code
+        self.crisis_support = crisis_support
+        self.follow_up = follow_up
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a turn from to_dict() output"""
+        timestamp = data.get('timestamp')
+        optional = {field: data.get(field) for field in cls.LEADING_OPTIONAL + cls.TRAILING_OPTIONAL}
+        return cls(str(data['user']), str(data['assistant']),
+                   created=datetime.fromisoformat(timestamp).timestamp() if timestamp else None, **optional)
+
+    @property
+    def user(self):
+        return self._user if self._packed is None else self._unpack()[0]
+
+    @property
+    def assistant(self):
+        return self._assistant if self._packed is None else self._unpack()[1]
+
+    @property
+    def compressed(self):
+        return self._packed is not None
+
+    def compress(self, min_chars=COMPRESS_MIN_CHARS):
+        """Replace the texts with a zlib blob when that actually saves memory; return True if packed"""
+        if self._packed is not None or len(self._user) + len(self._assistant) < min_chars:
+            return False
+        user = self._user.encode('utf-8')
+        raw = len(user).to_bytes(4, 'little') + user + self._assistant.encode('utf-8')
+        packed = zlib.compress(raw, 6)
+        if len(packed) >= len(raw) * 0.9:
+            return False
+        self._packed = packed
+        self._user = self._assistant = None
+        return True
+
+    def _unpack(self):
+        return _unpack_texts(self._packed)
+
+    @property
+    def timestamp(self):
+        return format_timestamp(self.created)
+
+    def __getitem__(self, key):
+        if key == 'timestamp':
+            return self.timestamp
+        if key in self.KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'user'
+        yield 'assistant'
+        for field in self.LEADING_OPTIONAL:
+            if getattr(self, field) is not None:
+                yield field
+        yield 'timestamp'
+        for field in self.TRAILING_OPTIONAL:
+            if getattr(self, field) is not None:
+                yield field
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        user, assistant = (self._user, self._assistant) if self._packed is None else self._unpack()
+        data = {'user': user, 'assistant': assistant}
+        if self.language is not None:
+            data['language'] = self.language
+        data['timestamp'] = self.timestamp
+        for field in self.TRAILING_OPTIONAL:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    def __repr__(self):
+        return f"Turn({self.to_dict()!r})"
+
+
+class TurnHistory(list):
+    """Conversation history that compresses each turn once it falls out of the prompt window
+
+    The newest hot_turns turns stay uncompressed for prompt building. Appending
+    a turn compresses the one that just became cold, so each append does O(1)
+    work. base counts the turns trimmed from the front; a turn's ID is
+    base plus its index. revision goes up on every append, trim or touch(),
+    so validators can tell when a turn was changed in place.
+    """
+    __slots__ = ('hot_turns', 'base', 'revision')
+
+    def __init__(self, turns=(), hot_turns=4, base=0):
+        super().__init__(turns)
+        self.hot_turns = hot_turns
+        self.base = base
+        self.revision = 0
+
+    def __setstate__(self, state):
+        # Histories pickled before base and revision existed carry only hot_turns
+        self.base = self.revision = 0
+        for name, value in (state[1] or {}).items():
+            setattr(self, name, value)
+
+    def touch(self):
+        """Record that a turn was changed in place"""
+        self.revision += 1
+
+    def append(self, turn):
+        super().append(turn)
+        self.revision += 1
+        cold_index = len(self) - self.hot_turns - 1
+        if cold_index >= 0 and isinstance(self[cold_index], Turn):
+            self[cold_index].compress()
+
+    def trim(self, keep):
+        """Drop all but the newest keep turns in place and return how many were dropped"""
+        dropped = max(len(self) - keep, 0)
+        del self[:dropped]
+        self.base += dropped
+        self.revision += 1
+        return dropped
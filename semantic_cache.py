@@ -0,0 +1,194 @@
+"""
+Semantic response cache for repeated and paraphrased questions.
+
+User messages are embedded locally with a signed hashed n-gram vector
+(word unigrams plus character trigrams, via NumPy) and compared by cosine
+similarity against earlier messages in the same namespace, e.g.
+'parent:meal_planner:vegetarian|4' or 'codegent:python:'. The scope part
+carries the session context the answer depends on. A hit above the
+threshold returns the stored answer without calling Gemini, unless the
+two messages differ in a negation or a number ("vegetarian" vs
+"non-vegetarian", "50000" vs "150000"). Embeddings barely separate those,
+but the answers should differ. Entries expire after a
+TTL, and each namespace grows up to a fixed size and then recycles its
+oldest slots, so memory stays bounded.
+
+Caching is opt-in per persona. Maya and Luna are left out by default
+because their answers depend on the user's mood and history. Callers
+only cache factual task types; stories and personal lists are meant to
+differ every time.
+
+Environment:
+    SEMANTIC_CACHE_PERSONAS   comma separated personas to cache (default 'parent,codegent', '' disables)
+    SEMANTIC_CACHE_THRESHOLD  minimum cosine similarity for a hit (default 0.75, between the paraphrase and
+                              distinct-question scores of the pairs in benchmarks/corpus.py)
+    SEMANTIC_CACHE_TTL        entry lifetime in seconds (default 21600)
+    SEMANTIC_CACHE_SIZE       max entries per namespace (default 2000)
+"""
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset(
+    "a an the i me my we our you your to for of in on at and or is are be can could should would "
+    "what which how do does please some give tell show make with about it this that".split()
+    # Request boilerplate: "write a function to...", "suggest lunch ideas..." - shared by unrelated questions
+    + "write create implement function suggest ideas tips explain work".split()
+)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9+#']+")
+
+NEGATIONS = frozenset("no not non without never nor cannot can't don't doesn't isn't aren't won't avoid except".split())
+
+
+def contrast_terms(text):
+    """Negations and numbers in text - paraphrases must agree on these to share an answer"""
+    return frozenset(token for token in _TOKEN_PATTERN.findall(text.lower())
+                     if token in NEGATIONS or any(char.isdigit() for char in token))
+
+
+class HashedNgramEmbedder:
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def features(self, text):
+        """Word unigrams and in-word character trigrams of the normalized text"""
+        words = [word for word in _TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+        trigrams = []
+        for word in words:
+            padded = f" {word} "
+            trigrams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return words, trigrams
+
+    def embed(self, text):
+        """Return an L2-normalized float32 vector for text"""
+        words, trigrams = self.features(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = words + trigrams
+        if not features:
+            return vector
+        hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                             dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        # Whole words carry more meaning than trigrams
+        weights = np.full(len(features), 0.5, dtype=np.float32)
+        weights[:len(words)] = 1.0
+        np.add.at(vector, hashes % self.dim, signs * weights)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class _Namespace:
+    INITIAL_ROWS = 32
+
+    def __init__(self, dim, capacity):
+        self.capacity = capacity
+        rows = min(self.INITIAL_ROWS, capacity)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.expires = np.zeros(rows, dtype=np.float64)
+        self.entries = [None] * rows
+        self.size = 0
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    def allocate_slot(self):
+        """Return the slot for a new entry, growing the arrays or recycling the oldest slot"""
+        if self.size < self.capacity:
+            if self.size == len(self.entries):
+                rows = min(len(self.entries) * 2, self.capacity)
+                self.vectors = np.resize(self.vectors, (rows, self.vectors.shape[1]))
+                self.vectors[self.size:] = 0
+                self.expires = np.resize(self.expires, rows)
+                self.expires[self.size:] = 0
+                self.entries.extend([None] * (rows - len(self.entries)))
+            slot = self.size
+            self.size += 1
+            return slot
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+        return slot
+
+
+class SemanticCache:
+    def __init__(self, personas=('parent', 'codegent'), threshold=0.75, ttl=6 * 3600, capacity=2000, dim=512):
+        self.enabled = np is not None
+        self.personas = frozenset(personas)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.embedder = HashedNgramEmbedder(dim) if self.enabled else None
+        self._namespaces = {}
+        self._namespaces_lock = threading.Lock()
+        if not self.enabled:
+            logger.warning("NumPy not available - semantic response cache disabled")
+
+    def is_enabled_for(self, persona):
+        return self.enabled and persona in self.personas
+
+    def _namespace(self, name):
+        namespace = self._namespaces.get(name)
+        if namespace is None:
+            with self._namespaces_lock:
+                namespace = self._namespaces.get(name)
+                if namespace is None:
+                    namespace = _Namespace(self.embedder.dim, self.capacity)
+                    self._namespaces[name] = namespace
+        return namespace
+
+    def lookup(self, persona, task_type, message, scope=''):
+        """Return (response, similarity) for the closest compatible live entry above the threshold, else (None, best)"""
+        if not self.is_enabled_for(persona):
+            return None, 0.0
+        namespace = self._namespace(f"{persona}:{task_type}:{scope}")
+        query = self.embedder.embed(message)
+        with namespace.lock:
+            scores = namespace.vectors @ query
+            scores[namespace.expires < time.time()] = -1.0
+            candidates = np.flatnonzero(scores >= self.threshold)
+            candidates = candidates[np.argsort(-scores[candidates])]
+            matches = [(namespace.entries[slot], float(scores[slot])) for slot in candidates]
+            best = float(scores.max()) if len(scores) else 0.0
+        terms = contrast_terms(message)
+        for entry, score in matches:
+            if entry is not None and contrast_terms(entry[0]) == terms:
+                return entry[1], score
+        return None, max(best, 0.0)
+
+    def store(self, persona, task_type, message, response, scope=''):
+        """Remember the response for message, evicting the oldest entry when the namespace is full"""
+        if not self.is_enabled_for(persona):
+            return
+        namespace = self._namespace(f"{persona}:{task_type}:{scope}")
+        vector = self.embedder.embed(message)
+        with namespace.lock:
+            slot = namespace.allocate_slot()
+            namespace.vectors[slot] = vector
+            namespace.expires[slot] = time.time() + self.ttl
+            namespace.entries[slot] = (message, response)
+
+    def clear(self):
+        with self._namespaces_lock:
+            self._namespaces = {}
+
+
+def create_cache_from_env():
+    """Build the cache from the SEMANTIC_CACHE_* environment variables"""
+    personas = os.environ.get('SEMANTIC_CACHE_PERSONAS', 'parent,codegent')
+    return SemanticCache(
+        personas=[persona.strip() for persona in personas.split(',') if persona.strip()],
+        threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.75')),
+        ttl=float(os.environ.get('SEMANTIC_CACHE_TTL', str(6 * 3600))),
+        capacity=int(os.environ.get('SEMANTIC_CACHE_SIZE', '2000'))
+    )
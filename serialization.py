@@ -0,0 +1,62 @@
+"""
+Fast JSON serialization for API responses.
+
+When orjson is installed, FastJSONProvider replaces Flask's default JSON
+provider so every jsonify() call encodes straight to bytes without key
+sorting or indentation. Without orjson it falls back to the standard
+library encoder with compact separators.
+"""
+import json
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """Encode types orjson does not handle natively"""
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return str(obj)
+
+
+def dumps_bytes(obj):
+    """Serialize obj to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class FastJSONProvider(JSONProvider):
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def context_delta(assistant, context, full=False):
+    """Return (version, changed fields, removed fields) since the last response for an assistant context
+
+    context is a records.ContextRecord; its per-field change versions make
+    this proportional to the number of fields, not to the size of their values.
+    """
+    since = assistant.context_version
+    assistant.context_version = context.version
+    if full:
+        return context.version, context.to_dict(), []
+    changed, removed = context.changes_since(since)
+    return context.version, changed, removed
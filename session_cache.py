@@ -0,0 +1,180 @@
+"""
+Shared-memory session cache for running several gunicorn workers on one host.
+
+Each worker process holds its own module-level assistants, so consecutive
+requests from one user that land on different workers would otherwise see
+different conversation histories and contexts. SharedSessionCache is a
+fixed-size hash table in an mmap'ed file, by default under /dev/shm, that
+every worker on the host maps. A request first loads the persona's state
+when another worker has published a newer version. After a request that
+changed the state, the worker publishes it again. No network round trip
+is involved.
+
+Layout:
+
+    header   magic, slot count, slot size
+    slot     key (32 bytes), version (u64), length (u32), pickled state
+
+Keys are placed by crc32 with linear probing. Each slot has its own lock,
+an fcntl byte-range lock across processes plus a threading lock within
+the process, so workers touching different personas never contend.
+put() with expected_version is a compare-and-swap: it only writes when
+the slot is still at the version the writer last saw, so a worker whose
+copy went stale merges the newer state in and tries again instead of
+overwriting another worker's changes.
+
+The file is created with mode 0600 and holds pickles, so only share it
+between workers of the same deployment.
+
+Environment:
+    SESSION_CACHE_PATH        cache file, e.g. /dev/shm/freespace-sessions (unset disables the cache)
+    SESSION_CACHE_SLOTS       number of keys the table can hold (default 16)
+    SESSION_CACHE_SLOT_BYTES  largest pickled state per key (default 4194304)
+"""
+import fcntl
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FSSCACHE'
+HEADER = struct.Struct('<8sII')
+SLOT_HEADER = struct.Struct('<32sQI4x')
+KEY_BYTES = 32
+
+
+class SharedSessionCache:
+    def __init__(self, path, slots=16, slot_bytes=4 * 1024 * 1024):
+        self.path = path
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.slot_size = SLOT_HEADER.size + slot_bytes
+        self.size = HEADER.size + slots * self.slot_size
+        self._thread_locks = [threading.Lock() for _ in range(slots)]
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._initialize()
+        self._map = mmap.mmap(self._fd, self.size)
+
+    def _initialize(self):
+        """Write the header unless another worker already set up a table with the same geometry"""
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER.size, 0)
+        try:
+            existing = os.pread(self._fd, HEADER.size, 0)
+            if len(existing) == HEADER.size and HEADER.unpack(existing) == (MAGIC, self.slots, self.slot_bytes):
+                return
+            if existing.startswith(MAGIC):
+                logger.warning("Session cache %s has a different geometry, resetting it", self.path)
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, self.size)
+            os.pwrite(self._fd, HEADER.pack(MAGIC, self.slots, self.slot_bytes), 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER.size, 0)
+
+    def _offset(self, index):
+        return HEADER.size + index * self.slot_size
+
+    @contextmanager
+    def _locked(self, index):
+        """Hold slot index exclusively against other threads and other worker processes"""
+        offset = self._offset(index)
+        with self._thread_locks[index]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT_HEADER.size, offset)
+            try:
+                yield offset
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT_HEADER.size, offset)
+
+    def _probe(self, key):
+        """Yield slot indexes in probing order for key"""
+        start = zlib.crc32(key) % self.slots
+        for step in range(self.slots):
+            yield (start + step) % self.slots
+
+    @staticmethod
+    def _encode_key(key):
+        encoded = key.encode('utf-8')
+        if len(encoded) > KEY_BYTES:
+            raise ValueError(f"Session cache keys are limited to {KEY_BYTES} bytes: {key!r}")
+        return encoded.ljust(KEY_BYTES, b'\0')
+
+    def get(self, key, known_version=None):
+        """Return (version, state) for key, or None when absent
+
+        state is None when the stored version equals known_version, so an
+        up-to-date worker skips the copy and unpickling.
+        """
+        encoded = self._encode_key(key)
+        for index in self._probe(encoded):
+            with self._locked(index) as offset:
+                slot_key, version, length = SLOT_HEADER.unpack_from(self._map, offset)
+                if slot_key == encoded:
+                    if version == known_version:
+                        return version, None
+                    start = offset + SLOT_HEADER.size
+                    payload = self._map[start:start + length]
+                    break
+                if not slot_key.strip(b'\0'):
+                    return None
+        else:
+            return None
+        return version, pickle.loads(payload)
+
+    def version(self, key):
+        """Current version of key, or None when it was never stored"""
+        encoded = self._encode_key(key)
+        for index in self._probe(encoded):
+            with self._locked(index) as offset:
+                slot_key, version, _ = SLOT_HEADER.unpack_from(self._map, offset)
+            if slot_key == encoded:
+                return version
+            if not slot_key.strip(b'\0'):
+                return None
+        return None
+
+    def put(self, key, state, expected_version=None):
+        """Store state under key and return its new version
+
+        With expected_version, nothing is written and None is returned
+        unless the stored version (0 when key is absent) still equals it.
+        """
+        encoded = self._encode_key(key)
+        payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_bytes:
+            raise ValueError(f"State for {key!r} is {len(payload)} bytes, above the {self.slot_bytes} byte slot")
+        for index in self._probe(encoded):
+            with self._locked(index) as offset:
+                slot_key, version, _ = SLOT_HEADER.unpack_from(self._map, offset)
+                if slot_key != encoded and slot_key.strip(b'\0'):
+                    continue
+                if slot_key != encoded:
+                    version = 0
+                if expected_version is not None and version != expected_version:
+                    return None
+                start = offset + SLOT_HEADER.size
+                self._map[start:start + len(payload)] = payload
+                SLOT_HEADER.pack_into(self._map, offset, encoded, version + 1, len(payload))
+                return version + 1
+        raise ValueError(f"Session cache {self.path} is full ({self.slots} slots)")
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+def create_cache_from_env():
+    """Map the cache named by SESSION_CACHE_PATH, or return None when it is unset or unusable"""
+    path = os.environ.get('SESSION_CACHE_PATH', '')
+    if not path:
+        return None
+    try:
+        return SharedSessionCache(path, slots=int(os.environ.get('SESSION_CACHE_SLOTS', '16')),
+                                  slot_bytes=int(os.environ.get('SESSION_CACHE_SLOT_BYTES', str(4 * 1024 * 1024))))
+    except (OSError, ValueError) as e:
+        logger.error("Failed to open shared session cache %s, keeping sessions per worker: %s", path, e)
+        return None
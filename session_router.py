@@ -0,0 +1,198 @@
+"""
+Consistent-hash session affinity across several FreeSpace nodes.
+
+Assistant state lives in each process's memory (shared between the
+workers of one host by session_cache), so a multi-node deployment needs
+every request for a session to reach the node that holds it. Assistants
+in main_app are kept per persona, so the persona is the unit of session
+state. HashRing places personas on a ring of the configured nodes with
+virtual replicas. A node that receives a request for a persona it does
+not own proxies it to the owner over pooled keep-alive connections.
+
+When nodes join or leave (PUT /api/admin/cluster on any one node, which
+passes the new list on to every other old and new node), only the
+personas whose owner changed move. The old owner pushes their state, as
+JSON, to the new owner before it stops serving them.
+
+Requests between nodes are signed with an HMAC-SHA256 of a timestamp,
+the method, the path and the body, keyed by CLUSTER_TOKEN. The secret
+itself never goes over the wire. A node serves a correctly signed request
+locally instead of proxying it again, and trusts its X-Forwarded-For.
+Signatures older than MAX_SIGNATURE_AGE seconds are refused, which bounds
+how long a captured request can be replayed.
+
+Environment:
+    CLUSTER_NODES          comma-separated host:port list of every node (unset disables routing)
+    CLUSTER_SELF           this node's entry in CLUSTER_NODES
+    CLUSTER_TOKEN          shared secret that signs requests between nodes (required)
+    CLUSTER_PROXY_TIMEOUT  seconds to wait for the owner node (default 60)
+"""
+import bisect
+import hashlib
+import hmac
+import http.client
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Cluster-Signature'
+TIMESTAMP_HEADER = 'X-Cluster-Timestamp'
+FORWARDED_BY_HEADER = 'X-Cluster-Forwarded-By'
+MAX_SIGNATURE_AGE = 300
+
+# How a keep-alive connection the owner already closed fails: before the owner read the request, so a retry is safe.
+# Timeouts are not among them - the owner may still be running the request.
+STALE_CONNECTION_ERRORS = (http.client.BadStatusLine, ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+# Per-connection headers that must not be copied between the client and owner connections
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+    'transfer-encoding', 'upgrade', 'host', 'content-length'
+])
+
+
+class ForwardError(Exception):
+    """The owner node could not be reached"""
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    def __init__(self, nodes, replicas=100):
+        self.nodes = tuple(dict.fromkeys(nodes))
+        self.replicas = replicas
+        points = sorted((ring_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ConnectionPool:
+    """Idle keep-alive connections to one node, reused most recently used first"""
+
+    def __init__(self, node, timeout, max_idle=8):
+        self.host, _, port = node.rpartition(':')
+        self.port = int(port)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+class SessionRouter:
+    def __init__(self, self_node, nodes, token, timeout=60):
+        self.self_node = self_node
+        self.token = token
+        self.timeout = timeout
+        self.ring = HashRing(nodes)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def owner(self, key):
+        return self.ring.owner(key) or self.self_node
+
+    def is_local(self, key):
+        return self.owner(key) == self.self_node
+
+    def sign(self, timestamp, method, path, body):
+        message = f"{timestamp}\n{method.upper()}\n{path}\n".encode('utf-8') + hashlib.sha256(body or b'').digest()
+        return hmac.new(self.token.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+    def is_cluster_request(self, method, path, headers, body):
+        """True when the request was signed by another node holding the cluster secret"""
+        signature = headers.get(SIGNATURE_HEADER, '')
+        timestamp = headers.get(TIMESTAMP_HEADER, '')
+        if not signature or not timestamp.isdigit() or abs(time.time() - int(timestamp)) > MAX_SIGNATURE_AGE:
+            return False
+        return hmac.compare_digest(signature.encode(), self.sign(timestamp, method, path, body).encode())
+
+    def set_nodes(self, nodes, keys):
+        """Replace the ring; return {key: new owner} for the given keys this node no longer owns"""
+        previous = self.ring
+        self.ring = HashRing(nodes)
+        moved = {}
+        for key in keys:
+            if previous.owner(key) in (self.self_node, None) and not self.is_local(key):
+                moved[key] = self.owner(key)
+        return moved
+
+    def _pool(self, node):
+        with self._lock:
+            pool = self._pools.get(node)
+            if pool is None:
+                pool = self._pools[node] = ConnectionPool(node, self.timeout)
+            return pool
+
+    def forward(self, node, method, path, headers=(), body=None):
+        """Send a signed request to node and return (status, headers, body)
+
+        headers are (name, value) pairs. Reused keep-alive connections the
+        node has already closed are dropped and the request is retried. Any
+        other failure, including a timeout after the body was sent, raises
+        ForwardError without a retry, so the owner never runs a turn twice.
+        """
+        outgoing = {name: value for name, value in headers if name.lower() not in HOP_BY_HOP_HEADERS}
+        timestamp = str(int(time.time()))
+        outgoing[TIMESTAMP_HEADER] = timestamp
+        outgoing[SIGNATURE_HEADER] = self.sign(timestamp, method, path, body)
+        outgoing[FORWARDED_BY_HEADER] = self.self_node
+        pool = self._pool(node)
+        while True:
+            connection, reused = pool.acquire()
+            try:
+                connection.request(method, path, body=body, headers=outgoing)
+                response = connection.getresponse()
+                payload = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if reused and isinstance(e, STALE_CONNECTION_ERRORS):
+                    continue
+                raise ForwardError(f"{method} {path} to {node} failed: {e}") from e
+            response_headers = [(name, value) for name, value in response.getheaders()
+                                if name.lower() not in HOP_BY_HOP_HEADERS]
+            if response.will_close:
+                connection.close()
+            else:
+                pool.release(connection)
+            return response.status, response_headers, payload
+
+
+def parse_nodes(value):
+    return [node.strip() for node in (value or '').split(',') if node.strip()]
+
+
+def create_router_from_env():
+    """Build the router from CLUSTER_NODES, CLUSTER_SELF and CLUSTER_TOKEN, or None for a single node"""
+    nodes = parse_nodes(os.environ.get('CLUSTER_NODES', ''))
+    if not nodes:
+        return None
+    self_node = os.environ.get('CLUSTER_SELF', '')
+    token = os.environ.get('CLUSTER_TOKEN', '')
+    if self_node not in nodes or not token:
+        logger.error("CLUSTER_NODES is set but CLUSTER_SELF is not one of them or CLUSTER_TOKEN is missing - "
+                     "session routing disabled")
+        return None
+    return SessionRouter(self_node, nodes, token, timeout=float(os.environ.get('CLUSTER_PROXY_TIMEOUT', '60')))
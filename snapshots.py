@@ -0,0 +1,139 @@
+"""
+Session snapshots that survive a redeploy.
+
+On graceful shutdown every live assistant's state is written to one
+binary file. The file holds a small index followed by one zlib-compressed
+pickle per session:
+
+    header   magic, created (f64), entry count (u32)
+    index    per entry: key length (u16), key, offset (u64), length (u64)
+    blobs    zlib(pickle(state)) for each key
+
+The file is written to a temporary name and renamed into place, so a
+crash mid-write leaves the previous snapshot intact. Several worker
+processes save into the same file at shutdown; each holds
+snapshot_lock() while it reads the current file, merges its own sessions
+in and replaces it, so no worker's sessions overwrite another's. On boot the new
+process memory-maps the file and parses only the index. Startup cost
+does not depend on how much history the snapshot holds. A session is
+decompressed and unpickled the first time a request needs it, and each
+session is restored at most once.
+
+Snapshots hold every user's conversation history, so the file is created
+with mode 0600. It is unpickled on load, so a snapshot that is not owned
+by this user or that others can write to is refused.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FSSNAP01'
+HEADER = struct.Struct('<8sdI')
+ENTRY = struct.Struct('<QQ')
+KEY_LENGTH = struct.Struct('<H')
+
+
+@contextmanager
+def snapshot_lock(path):
+    """Hold an exclusive lock on path's sidecar lock file, across processes"""
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_snapshot(path, states):
+    """Write {key: state} to path atomically; return the file size"""
+    blobs = [(key.encode('utf-8'), zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 6))
+             for key, state in states.items()]
+    offset = HEADER.size + sum(KEY_LENGTH.size + len(key) + ENTRY.size for key, _ in blobs)
+    index = []
+    for key, blob in blobs:
+        index.append(KEY_LENGTH.pack(len(key)) + key + ENTRY.pack(offset, len(blob)))
+        offset += len(blob)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    # A fresh file, never one (or a symlink) left at the temporary name, so the 0600 mode always applies
+    try:
+        os.unlink(temp_path)
+    except FileNotFoundError:
+        pass
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, time.time(), len(blobs)))
+        snapshot_file.writelines(index)
+        snapshot_file.writelines(blob for _, blob in blobs)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+    return offset
+
+
+def check_trusted(path, stat):
+    """Raise ValueError unless the snapshot is owned by this user and nobody else can write it"""
+    if stat.st_uid != os.geteuid():
+        raise ValueError(f"{path} is owned by uid {stat.st_uid}, not this user")
+    if stat.st_mode & 0o022:
+        raise ValueError(f"{path} is writable by other users (mode {stat.st_mode & 0o777:o})")
+
+
+class SessionSnapshot:
+    """Memory-mapped snapshot whose sessions are unpickled lazily, each one at most once"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            check_trusted(path, os.fstat(snapshot_file.fileno()))
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.created, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a session snapshot")
+        self.index = {}
+        position = HEADER.size
+        for _ in range(count):
+            (key_length,) = KEY_LENGTH.unpack_from(self._map, position)
+            position += KEY_LENGTH.size
+            key = self._map[position:position + key_length].decode('utf-8')
+            position += key_length
+            self.index[key] = ENTRY.unpack_from(self._map, position)
+            position += ENTRY.size
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def take(self, key):
+        """Return the state saved for key and forget it, or None when absent or already taken"""
+        with self._lock:
+            entry = self.index.pop(key, None)
+        if entry is None:
+            return None
+        offset, length = entry
+        return pickle.loads(zlib.decompress(self._map[offset:offset + length]))
+
+    def close(self):
+        self._map.close()
+
+
+def open_snapshot(path):
+    """Map the snapshot at path, or return None when there is none or it is unreadable"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = SessionSnapshot(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error("Ignoring unreadable session snapshot %s: %s", path, e)
+        return None
+    logger.info("Mapped session snapshot %s with %d sessions from %.0fs ago", path, len(snapshot.index),
+                time.time() - snapshot.created)
+    return snapshot
@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import main_app run against the local Gemini stub with no delays or background threads
+os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+os.environ.setdefault('GEMINI_BACKEND', 'stub')
+os.environ.setdefault('STUB_LATENCY', 'fixed:0')
+os.environ.setdefault('STUB_TOKENS_PER_SEC', '0')
+os.environ.setdefault('RATE_LIMIT_PER_SECOND', '0')
+os.environ.setdefault('UPSTREAM_PROBE_INTERVAL', '0')
@@ -0,0 +1,48 @@
+import pytest
+
+import main_app
+
+
+@pytest.fixture
+def client():
+    return main_app.app.test_client()
+
+
+def post_batch(client, service, payload):
+    response = client.post(f'/api/{service}/respond-batch', json=payload)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is True
+    return body['results']
+
+
+def test_codegent_unhashable_language_fails_only_that_item(client):
+    results = post_batch(client, 'codegent', {'messages': [
+        {'message': 'Reverse a list', 'language': ['py']},
+        {'message': 'Reverse a list', 'language': 'python'},
+    ]})
+
+    assert results[0] == {'success': False, 'error': 'language must be a string'}
+    assert results[1]['success'] is True
+
+
+@pytest.mark.parametrize('message', [None, 5, ['hi'], '', '   '])
+def test_codegent_rejects_non_string_or_empty_message(client, message):
+    results = post_batch(client, 'codegent', {'language': 'python', 'messages': [{'message': message}]})
+
+    assert results[0]['success'] is False
+
+
+def test_codegent_rejects_unsupported_language(client):
+    results = post_batch(client, 'codegent', {'messages': [{'message': 'Hello', 'language': 'cobol'}]})
+
+    assert results[0] == {'success': False, 'error': 'Unsupported language: cobol'}
+
+
+@pytest.mark.parametrize('service', ['student', 'parent', 'professional'])
+def test_chat_rejects_non_string_message_per_item(client, service):
+    results = post_batch(client, service, {'messages': [5, None, {'message': {'text': 'hi'}}, 'How do I relax?']})
+
+    assert [result['success'] for result in results] == [False, False, False, True]
+    assert results[0]['error'] == 'message must be a string'
+    assert results[1]['error'] == 'No message provided'
@@ -0,0 +1,59 @@
+import pytest
+
+import chat_sessions
+import main_app
+
+
+@pytest.fixture
+def client():
+    main_app.codegent_assistant.chat_sessions.clear()
+    main_app.response_cache.clear()
+    return main_app.app.test_client()
+
+
+def ui_message(message, sender):
+    """One entry of scripts/codegent.js conversationHistory"""
+    return {'message': message, 'sender': sender, 'timestamp': '2026-10-19T10:00:00.000Z'}
+
+
+def send_like_codegent_js(client, ui_history, message):
+    """Post the way codegent.js does: the message is added to the history first, which is sent as slice(-10)"""
+    ui_history.append(ui_message(message, 'user-message'))
+    response = client.post('/api/codegent/respond', json={
+        'message': message,
+        'language': 'python',
+        'conversation_history': ui_history[-10:],
+    })
+    body = response.get_json()
+    assert body['success'] is True
+    ui_history.append(ui_message(body['response'], 'ai-message'))
+    return body
+
+
+def test_codegent_js_history_reuses_one_chat_session(client, monkeypatch):
+    started = []
+    start = main_app.chat_session_factory.start
+    monkeypatch.setattr(main_app.chat_session_factory, 'start',
+                        lambda model, key: started.append(key) or start(model, key))
+    pool = main_app.codegent_assistant.chat_sessions
+    ui_history = [ui_message("Great! I'm now ready to help you with Python programming.", 'ai-message')]
+
+    for turn in range(8):
+        send_like_codegent_js(client, ui_history, f"Step {turn}: extend the linked list class")
+
+    # One chat for the whole conversation, kept going after the history window starts sliding
+    assert len(started) == 1
+    assert len(pool) == 1
+
+
+def test_normalize_history_accepts_both_client_shapes():
+    ui_history = [
+        ui_message('Welcome', 'ai-message'),
+        ui_message('Reverse a list', 'user-message'),
+        ui_message('Use reversed()', 'ai-message'),
+        ui_message('And a string?', 'user-message'),
+    ]
+    pairs = [{'user': 'Reverse a list', 'assistant': 'Use reversed()'}]
+
+    assert chat_sessions.normalize_history(ui_history, 'And a string?') == pairs
+    assert chat_sessions.normalize_history(pairs, 'And a string?') == pairs
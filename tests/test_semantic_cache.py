@@ -0,0 +1,41 @@
+import pytest
+
+import semantic_cache
+from benchmarks.corpus import CACHE_DISTINCT, CACHE_PARAPHRASES
+
+pytestmark = pytest.mark.skipif(semantic_cache.np is None, reason='NumPy not installed')
+
+
+def test_paraphrase_hits_at_default_threshold():
+    cache = semantic_cache.SemanticCache()
+    cache.store('parent', 'meal_planner', "healthy breakfast for kids", 'Try oats with fruit')
+
+    response, similarity = cache.lookup('parent', 'meal_planner', "what breakfast should I make for my kids")
+
+    assert response == 'Try oats with fruit'
+    assert similarity >= cache.threshold
+
+
+@pytest.mark.parametrize('stored, asked', CACHE_PARAPHRASES)
+def test_corpus_paraphrases_hit(stored, asked):
+    cache = semantic_cache.SemanticCache()
+    cache.store('codegent', 'chat', stored, 'answer')
+
+    assert cache.lookup('codegent', 'chat', asked)[0] == 'answer'
+
+
+@pytest.mark.parametrize('stored, asked', CACHE_DISTINCT)
+def test_corpus_distinct_questions_miss(stored, asked):
+    cache = semantic_cache.SemanticCache()
+    cache.store('codegent', 'chat', stored, 'answer')
+
+    assert cache.lookup('codegent', 'chat', asked)[0] is None
+
+
+def test_negation_and_number_changes_miss():
+    cache = semantic_cache.SemanticCache()
+    cache.store('parent', 'money_management', "how do I save 50000 for my kid's education", 'answer')
+    cache.store('parent', 'meal_planner', "vegetarian dinner for kids", 'answer')
+
+    assert cache.lookup('parent', 'money_management', "how do I save 150000 for my kid's education")[0] is None
+    assert cache.lookup('parent', 'meal_planner', "non vegetarian dinner for kids")[0] is None
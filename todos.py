@@ -0,0 +1,51 @@
+"""
+Structured ParentBot todo lists.
+
+TODO LIST EXPERT MODE asks Gemini for lines like
+
+    ☐ Pack school bags (Time: 7:15 AM IST)
+
+Todo responses are parsed once on the server into items stored in
+parent_context['todo_list']:
+
+    {'id': 3, 'text': 'Pack school bags', 'time': '7:15 AM', 'done': False}
+
+Clients then tick off, edit or reorder tasks through the /api/parent/todos
+endpoints without another model round trip.
+"""
+import re
+
+UNCHECKED = '☐'
+CHECKED_MARKS = '☑✅✓✔☒'
+
+TODO_LINE_PATTERN = re.compile(
+    r"^\s*(?:[-*•]\s*)?([☐☑✅✓✔☒])\s*(.+?)\s*"
+    r"(?:\(\s*Time:\s*(\d{1,2}:\d{2}\s*[AaPp]\.?[Mm]\.?)\s*(?:IST)?\s*\))?\s*$"
+)
+TIME_PATTERN = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*([AaPp])\.?[Mm]\.?\s*(?:IST)?\s*$")
+
+
+def normalize_time(value):
+    """Return a 12-hour IST time as 'H:MM AM/PM', or None when value is not a valid time"""
+    match = TIME_PATTERN.match(value or '')
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3).upper()
+    if not 1 <= hour <= 12 or minute > 59:
+        return None
+    return f"{hour}:{minute:02d} {meridiem}M"
+
+
+def parse_todo_list(text):
+    """Return [(text, time, done)] for every checklist line in a model response"""
+    items = []
+    for line in text.splitlines():
+        match = TODO_LINE_PATTERN.match(line)
+        if not match:
+            continue
+        mark, task, time = match.groups()
+        task = task.strip().rstrip('-–:').strip()
+        if task:
+            items.append((task, normalize_time(time) if time else None, mark in CHECKED_MARKS))
+    return items
+
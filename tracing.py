@@ -0,0 +1,306 @@
+"""
+Lightweight request tracing for the FreeSpace platform.
+
+Each sampled request gets a root span plus child spans around prompt
+building, the Gemini call and response serialization. Finished spans are
+handed to a background exporter thread that writes them to a local JSON
+lines file or posts them to an OTLP/HTTP collector, so request threads
+never wait on trace I/O. Unsampled requests only pay for a context
+variable lookup per span.
+
+Run `python tracing.py collector` for a local OTLP/HTTP collector stand-in
+that appends received spans to a file.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = 'X-Trace-Id'
+
+_current_span = contextvars.ContextVar('freespace_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'status', '_token')
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = 'ok'
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': (self.end_ns - self.start_ns) / 1e6,
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+
+class _NoopSpan:
+    """Returned for unsampled requests so instrumentation costs almost nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _ActiveSpan:
+    def __init__(self, tracer, name, attributes):
+        self._tracer = tracer
+        self._name = name
+        self._attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self._span = Span(self._name, parent.trace_id, parent.span_id, self._attributes)
+        self._span._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._span.status = 'error'
+            self._span.attributes['error'] = repr(exc)
+        _current_span.reset(self._span._token)
+        self._tracer.finish(self._span)
+        return False
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as trace_file:
+            for span in spans:
+                trace_file.write(json.dumps(span.to_dict()) + '\n')
+
+
+class OTLPExporter:
+    def __init__(self, endpoint, service_name='freespace'):
+        import requests
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.service_name = service_name
+        self.session = requests.Session()
+
+    def export(self, spans):
+        otlp_spans = []
+        for span in spans:
+            otlp_spans.append({
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': 1,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [
+                    {'key': key, 'value': {'stringValue': str(value)}}
+                    for key, value in span.attributes.items()
+                ],
+                'status': {'code': 2 if span.status == 'error' else 1}
+            })
+        payload = {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{'scope': {'name': 'freespace.tracing'}, 'spans': otlp_spans}]
+            }]
+        }
+        self.session.post(self.url, json=payload, timeout=5)
+
+
+class Tracer:
+    def __init__(self, sample_rate=0.0, exporter=None, batch_size=128, flush_interval=2.0, max_queue=10000):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped_spans = 0
+        self._worker = None
+        if exporter is not None and sample_rate > 0:
+            self._start_worker()
+            # Workers forked from a preloading server do not inherit the exporter thread
+            os.register_at_fork(after_in_child=self._start_worker)
+
+    def _start_worker(self):
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._worker = threading.Thread(target=self._export_loop, name='trace-exporter', daemon=True)
+        self._worker.start()
+
+    def start_trace(self, name, trace_id=None, attributes=None):
+        """Start the root span of a request; returns None when the request is not sampled"""
+        if self._worker is None or random.random() >= self.sample_rate:
+            return None
+        span = Span(name, trace_id or new_trace_id(), attributes=attributes)
+        span._token = _current_span.set(span)
+        return span
+
+    def end_trace(self, span):
+        """Finish a root span started with start_trace"""
+        if span is None:
+            return
+        try:
+            _current_span.reset(span._token)
+        except ValueError:
+            # Reset from a different context (e.g. teardown after an error)
+            _current_span.set(None)
+        self.finish(span)
+
+    def span(self, name, **attributes):
+        """Context manager for a child span of the current request"""
+        if _current_span.get() is None:
+            return NOOP_SPAN
+        return _ActiveSpan(self, name, attributes)
+
+    def traced(self, name):
+        """Decorator that wraps a function call in a span"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return func(*args, **kwargs)
+                with _ActiveSpan(self, name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def finish(self, span):
+        span.end_ns = time.time_ns()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped_spans += 1
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                logger.warning("Trace export failed, dropping %d spans: %s", len(batch), e)
+
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+
+def trace_id_from_headers(headers):
+    """Reuse an incoming W3C traceparent or X-Trace-Id so traces join up across services"""
+    traceparent = headers.get('traceparent', '')
+    parts = traceparent.split('-')
+    if len(parts) == 4 and len(parts[1]) == 32:
+        return parts[1]
+    incoming = headers.get(TRACE_HEADER, '')
+    if len(incoming) == 32:
+        return incoming
+    return None
+
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def create_tracer_from_env():
+    """Build the tracer from TRACE_SAMPLE_RATE, TRACE_EXPORTER, TRACE_FILE and OTLP_ENDPOINT"""
+    sample_rate = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+    exporter_name = os.environ.get('TRACE_EXPORTER', 'file')
+
+    exporter = None
+    if sample_rate > 0:
+        if exporter_name == 'otlp':
+            exporter = OTLPExporter(os.environ.get('OTLP_ENDPOINT', 'http://localhost:4318'))
+        elif exporter_name == 'file':
+            exporter = FileExporter(os.environ.get('TRACE_FILE', 'traces.jsonl'))
+        else:
+            logger.error("Unknown TRACE_EXPORTER %r (expected 'file' or 'otlp') - tracing disabled", exporter_name)
+            return Tracer()
+        logger.info("Tracing enabled: exporter=%s, sample_rate=%s", exporter_name, sample_rate)
+    return Tracer(sample_rate=sample_rate, exporter=exporter)
+
+
+def run_collector(port, output):
+    """Minimal OTLP/HTTP JSON collector that appends every received span to a file"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    write_lock = threading.Lock()
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/v1/traces':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            payload = json.loads(body or b'{}')
+            with write_lock, open(output, 'a', encoding='utf-8') as out:
+                for resource_spans in payload.get('resourceSpans', []):
+                    for scope_spans in resource_spans.get('scopeSpans', []):
+                        for span in scope_spans.get('spans', []):
+                            out.write(json.dumps(span) + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), CollectorHandler)
+    print(f"OTLP collector stand-in listening on :{port}, writing spans to {output}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='FreeSpace tracing utilities')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    collector_parser = subparsers.add_parser('collector', help='run a local OTLP/HTTP collector stand-in')
+    collector_parser.add_argument('--port', type=int, default=4318)
+    collector_parser.add_argument('--output', default='collected-traces.jsonl')
+    args = parser.parse_args()
+
+    if args.command == 'collector':
+        run_collector(args.port, args.output)
@@ -0,0 +1,113 @@
+"""
+Background Gemini reachability probe.
+
+/api/test-gemini used to send a real prompt on every hit, so a monitor
+polling it burned quota and added upstream load. UpstreamProber sends one
+tiny probe every `interval` seconds from a background thread and keeps
+the last result. The endpoints read that cached result and never wait on
+Gemini.
+
+The upstream counts as ready while the last `failure_threshold` probes
+did not all fail, the last successful probe was faster than
+`brownout_latency`, and the result is not older than three intervals.
+/api/health/ready turns this into a 503 during upstream brownouts, so
+orchestrators can route traffic away, while /api/health/live only says
+the process is up.
+
+Environment:
+    UPSTREAM_PROBE_INTERVAL      seconds between probes (default 30, 0 disables probing)
+    UPSTREAM_PROBE_TIMEOUT       seconds before a probe counts as failed (default 10)
+    UPSTREAM_BROWNOUT_LATENCY    probe latency in seconds treated as a brownout (default 5)
+    UPSTREAM_FAILURE_THRESHOLD   consecutive failed probes before the upstream is down (default 2)
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+PROBE_PROMPT = "Reply with the single word: ok"
+
+
+class UpstreamProber:
+    def __init__(self, probe, interval=30.0, timeout=10.0, brownout_latency=5.0, failure_threshold=2,
+                 on_result=None):
+        self.probe = probe
+        self.interval = interval
+        self.timeout = timeout
+        self.brownout_latency = brownout_latency
+        self.failure_threshold = failure_threshold
+        self.on_result = on_result
+        # Replaced as a whole after every probe, so readers never see a half-updated result
+        self.result = {'reachable': None, 'latency_ms': None, 'checked_at': None, 'error': None,
+                       'consecutive_failures': 0, 'sample': None}
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def ensure_started(self):
+        """Start the probe thread in this process; a pre-fork master's thread does not survive into workers"""
+        if self._pid == os.getpid() or not self.enabled:
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upstream-probe-call')
+                threading.Thread(target=self._run, name='upstream-probe', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+    def check(self):
+        """Probe the upstream once and store the result"""
+        start = time.perf_counter()
+        future = self._executor.submit(self.probe)
+        try:
+            sample = future.result(timeout=self.timeout)
+            error = None
+        except FutureTimeoutError:
+            sample, error = None, f"no response within {self.timeout}s"
+        except Exception as e:
+            sample, error = None, str(e)
+        latency = time.perf_counter() - start
+        previous = self.result
+        self.result = {
+            'reachable': error is None,
+            'latency_ms': round(latency * 1000, 1),
+            'checked_at': time.time(),
+            'error': error,
+            'consecutive_failures': 0 if error is None else previous['consecutive_failures'] + 1,
+            'sample': sample if error is None else previous['sample']
+        }
+        if error is not None:
+            logger.warning("Gemini probe failed after %.2fs: %s", latency, error)
+        if self.on_result is not None:
+            self.on_result(self.result, latency)
+        return self.result
+
+    def ready(self):
+        """True while the upstream is answering, fast enough and recently checked"""
+        result = self.result
+        if result['checked_at'] is None or time.time() - result['checked_at'] > 3 * max(self.interval, 1):
+            return False
+        if result['consecutive_failures'] >= self.failure_threshold:
+            return False
+        return result['reachable'] is False or result['latency_ms'] < self.brownout_latency * 1000
+
+
+def create_prober_from_env(probe, on_result=None):
+    """Build the prober from the UPSTREAM_* environment variables"""
+    return UpstreamProber(probe,
+                          interval=float(os.environ.get('UPSTREAM_PROBE_INTERVAL', '30')),
+                          timeout=float(os.environ.get('UPSTREAM_PROBE_TIMEOUT', '10')),
+                          brownout_latency=float(os.environ.get('UPSTREAM_BROWNOUT_LATENCY', '5')),
+                          failure_threshold=int(os.environ.get('UPSTREAM_FAILURE_THRESHOLD', '2')),
+                          on_result=on_result)